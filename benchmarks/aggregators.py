@@ -0,0 +1,448 @@
+"""Measure how long the aggregators take to fuse the docstrings into
+synthetic files from 100 to 50,000 lines, and fit how their time scales with
+the size of the file. The command fails when an aggregator scales worse than
+linearly.
+
+With --scripts, the fuse-only scripts/document_*.py entry points are timed
+instead, reading and writing the files. With --generate, the sources and
+their tale JSON files are only written to a folder, to run those scripts by
+hand.
+
+Usage: python benchmarks/aggregators.py [-l 1000 -l 5000 -l 50000] [-a python -a javascript -a typescript
+                                        -a tsx -a php -a go] [--scripts] [--generate FOLDER]
+"""
+import importlib.util
+import json
+import math
+import os
+import tempfile
+import time
+
+import click
+
+from devtale.aggregators import (
+    GoAggregator,
+    JavascriptAggregator,
+    PHPAggregator,
+    PythonAggregator,
+)
+
+PYTHON_CLASS = """
+class Model{index}(Base):
+    def __init__(self, name, size=0):
+        self.name = name
+        self.size = size
+
+    def load(self, path):
+        with open(path) as file:
+            return file.read()
+
+    def save(self, path):  # not atomic
+        with open(path, "w") as file:
+            file.write(self.name)
+
+
+def helper_{index}(value):
+    return value * 2
+"""
+
+
+def python_case(lines):
+    """Return a Python module of about the given number of lines, with its
+    documentation.
+    """
+    chunk_lines = PYTHON_CLASS.count("\n")
+    count = max(lines // chunk_lines, 1)
+    code = "import os\n" + "".join(
+        PYTHON_CLASS.format(index=index) for index in range(count)
+    )
+    documentation = {
+        "file_docstring": "Synthetic module.",
+        "classes": [
+            {"class_name": f"Model{index}", "class_docstring": "A model."}
+            for index in range(count)
+        ],
+        "methods": [
+            {"method_name": name, "method_docstring": f"Method {name}."}
+            for name in ["__init__", "load", "save"]
+        ]
+        + [
+            {"method_name": f"helper_{index}", "method_docstring": "Doubles it."}
+            for index in range(count)
+        ],
+    }
+    return code, documentation
+
+
+TSX_COMPONENT = """
+export class Store{index} extends Base {{
+  constructor(options) {{
+    super(options);
+  }}
+  load(id) {{
+    return fetch(id);
+  }}
+}}
+
+// Already documented.
+function format{index}(value) {{
+  return String(value);
+}}
+
+export const Card{index} = (props) => {{
+  return <div className="card">{{props.children}}</div>;
+}};
+"""
+
+JAVASCRIPT_MODULE = """
+class Queue{index} {{
+  constructor(size) {{
+    this.items = [];
+    this.size = size;
+  }}
+  push(item) {{
+    if (this.items.length < this.size) {{
+      this.items.push(item);
+    }}
+  }}
+}}
+
+// Already documented.
+async function drain{index}(queue) {{
+  while (queue.items.length) {{
+    await queue.items.shift()();
+  }}
+}}
+
+const retry{index} = (fn) => fn().catch(() => fn());
+"""
+
+TYPESCRIPT_MODULE = """
+export interface Options{index} {{
+  retries: number;
+}}
+
+export class Client{index} implements Base {{
+  private cache: Map<string, string> = new Map();
+  constructor(private readonly options: Options{index}) {{}}
+  public async get(key: string): Promise<string | undefined> {{
+    return this.cache.get(key);
+  }}
+}}
+
+// Already documented.
+export function parse{index}<T>(value: string): T {{
+  return JSON.parse(value) as T;
+}}
+"""
+
+
+def _javascript_like_case(template, header, lines, classes, functions, methods):
+    chunk_lines = template.count("\n")
+    count = max(lines // chunk_lines, 1)
+    code = header + "".join(template.format(index=index) for index in range(count))
+    documentation = {
+        "file_docstring": "Synthetic module.",
+        "classes": [
+            {"class_name": f"{prefix}{index}", "class_docstring": "A class."}
+            for index in range(count)
+            for prefix in classes
+        ],
+        "methods": [
+            {"method_name": name, "method_docstring": f"Method {name}."}
+            for name in methods
+        ]
+        + [
+            {"method_name": f"{prefix}{index}", "method_docstring": "A function."}
+            for index in range(count)
+            for prefix in functions
+        ],
+    }
+    return code, documentation
+
+
+def javascript_case(lines):
+    """Return a JavaScript file of about the given number of lines, with its
+    documentation.
+    """
+    return _javascript_like_case(
+        JAVASCRIPT_MODULE,
+        'import fs from "fs";\n',
+        lines,
+        ["Queue"],
+        ["drain", "retry"],
+        ["constructor", "push"],
+    )
+
+
+def typescript_case(lines):
+    """Return a TypeScript file of about the given number of lines, with its
+    documentation.
+    """
+    return _javascript_like_case(
+        TYPESCRIPT_MODULE,
+        'import { Base } from "./base";\n',
+        lines,
+        ["Options", "Client"],
+        ["parse"],
+        ["constructor", "get"],
+    )
+
+
+def tsx_case(lines):
+    """Return a TSX file of about the given number of lines, with its
+    documentation.
+    """
+    return _javascript_like_case(
+        TSX_COMPONENT,
+        'import React from "react";\n',
+        lines,
+        ["Store"],
+        ["format", "Card"],
+        ["constructor", "load"],
+    )
+
+
+PHP_CLASS = """
+class Repository{index} extends Base
+{{
+    public function __construct($db)
+    {{
+        $this->db = $db;
+    }}
+
+    public static function find{index}($id)
+    {{
+        return self::$items[$id];
+    }}
+}}
+
+function helper{index}($value)
+{{
+    return $value * 2;
+}}
+"""
+
+
+def php_case(lines):
+    """Return a PHP file of about the given number of lines, with its
+    documentation.
+    """
+    chunk_lines = PHP_CLASS.count("\n")
+    count = max(lines // chunk_lines, 1)
+    code = "<?php\n" + "".join(PHP_CLASS.format(index=index) for index in range(count))
+    documentation = {
+        "file_docstring": "Synthetic repositories.",
+        "classes": [
+            {"class_name": f"Repository{index}", "class_docstring": "A repository."}
+            for index in range(count)
+        ],
+        "methods": [{"method_name": "__construct", "method_docstring": "Builds it."}]
+        + [
+            {"method_name": f"{prefix}{index}", "method_docstring": "A function."}
+            for index in range(count)
+            for prefix in ["find", "helper"]
+        ],
+    }
+    return code, documentation
+
+
+GO_TYPE = """
+type Server{index} struct {{
+\taddr string
+}}
+
+func (s *Server{index}) Start{index}(ctx context.Context) error {{
+\treturn nil
+}}
+
+// Already documented.
+func handle{index}(w http.ResponseWriter) {{
+\tw.WriteHeader(200)
+}}
+"""
+
+
+def go_case(lines):
+    """Return a Go file of about the given number of lines, with its
+    documentation.
+    """
+    chunk_lines = GO_TYPE.count("\n")
+    count = max(lines // chunk_lines, 1)
+    code = "package main\n" + "".join(
+        GO_TYPE.format(index=index) for index in range(count)
+    )
+    documentation = {
+        "file_docstring": "Synthetic servers.",
+        "classes": [
+            {"class_name": f"Server{index}", "class_docstring": "A server."}
+            for index in range(count)
+        ],
+        "methods": [
+            {"method_name": f"{prefix}{index}", "method_docstring": "A function."}
+            for index in range(count)
+            for prefix in ["Start", "handle"]
+        ],
+    }
+    return code, documentation
+
+
+# name -> (aggregator, case builder, file extension, fuse script)
+CASES = {
+    "python": (PythonAggregator, python_case, ".py", "document_python.py"),
+    "javascript": (
+        JavascriptAggregator,
+        javascript_case,
+        ".js",
+        "document_javascript.py",
+    ),
+    "typescript": (
+        JavascriptAggregator,
+        typescript_case,
+        ".ts",
+        "document_javascript.py",
+    ),
+    "tsx": (JavascriptAggregator, tsx_case, ".tsx", "document_javascript.py"),
+    "php": (PHPAggregator, php_case, ".php", "document_php.py"),
+    "go": (GoAggregator, go_case, ".go", "document_go.py"),
+}
+
+SCRIPTS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "scripts")
+
+
+def time_document(aggregator_class, code, documentation, min_seconds=0.2):
+    """Return the best time of document() over enough runs to last about
+    min_seconds, at least one.
+    """
+    best = None
+    total = 0
+    while total < min_seconds or best is None:
+        start = time.perf_counter()
+        aggregator_class().document(code=code, documentation=documentation)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+    return best
+
+
+def time_script(script_name, code, documentation, extension, workdir):
+    """Return the time of a fuse-only run of the scripts/document_*.py entry
+    point, reading the source and tale files and writing the documented one.
+    """
+    source_path = os.path.join(workdir, f"source{extension}")
+    documentation_path = source_path + ".json"
+    output_path = os.path.join(workdir, "output")
+    os.makedirs(output_path, exist_ok=True)
+    with open(source_path, "w") as file:
+        file.write(code)
+    with open(documentation_path, "w") as file:
+        json.dump(documentation, file)
+
+    spec = importlib.util.spec_from_file_location(
+        script_name[:-3], os.path.join(SCRIPTS_PATH, script_name)
+    )
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    start = time.perf_counter()
+    script.main(
+        ["-s", source_path, "-d", documentation_path, "-o", output_path],
+        standalone_mode=False,
+    )
+    return time.perf_counter() - start
+
+
+def fit_exponent(points):
+    """Return k of the best fit of time = c * lines^k, in log-log space."""
+    xs = [math.log(lines) for lines, _ in points]
+    ys = [math.log(max(seconds, 1e-9)) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return float("nan")
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+@click.command()
+@click.option(
+    "-l",
+    "--lines",
+    "line_counts",
+    multiple=True,
+    type=int,
+    default=[100, 500, 1000, 5000, 10000, 50000],
+    help="File sizes, in lines, to time.",
+)
+@click.option(
+    "-a",
+    "--aggregator",
+    "aggregators",
+    multiple=True,
+    type=click.Choice(list(CASES)),
+    default=list(CASES),
+    help="Aggregators to time.",
+)
+@click.option(
+    "--max-exponent",
+    "max_exponent",
+    type=float,
+    default=1.25,
+    help="Fail when the fitted scaling exponent of an aggregator is higher.",
+)
+@click.option(
+    "--scripts",
+    "via_scripts",
+    is_flag=True,
+    default=False,
+    help="Time the scripts/document_*.py entry points, files included.",
+)
+@click.option(
+    "--generate",
+    "generate_path",
+    default=None,
+    help="Only write the sources and their tale JSON files in this folder.",
+)
+def main(line_counts, aggregators, max_exponent, via_scripts, generate_path):
+    if generate_path:
+        os.makedirs(generate_path, exist_ok=True)
+        for name in aggregators:
+            _, build_case, extension, _ = CASES[name]
+            for lines in line_counts:
+                code, documentation = build_case(lines)
+                path = os.path.join(generate_path, f"{name}_{lines}{extension}")
+                with open(path, "w") as file:
+                    file.write(code)
+                with open(path + ".json", "w") as file:
+                    json.dump(documentation, file)
+        return
+
+    superlinear = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in aggregators:
+            aggregator_class, build_case, extension, script_name = CASES[name]
+            points = []
+            for lines in line_counts:
+                code, documentation = build_case(lines)
+                if via_scripts:
+                    elapsed = time_script(
+                        script_name, code, documentation, extension, workdir
+                    )
+                else:
+                    elapsed = time_document(aggregator_class, code, documentation)
+                line_count = code.count("\n")
+                points.append((line_count, elapsed))
+                print(f"{name:<12}{line_count:>8} lines {elapsed * 1000:>10.1f} ms")
+
+            exponent = fit_exponent(points)
+            flag = ""
+            if exponent > max_exponent:
+                superlinear.append(name)
+                flag = f"  WORSE THAN LINEAR (> {max_exponent})"
+            print(f"{name:<12} scaling exponent {exponent:.2f}{flag}")
+
+    if superlinear:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Measure the per-call overhead of preparing the LLM chain, before and after
+the shared clients and prompts. No request is sent to OpenAI.
+
+Usage: python benchmarks/llm_registry.py [-n 200]
+"""
+import os
+import timeit
+
+import click
+from langchain import LLMChain, PromptTemplate
+from langchain.chat_models import ChatOpenAI
+from langchain.output_parsers import PydanticOutputParser
+
+from devtale.backends import get_backend
+from devtale.schema import FileDocumentation
+from devtale.templates import CODE_LEVEL_TEMPLATE
+from devtale.utils import _get_prompt
+
+MODEL_NAME = "gpt-4-1106-preview"
+
+
+def build_chain_per_call():
+    """What get_unit_tale used to do on every call."""
+    parser = PydanticOutputParser(pydantic_object=FileDocumentation)
+    prompt = PromptTemplate(
+        template=CODE_LEVEL_TEMPLATE,
+        input_variables=["code", "code_elements"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+    return LLMChain(llm=ChatOpenAI(model_name=MODEL_NAME), prompt=prompt)
+
+
+def get_shared_client():
+    return _get_prompt("code-level"), get_backend()._get_llm(MODEL_NAME)
+
+
+@click.command()
+@click.option("-n", "number", default=200, help="Number of calls to time.")
+def main(number: int):
+    # ChatOpenAI validates that a key is configured, but nothing is sent.
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    before = timeit.timeit(build_chain_per_call, number=number) / number
+    after = timeit.timeit(get_shared_client, number=number) / number
+
+    print(f"per-call setup, rebuilt chain: {before * 1e6:10.1f} us")
+    print(f"per-call setup, shared client: {after * 1e6:10.1f} us")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
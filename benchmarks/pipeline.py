@@ -0,0 +1,361 @@
+"""Run the whole documentation pipeline over a synthetic repository, against
+the fake LLM backend, and report the wall time, LLM calls, tokens and peak
+memory of each stage (walk, dedup, split, extract, tale, parse, summarize,
+fuse, write) for process_repository, process_folder and process_file.
+
+The report is compared with a stored baseline. The command fails when a
+stage made more LLM calls or sent more tokens, which are deterministic for
+the same config. Timings are the median of --repeats runs, and the stages
+that got much slower or bigger are only reported, as they depend on the
+machine and its load. Refresh the baseline on the reference machine with
+--update-baseline.
+
+Usage: python -m benchmarks.pipeline [--files 120 --depth 3 --languages python=4,tsx=3,php=2,go=1
+                                      --lines 120:0.8 --latency constant:0.01 -j 4 --repeats 3]
+                                     [--output report.json] [--baseline benchmarks/baselines/pipeline.json]
+                                     [--update-baseline]
+"""
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+from benchmarks.aggregators import CASES
+from devtale.backends import FakeBackend, configure_backend
+from devtale.cache import configure_cache
+from devtale.cli import process_file, process_folder, process_repository
+from devtale.constants import RATE_LIMITS
+from devtale.profiling import disable_profiling, enable_profiling
+from devtale.ratelimit import configure_rate_limits
+from devtale.utils import _get_encoding
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "pipeline.json")
+
+EXTENSIONS = {name: case[2] for name, case in CASES.items()}
+EXTENSIONS["yaml"] = ".yaml"
+
+# Changes under these noise floors are never reported as regressions.
+MIN_SECONDS = 0.05
+MIN_MEMORY = 1024 * 1024
+
+# The metrics that fail the command when they grow.
+GATED_METRICS = ("calls", "tokens")
+
+
+def generate_repository(root, files, depth, languages, lines, seed=0):
+    """Write a synthetic repository and return the paths of its files.
+
+    languages maps a language of EXTENSIONS to its weight in the mix, and
+    the number of lines of each file is drawn from the lines distribution,
+    given as (median, sigma) of a lognormal.
+    """
+    generator = random.Random(seed)
+    folders = [root]
+    for level in range(depth):
+        for index in range(generator.randint(1, 3)):
+            parent = generator.choice(folders)
+            folders.append(os.path.join(parent, f"pkg{level}_{index}"))
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    names = list(languages)
+    weights = [languages[name] for name in names]
+    median, sigma = lines
+    paths = []
+    for number in range(files):
+        language = generator.choices(names, weights)[0]
+        line_count = max(int(median * generator.lognormvariate(0, sigma)), 5)
+        if language == "yaml":
+            code = "".join(f"key_{index}: value\n" for index in range(line_count))
+            comment = "#"
+        else:
+            code, _ = CASES[language][1](line_count)
+            comment = "#" if language == "python" else "//"
+        # Keep every file unique.
+        code += f"\n{comment} synthetic file {number}\n"
+
+        folder = generator.choice(folders)
+        path = os.path.join(folder, f"file_{number}{EXTENSIONS[language]}")
+        with open(path, "w") as file:
+            file.write(code)
+        paths.append(path)
+    return paths
+
+
+def run_scenario(name, func, latency, memory):
+    """Run the scenario with a fresh fake backend and return its stats."""
+    configure_backend(FakeBackend(latency=latency))
+    # The quotas would throttle the fake calls, and hide devtale's own costs.
+    configure_rate_limits({model_name: (None, None) for model_name in RATE_LIMITS})
+    profiler = enable_profiling(memory=memory)
+    start = time.perf_counter()
+    try:
+        func()
+        seconds = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if memory else 0
+        stages = profiler.report()
+    finally:
+        disable_profiling()
+    for stats in stages.values():
+        peak_memory = max(peak_memory, stats["peak_memory"])
+    logging.getLogger(__name__).info(f"{name}: {seconds:.2f}s")
+    return {"seconds": seconds, "peak_memory": peak_memory, "stages": stages}
+
+
+def run_benchmark(config):
+    """Generate the repository of the config and run the three scenarios,
+    timing them in repeated passes and measuring their memory in a last one,
+    as tracemalloc slows the pipeline down. The timings of the report are the
+    medians of the passes.
+    """
+    report = {"config": config, "scenarios": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        root = os.path.join(workdir, "repository")
+        paths = generate_repository(
+            root,
+            config["files"],
+            config["depth"],
+            config["languages"],
+            config["lines"],
+            config["seed"],
+        )
+        folder_sizes = {}
+        for path in paths:
+            folder = os.path.dirname(path)
+            folder_sizes[folder] = folder_sizes.get(folder, 0) + 1
+        biggest_folder = max(folder_sizes, key=folder_sizes.get)
+        biggest_file = max(paths, key=os.path.getsize)
+
+        scenarios = {
+            "repository": lambda output: process_repository(
+                root, output, fuse=True, jobs=config["jobs"]
+            ),
+            "folder": lambda output: process_folder(
+                biggest_folder, output, fuse=True, jobs=config["jobs"]
+            ),
+            "file": lambda output: process_file(biggest_file, output, fuse=True),
+        }
+        passes = [False] * config["repeats"] + ([True] if config["memory"] else [])
+        for name, scenario in scenarios.items():
+            results = []
+            for index, memory in enumerate(passes):
+                output = os.path.join(workdir, f"{name}_{index}")
+                results.append(
+                    run_scenario(
+                        name, lambda: scenario(output), config["latency"], memory
+                    )
+                )
+            timings = results[: config["repeats"]]
+            result = timings[0]
+            result["seconds"] = statistics.median(
+                timing["seconds"] for timing in timings
+            )
+            for stage, stats in result["stages"].items():
+                stats["seconds"] = statistics.median(
+                    timing["stages"].get(stage, {}).get("seconds", 0)
+                    for timing in timings
+                )
+            if config["memory"]:
+                result["peak_memory"] = results[-1]["peak_memory"]
+                for stage, stats in result["stages"].items():
+                    memory_stats = results[-1]["stages"].get(stage, {})
+                    stats["peak_memory"] = memory_stats.get("peak_memory", 0)
+            report["scenarios"][name] = result
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Return the rows (scenario, stage, metric, baseline, current,
+    regression) of the metrics of the report that changed significantly:
+    timings and memory by more than the tolerance and the noise floors,
+    calls and tokens at all, as they are deterministic for the same config.
+    """
+    same_config = _comparable(report["config"]) == _comparable(baseline["config"])
+    metrics = ["seconds", "calls", "tokens"]
+    if report["config"]["memory"] and baseline["config"]["memory"]:
+        metrics.append("peak_memory")
+
+    rows = []
+    for name, result in report["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        items = [("total", result, base)] + [
+            (stage, stats, base["stages"].get(stage, {}))
+            for stage, stats in result["stages"].items()
+        ]
+        for stage, stats, base_stats in items:
+            for metric in metrics:
+                if metric not in stats:
+                    continue
+                old, new = base_stats.get(metric, 0), stats[metric]
+                if metric in ("seconds", "peak_memory"):
+                    floor = MIN_SECONDS if metric == "seconds" else MIN_MEMORY
+                    if abs(new - old) <= max(old * tolerance, floor):
+                        continue
+                elif not same_config or new == old:
+                    continue
+                rows.append((name, stage, metric, old, new, new > old))
+    return rows
+
+
+def _comparable(config):
+    return {
+        key: value for key, value in config.items() if key not in ("memory", "repeats")
+    }
+
+
+def print_comparison(rows):
+    print(f"{'scenario':<12}{'stage':<11}{'metric':<13}{'baseline':>14}{'current':>14}")
+    for name, stage, metric, old, new, regression in rows:
+        flag = ""
+        if regression:
+            flag = "  REGRESSION" if metric in GATED_METRICS else "  slower"
+        print(
+            f"{name:<12}{stage:<11}{metric:<13}{_format(old, metric):>14}"
+            f"{_format(new, metric):>14}{flag}"
+        )
+
+
+def _format(value, metric):
+    if metric == "seconds":
+        return f"{value:.3f}"
+    if metric == "peak_memory":
+        return f"{value / 1024 / 1024:.1f} MB"
+    return str(value)
+
+
+def _parse_weights(ctx, param, value):
+    languages = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in EXTENSIONS:
+            raise click.BadParameter(f"unknown language {name}")
+        languages[name] = float(weight or 1)
+    return languages
+
+
+@click.command()
+@click.option("--files", "files", default=120, help="Number of files.")
+@click.option("--depth", "depth", default=3, help="Folder nesting levels.")
+@click.option(
+    "--languages",
+    "languages",
+    default="python=4,tsx=3,php=2,go=1",
+    callback=_parse_weights,
+    help="Weight of each language in the mix: python, javascript, typescript, tsx, \
+        php, go, yaml.",
+)
+@click.option(
+    "--lines",
+    "lines",
+    default="120:0.8",
+    help="Lognormal distribution of the lines of a file, as MEDIAN:SIGMA.",
+)
+@click.option(
+    "--latency",
+    "latency",
+    default="constant:0.01",
+    help="Latency distribution of the fake LLM, see devtale.backends.",
+)
+@click.option("-j", "--jobs", "jobs", default=4, help="Concurrent files.")
+@click.option("--seed", "seed", default=0, help="Seed of the repository.")
+@click.option("--no-memory", "no_memory", is_flag=True, help="Skip the memory pass.")
+@click.option("--output", "output", default=None, help="Where to write the report.")
+@click.option("--baseline", "baseline_path", default=DEFAULT_BASELINE)
+@click.option(
+    "--repeats",
+    "repeats",
+    type=click.IntRange(min=1),
+    default=3,
+    help="Timing passes, whose median is kept.",
+)
+@click.option(
+    "--tolerance",
+    "tolerance",
+    default=1.0,
+    help="Slowdown and memory growth that are not reported.",
+)
+@click.option(
+    "--update-baseline", "update_baseline", is_flag=True, help="Store the report."
+)
+def main(
+    files,
+    depth,
+    languages,
+    lines,
+    latency,
+    jobs,
+    seed,
+    no_memory,
+    output,
+    baseline_path,
+    repeats,
+    tolerance,
+    update_baseline,
+):
+    logging.getLogger().setLevel(logging.WARNING)
+    configure_cache(None)
+    median, sigma = lines.split(":")
+    config = {
+        "files": files,
+        "depth": depth,
+        "languages": languages,
+        "lines": [float(median), float(sigma)],
+        "latency": latency,
+        "jobs": jobs,
+        "seed": seed,
+        "memory": not no_memory,
+        "repeats": repeats,
+        "tokenizer": "approximate" if _get_encoding() is None else "cl100k_base",
+    }
+    report = run_benchmark(config)
+
+    for name, result in report["scenarios"].items():
+        print(
+            f"{name:<12}{result['seconds']:>8.2f}s "
+            f"{result['peak_memory'] / 1024 / 1024:>8.1f} MB"
+        )
+        for stage, stats in result["stages"].items():
+            print(
+                f"  {stage:<10}{stats['seconds']:>8.3f}s {stats['count']:>6} spans "
+                f"{stats['calls']:>5} calls {stats['tokens']:>8} tokens "
+                f"{stats['peak_memory'] / 1024 / 1024:>8.1f} MB"
+            )
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved in {baseline_path}")
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline in {baseline_path}, run with --update-baseline.")
+        return
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    if _comparable(baseline["config"]) != _comparable(config):
+        print("The baseline was made with another config, only timings compare.")
+    rows = compare(report, baseline, tolerance)
+    print()
+    if rows:
+        print_comparison(rows)
+    else:
+        print("No significant change from the baseline.")
+    if any(row[-1] and row[2] in GATED_METRICS for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
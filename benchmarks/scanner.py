@@ -0,0 +1,82 @@
+"""Measure the throughput of the local declaration scanner on large files,
+such as vendored JavaScript bundles.
+
+Usage: python benchmarks/scanner.py [-s 1] [-n 5] [PATHS...]
+
+Without paths, a synthetic bundle of the given size in MB is scanned.
+"""
+import os
+import timeit
+
+import click
+
+from devtale.scanner import SCANNER_LANGUAGES, scan_declarations
+
+MODULE = """
+/* module {index} */
+const API_{index} = "https://example.com/{{id}}/items";
+export class Store{index} extends Base {{
+  constructor(options) {{
+    super(options);
+    this.items = [];
+  }}
+  async load(id) {{
+    const response = await fetch(`${{API_{index}}}?id=${{id}}`);
+    for (const item of await response.json()) {{
+      if (item.active) {{ this.items.push(item); }}
+    }}
+  }}
+}}
+export function render{index}(props) {{
+  return props.items.map((item) => ({{ key: item.id, label: item.name }}));
+}}
+export const Button{index} = ({{ label, onClick }}) => {{
+  return h("button", {{ onClick }}, label);
+}};
+const add{index} = (a, b) => a + b; // '{{' inside a comment
+"""
+
+
+def build_bundle(size_mb):
+    modules = []
+    size = 0
+    index = 0
+    while size < size_mb * 1024 * 1024:
+        module = MODULE.format(index=index)
+        modules.append(module)
+        size += len(module)
+        index += 1
+    return "".join(modules)
+
+
+@click.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("-s", "size_mb", default=1.0, help="Size in MB of the synthetic bundle.")
+@click.option("-n", "number", default=5, help="Number of scans to time.")
+def main(paths, size_mb: float, number: int):
+    if paths:
+        files = []
+        for path in paths:
+            file_ext = os.path.splitext(path)[-1]
+            if file_ext not in SCANNER_LANGUAGES:
+                raise click.BadParameter(f"unsupported file: {path}")
+            with open(path, "r") as file:
+                files.append((path, file.read(), file_ext))
+    else:
+        files = [("synthetic bundle", build_bundle(size_mb), ".js")]
+
+    for name, code, file_ext in files:
+        elapsed = timeit.timeit(
+            lambda: scan_declarations(code, file_ext), number=number
+        )
+        elapsed /= number
+        declarations = scan_declarations(code, file_ext)
+        megabytes = len(code) / (1024 * 1024)
+        print(
+            f"{name}: {megabytes:.2f} MB, {len(declarations)} declarations, "
+            f"{elapsed * 1000:.1f} ms, {megabytes / elapsed:.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
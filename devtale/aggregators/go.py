@@ -1,5 +1,7 @@
 import re
 
+from .lines import LineIndex
+
 
 class GoAggregator:
     def __init__(self):
@@ -30,6 +32,9 @@ class GoAggregator:
                 for item in documentation["classes"]
             }
 
+        # Gather every signature, documented or not, in a single scan and
+        # join them with the code in between at the end.
+        line_index = LineIndex(code)
         updated_code_lines = []
         matches = re.finditer(pattern, code)
         last_end = 0
@@ -42,7 +47,7 @@ class GoAggregator:
 
             if opening_brace_index != -1:
                 signature = code[index : opening_brace_index + 1]
-                lines_before = code[:index].split("\n")[-3:]
+                lines_before = line_index.lines_before(index, 3)
                 existing_docstring = any(
                     line.strip().startswith("//") or "*/" in line
                     for line in lines_before
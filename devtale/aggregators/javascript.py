@@ -1,5 +1,59 @@
 import re
 
+# Names that can be looked up in the declaration index. Any other name is
+# searched line by line with its own pattern.
+SIMPLE_NAME = re.compile(r"[\w$]+")
+
+# The patterns of each kind of declaration, used to index all the names a
+# line declares at once. They mirror ENTITY_PATTERNS, and are lookaheads so
+# that overlapping declarations are all found.
+INDEX_PATTERNS = {
+    "methods": [
+        re.compile(r"^(?=\s*([\w$]+)\s*\([^)]*\)\s*{)", re.MULTILINE),
+        re.compile(r"(?=function\s+([\w$]+)\s*\()"),
+    ],
+    "tsx": [
+        re.compile(r"(?=([\w$]+)\s*=\s*(?:\(\s*\)\s*=>\s*{|\(\s*(?:[^)]*)\s*\)\s*=>))"),
+        re.compile(r"(?=([\w$]+)\(\)\s*=>\s*{\))"),
+    ],
+    "classes": [re.compile(r"(?=class\s+([\w$]+))")],
+}
+
+# A line containing none of these can not declare anything.
+INDEX_HINTS = {
+    "methods": ["(", "function"],
+    "tsx": ["=>"],
+    "classes": ["class"],
+}
+
+
+def _entity_pattern(kind, name):
+    """Return the pattern of the declaration of the given name."""
+    name = re.escape(name)
+    if kind == "methods":
+        return r"^\s*(?:" + name + r")\s*\([^)]*\)\s*{|function\s+" + name + r"\s*\("
+    if kind == "tsx":
+        return (
+            name
+            + r"\s*=\s*(\(\s*\)\s*=>\s*{|\(\s*([^)]*)\s*\)\s*=>)|"
+            + name
+            + r"\(\)\s*=>\s*{\)"
+        )
+    return r"class\s+" + name
+
+
+class _Docstring:
+    """A docstring inserted during a pass before the given line, with the
+    names it matches itself.
+    """
+
+    __slots__ = ("text", "number", "names")
+
+    def __init__(self, text, number, names):
+        self.text = text
+        self.number = number
+        self.names = names
+
 
 class JavascriptAggregator:
     def __init__(self):
@@ -19,84 +73,182 @@ class JavascriptAggregator:
 
     def _add_docstrings(self, documentation, code, type="methods"):
         if type == "methods":
-            entities = documentation["methods"]
+            entities = [
+                (entity["method_name"], entity["method_docstring"])
+                for entity in documentation["methods"]
+            ]
         else:
-            entities = documentation["classes"]
+            entities = [
+                (entity["class_name"], entity["class_docstring"])
+                for entity in documentation["classes"]
+            ]
+        return self._insert_docstrings(entities, code, type)
+
+    def _add_tsx_docstrings(self, documentation, code):
+        entities = [
+            (entity["method_name"], entity["method_docstring"])
+            for entity in documentation["methods"]
+        ]
+        return self._insert_docstrings(entities, code, "tsx")
 
+    def _insert_docstrings(self, entities, code, kind):
+        """Add a docstring before the first declaration of each entity that is
+        not already preceded by a comment.
+
+        The lines are indexed once by the names they declare, and each
+        docstring is only attached to the line it precedes, so the cost does
+        not depend on the number of entities times the number of lines. The
+        result is the same as checking every line against every entity in
+        order: the line preceding a declaration is the last non-empty line
+        before it that does not declare that same entity, and it carries over
+        from one entity to the next.
+        """
         lines = code.splitlines()
+        index = {}
+        for number, line in enumerate(lines):
+            for name in self._declared_names(line, kind):
+                index.setdefault(name, []).append(number)
+
+        # Line number of the last non-empty line before each line.
+        previous_non_empty = []
+        last = None
+        for line in lines:
+            previous_non_empty.append(last)
+            if line.strip():
+                last = len(previous_non_empty) - 1
+        previous_non_empty.append(last)
+
+        # Docstrings inserted before each line, in order. Items are addressed
+        # as (line number, position), where the position of the line itself
+        # is after its docstrings.
+        inserted = {}
+        inserted_index = {}
         previous_line = None
 
-        for entity in entities:
-            name_to_search = (
-                entity["method_name"] if type == "methods" else entity["class_name"]
-            )
-            docstring = (
-                entity["method_docstring"]
-                if type == "methods"
-                else entity["class_docstring"]
-            )
-
-            if type == "methods":
-                pattern = (
-                    r"^\s*(?:"
-                    + re.escape(name_to_search)
-                    + r")\s*\([^)]*\)\s*{|function\s+"
-                    + re.escape(name_to_search)
-                    + r"\s*\("
+        for name, docstring in entities:
+            if SIMPLE_NAME.fullmatch(name):
+                matching_lines = index.get(name, [])
+                matching_docstrings = inserted_index.get(name, [])
+                candidates = [
+                    (number, len(inserted.get(number, []))) for number in matching_lines
+                ]
+                candidates.extend(
+                    (item.number, inserted[item.number].index(item))
+                    for item in matching_docstrings
+                )
+                candidates.sort()
+                matching = (
+                    set(matching_lines),
+                    {id(item) for item in matching_docstrings},
                 )
             else:
-                pattern = r"class\s+" + re.escape(name_to_search)
-
-            for i, line in enumerate(lines):
-                if re.findall(pattern, line, re.MULTILINE):
-                    if previous_line:
-                        # Check if the function or class is already documented
-                        if "*/" not in previous_line and "//" not in previous_line:
-                            indentation = self._extract_indentation(line)
-                            fixed_docstring = self._break_large_strings(docstring)
-                            fixed_docstring = self._format_docstring(
-                                fixed_docstring, indentation
-                            )
-                            lines.insert(i, fixed_docstring)
-                            break
-                elif line.strip():
-                    previous_line = line
-
-        return "\n".join(lines)
+                candidates, matching = self._scan_entity(
+                    lines, inserted, _entity_pattern(kind, name)
+                )
 
-    def _add_tsx_docstrings(self, documentation, code):
-        entities = documentation["methods"]
-        lines = code.splitlines()
-        previous_line = None
+            documented = False
+            for number, position in candidates:
+                previous = self._previous_line(
+                    lines, inserted, previous_non_empty, matching, number, position
+                )
+                if previous is None:
+                    previous = previous_line
+                if not previous:
+                    continue
+                # Check if the function or class is already documented
+                if "*/" not in previous and "//" not in previous:
+                    docstrings = inserted.setdefault(number, [])
+                    if position < len(docstrings):
+                        declaration = docstrings[position].text
+                    else:
+                        declaration = lines[number]
+                    indentation = self._extract_indentation(declaration)
+                    fixed_docstring = self._break_large_strings(docstring)
+                    fixed_docstring = self._format_docstring(
+                        fixed_docstring, indentation
+                    )
+                    item = _Docstring(
+                        fixed_docstring,
+                        number,
+                        self._declared_names(fixed_docstring, kind),
+                    )
+                    docstrings.insert(position, item)
+                    for declared_name in item.names:
+                        inserted_index.setdefault(declared_name, []).append(item)
+                    previous_line = previous
+                    documented = True
+                    break
+
+            if not documented:
+                previous = self._previous_line(
+                    lines, inserted, previous_non_empty, matching, len(lines), 0
+                )
+                if previous is not None:
+                    previous_line = previous
+
+        documented_lines = []
+        for number, line in enumerate(lines):
+            documented_lines.extend(item.text for item in inserted.get(number, []))
+            documented_lines.append(line)
+        return "\n".join(documented_lines)
+
+    def _declared_names(self, text, kind):
+        """Return the names whose declaration pattern matches the text."""
+        names = set()
+        if not any(hint in text for hint in INDEX_HINTS[kind]):
+            return names
+        for pattern in INDEX_PATTERNS[kind]:
+            for match in pattern.finditer(text):
+                name = match.group(1)
+                if kind == "classes":
+                    # "class\s+Name" also matches any longer class name.
+                    names.update(name[:end] for end in range(1, len(name) + 1))
+                else:
+                    names.add(name)
+        return names
+
+    def _scan_entity(self, lines, inserted, pattern):
+        """Find the items matching the pattern of a name that can not be
+        indexed, checking each one of them.
+        """
+        candidates = []
+        matching = (set(), set())
+        for number, line in enumerate(lines):
+            docstrings = inserted.get(number, [])
+            for position, item in enumerate(docstrings):
+                if re.findall(pattern, item.text, re.MULTILINE):
+                    candidates.append((number, position))
+                    matching[1].add(id(item))
+            if re.findall(pattern, line, re.MULTILINE):
+                candidates.append((number, len(docstrings)))
+                matching[0].add(number)
+        return candidates, matching
+
+    def _previous_line(
+        self, lines, inserted, previous_non_empty, matching, number, position
+    ):
+        """Return the last non-empty item before the given one that does not
+        match the entity, or None if there is none. matching holds the numbers
+        of the matching lines and the ids of the matching docstrings.
+        """
+        matching_lines, matching_docstrings = matching
+        while True:
+            if position > 0:
+                position -= 1
+                docstrings = inserted.get(number, [])
+                if position < len(docstrings):
+                    item = docstrings[position]
+                    if id(item) not in matching_docstrings:
+                        return item.text
+                    continue
+                if number not in matching_lines:
+                    return lines[number]
+                continue
 
-        for entity in entities:
-            name_to_search = entity["method_name"]
-            docstring = entity["method_docstring"]
-
-            pattern = (
-                r""
-                + re.escape(name_to_search)
-                + "\s*=\s*(\(\s*\)\s*=>\s*{|\(\s*([^)]*)\s*\)\s*=>)|"
-                + re.escape(name_to_search)
-                + r"\(\)\s*=>\s*{\)"
-            )
-
-            for i, line in enumerate(lines):
-                if re.findall(pattern, line, re.MULTILINE):
-                    if previous_line:
-                        # Check if the function or class is already documented
-                        if "*/" not in previous_line and "//" not in previous_line:
-                            indentation = self._extract_indentation(line)
-                            fixed_docstring = self._break_large_strings(docstring)
-                            fixed_docstring = self._format_docstring(
-                                fixed_docstring, indentation
-                            )
-                            lines.insert(i, fixed_docstring)
-                            break
-                elif line.strip():
-                    previous_line = line
-
-        return "\n".join(lines)
+            number = previous_non_empty[number]
+            if number is None:
+                return None
+            position = len(inserted.get(number, [])) + 1
 
     def _extract_indentation(self, code_line):
         indentation = 0
@@ -0,0 +1,35 @@
+import bisect
+
+
+class LineIndex:
+    """Index the start offset of each line of a text, so the aggregators can
+    look at the lines around an offset without splitting the whole text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = [0]
+        position = text.find("\n")
+        while position != -1:
+            self.starts.append(position + 1)
+            position = text.find("\n", position + 1)
+
+    def line_number(self, offset):
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    def line(self, number):
+        """Return the line without its line break."""
+        start = self.starts[number]
+        if number + 1 < len(self.starts):
+            return self.text[start : self.starts[number + 1] - 1]
+        return self.text[start:]
+
+    def lines_before(self, offset, count):
+        """Return the same as text[:offset].split("\\n")[-count:], i.e. the
+        beginning of the line of the offset preceded by up to count - 1 lines.
+        """
+        number = self.line_number(offset)
+        first = max(number - count + 1, 0)
+        lines = [self.line(previous) for previous in range(first, number)]
+        lines.append(self.text[self.starts[number] : offset])
+        return lines
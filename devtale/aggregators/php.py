@@ -1,5 +1,12 @@
 import re
 
+from .lines import LineIndex
+
+# Names that can be looked up in the declaration index. Any other name is
+# used as a pattern, as the GPT answers have always been.
+SIMPLE_NAME = re.compile(r"\w+")
+WHITESPACE = re.compile(r"\s*")
+
 
 class PHPAggregator:
     def __init__(self):
@@ -21,66 +28,113 @@ class PHPAggregator:
         return code
 
     def _document_functions(self, documentation, code):
+        declarations = self._find_declarations("function", code)
+        line_index = LineIndex(code)
+        insertions = []
+        documented = set()
+
         for method_data in documentation["methods"]:
             method_name = method_data["method_name"]
             method_docstring = method_data["method_docstring"]
 
-            pattern = re.compile(r"function\s+" + method_name + r"\s*")
-            match = pattern.search(code)
-
-            if match:
-                words = code[max(0, match.start() - 50) : match.start()].split()[-3:]
+            declaration = self._find_declaration(
+                "function", method_name, code, declarations
+            )
+            # Only the first docstring of a function is kept.
+            if declaration and declaration[0] not in documented:
+                start = declaration[0]
+                words = code[max(0, start - 50) : start].split()[-3:]
+                words = [""] * (3 - len(words)) + words
                 if words[-1] == "static":
                     if (
                         words[-2] in ["public", "protected", "private"]
                         and words[-3] != "*/"
                     ):
-                        insertion_index = max(0, match.start() - len(words[-2]) - 1)
+                        insertion_index = max(0, start - len(words[-2]) - 1)
                     else:
                         insertion_index = None
                 elif words[-1] in ["public", "protected", "private"]:
                     if words[-2] != "*/":
-                        insertion_index = max(0, match.start() - len(words[-1]) - 1)
+                        insertion_index = max(0, start - len(words[-1]) - 1)
                     else:
                         insertion_index = None
                 elif words[-1] != "*/":
-                    insertion_index = max(0, match.start())
+                    insertion_index = max(0, start)
                 else:
                     insertion_index = None
 
                 if insertion_index:
-                    indentation = self._extract_indentation(code, match.group(0))
+                    documented.add(start)
+                    indentation = self._extract_indentation(line_index, declaration)
                     method_docstring = self._fix_docstring(method_docstring)
                     php_docstring = self._format_docstring(
                         method_docstring, indentation
                     )
-                    code = (
-                        code[:insertion_index]
-                        + php_docstring
-                        + " " * indentation
-                        + code[insertion_index:]
+                    insertions.append(
+                        (insertion_index, php_docstring + " " * indentation)
                     )
-        return code
+        return self._apply_insertions(code, insertions)
 
     def _document_classes(self, documentation, code):
+        declarations = self._find_declarations("class", code)
+        line_index = LineIndex(code)
+        insertions = []
+
         for class_data in documentation["classes"]:
             class_name = class_data["class_name"]
             class_docstring = class_data["class_docstring"]
 
-            pattern = re.compile(r"class\s+" + class_name + r"\s*")
-            match = pattern.search(code)
-
-            if match:
-                indentation = self._extract_indentation(code, match.group(0))
+            declaration = self._find_declaration(
+                "class", class_name, code, declarations
+            )
+            if declaration:
+                indentation = self._extract_indentation(line_index, declaration)
                 class_docstring = self._fix_docstring(class_docstring)
                 php_docstring = self._format_docstring(class_docstring, indentation)
-                code = (
-                    code[: match.start()]
-                    + php_docstring
-                    + " " * indentation
-                    + code[match.start() :]
-                )
-        return code
+                insertions.append((declaration[0], php_docstring + " " * indentation))
+        return self._apply_insertions(code, insertions)
+
+    def _find_declarations(self, keyword, code):
+        """Index the offset of the first declaration matching each name in a
+        single scan. As in the "keyword NAME" pattern, a name also matches the
+        longer names that start with it.
+        """
+        declarations = {}
+        for match in re.finditer(r"(?=" + keyword + r"\s+(\w+))", code):
+            name = match.group(1)
+            for end in range(1, len(name) + 1):
+                declarations.setdefault(name[:end], match.start())
+        return declarations
+
+    def _find_declaration(self, keyword, name, code, declarations):
+        """Return the offset and text of the first match of the "keyword NAME"
+        pattern, or None.
+        """
+        if not SIMPLE_NAME.fullmatch(name):
+            match = re.search(keyword + r"\s+" + name + r"\s*", code)
+            return (match.start(), match.group()) if match else None
+        start = declarations.get(name)
+        if start is None:
+            return None
+        # The indexed declaration is the keyword, spaces and a name starting
+        # with this one, so the pattern does not need to be compiled.
+        end = WHITESPACE.match(code, start + len(keyword)).end() + len(name)
+        end = WHITESPACE.match(code, end).end()
+        return start, code[start:end]
+
+    def _apply_insertions(self, code, insertions):
+        """Insert all the texts at their offsets with a single join. Texts
+        inserted at the same offset keep their order.
+        """
+        insertions.sort(key=lambda insertion: insertion[0])
+        pieces = []
+        position = 0
+        for offset, text in insertions:
+            pieces.append(code[position:offset])
+            pieces.append(text)
+            position = offset
+        pieces.append(code[position:])
+        return "".join(pieces)
 
     def _format_docstring(self, docstring, indentation):
         """Add the in-line comment character key"""
@@ -91,22 +145,20 @@ class PHPAggregator:
         php_docstring += " " * indentation + " */\n"
         return php_docstring
 
-    def _extract_indentation(self, text, code_line):
-        lines = text.split("\n")
-        match_line = None
-        for line in lines:
-            if code_line in line:
-                match_line = line
-                break
+    def _extract_indentation(self, line_index, declaration):
+        start, text = declaration
+        # A declaration spanning several lines is not indented.
+        if "\n" in text:
+            return 0
+        match_line = line_index.line(line_index.line_number(start))
         indentation = 0
-        if match_line:
-            for char in match_line:
-                if char == "\t":
-                    indentation += 4
-                elif char == " ":
-                    indentation += 1
-                else:
-                    break
+        for char in match_line:
+            if char == "\t":
+                indentation += 4
+            elif char == " ":
+                indentation += 1
+            else:
+                break
         return indentation
 
     def _break_large_strings(self, string, max_lenght=90):
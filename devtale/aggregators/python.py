@@ -1,22 +1,7 @@
 import ast
 import re
 
-
-class Placeholder(ast.NodeTransformer):
-    def visit(self, node):
-        if isinstance(node, ast.ClassDef):
-            docstring = ast.Expr(ast.Str(f"CLASS DOCSTRING PLACEHOLDER {node.name}"))
-            if not node.body or not isinstance(node.body[0], ast.Expr):
-                node.body = [docstring] + node.body
-
-        elif isinstance(node, ast.FunctionDef):
-            docstring = ast.Expr(ast.Str(f"METHOD DOCSTRING PLACEHOLDER {node.name}"))
-            if not node.body or not isinstance(node.body[0], ast.Expr):
-                node.body = [docstring] + node.body
-        else:
-            pass
-
-        return self.generic_visit(node)
+NEWLINE = re.compile(r"\r\n?|\n")
 
 
 class PythonAggregator:
@@ -25,55 +10,114 @@ class PythonAggregator:
 
     def document(self, documentation, code):
         code = self._add_file_level_docstring(code, documentation)
-        code_w_placeholders = self._add_placeholders(code)
-        code_definitions = self._get_code_definitions(code_w_placeholders)
-        documented_code = code
-
-        # For each function/method or class definition we found using AST, we match
-        # it with the dev tale info.
-        for name, definition in code_definitions.items():
-            splited_definition = definition.split()
-
-            prefix = splited_definition[0]  # def, class
-            postfix = splited_definition[-1]  # last text Eg. "->None", "):", etc
-
-            type_item = "method" if prefix == "def" else "class"
-            # Extract only the last character if we have conflicting text that won't
-            # allow us to match the pattern.
-            if len(splited_definition) == 2 or "'" in postfix or '"' in postfix:
-                postfix = postfix[-1]
-
-            pattern = r"" + prefix + "\s+" + name + "[\s\S]*?" + re.escape(postfix)
 
-            docstring = self._get_docstring(type_item, name, documentation)
-
-            # docstring = self._fix_docstring(docstring)
+        # Parse the code only once and use the positions of the nodes to know
+        # where each docstring goes, so the rest of the file is kept as is.
+        code_tree = ast.parse(code)
+        # The lines of ast only end at "\n", "\r\n" or "\r", while
+        # str.splitlines also breaks at form feeds and other separators.
+        line_offsets = [0] + [match.end() for match in NEWLINE.finditer(code)]
+        line_offsets.append(len(code))
+        lines = [code[start:end] for start, end in zip(line_offsets, line_offsets[1:])]
+
+        docstrings = {
+            "class": self._index_docstrings(
+                documentation["classes"], "class_name", "class_docstring"
+            ),
+            "method": self._index_docstrings(
+                documentation["methods"], "method_name", "method_docstring"
+            ),
+        }
+        # Definitions sharing a name (e.g. the same method in different
+        # classes) take the docstrings with that name in order.
+        occurrences = {"class": {}, "method": {}}
+
+        insertions = []
+        for node in self._get_definitions(code_tree):
+            type_item = "class" if isinstance(node, ast.ClassDef) else "method"
+            occurrence = occurrences[type_item].get(node.name, 0)
+            occurrences[type_item][node.name] = occurrence + 1
+
+            candidates = docstrings[type_item].get(node.name)
+            if not candidates:
+                continue
+            docstring = candidates[min(occurrence, len(candidates) - 1)]
+            if not docstring:
+                continue
             docstring = self._break_large_strings(docstring)
-            comment = f'\n"""{docstring}"""'
-            match = re.findall(pattern, documented_code)
-
-            if match:
-                # use ast to reformat code into lines, trick to make the search easier
-                match = match[0]
-                parsed_text = ast.parse(code)
-                unparsed_text = ast.unparse(parsed_text)
-
-                indentation_size = self._extract_indentation(unparsed_text, definition)
-
-                # add identation to the docstrings
-                lines = comment.split("\n")
-                indented_lines = [
-                    f"{' ' * indentation_size}{line.strip()}" if line.strip() else line
-                    for line in lines
-                ]
-                comment = "\n".join(indented_lines)
 
-                # add the docstring
-                documented_code = re.sub(
-                    re.escape(match), match + comment, documented_code
-                )
+            # The docstring goes right before the first statement of the body,
+            # or its decorators, with its indentation.
+            first_statement = node.body[0]
+            first_line = min(
+                [first_statement.lineno]
+                + [
+                    decorator.lineno
+                    for decorator in getattr(first_statement, "decorator_list", [])
+                ]
+            )
+            body_line = lines[first_line - 1]
+            indentation = body_line[: len(body_line) - len(body_line.lstrip())]
+            body_offset = line_offsets[first_line - 1]
+            start = body_offset
+            one_liner = first_line == node.lineno
+            if one_liner:
+                # e.g. "def f(): pass", the body moves to its own line after
+                # the docstring.
+                indentation += " " * 4
+                prefix = body_line.encode("utf-8")[: first_statement.col_offset]
+                prefix = prefix.decode("utf-8", errors="ignore")
+                start += len(prefix.rstrip())
+                body_offset += len(prefix)
+
+            comment = "\n".join(
+                f"{indentation}{line.strip()}" if line.strip() else line
+                for line in f'"""{docstring}"""'.split("\n")
+            )
+            if one_liner:
+                text = "\n" + comment + "\n" + indentation
+            else:
+                text = comment + "\n"
+            insertions.append((start, body_offset, text))
+
+        # Apply every insertion at once, in the order of the file. Each one
+        # replaces the code between start and end, which is empty except for
+        # the spaces before the body of one-line definitions.
+        insertions.sort(key=lambda insertion: insertion[0])
+        pieces = []
+        position = 0
+        for start, end, text in insertions:
+            pieces.append(code[position:start])
+            pieces.append(text)
+            position = end
+        pieces.append(code[position:])
+        return "".join(pieces)
+
+    def _get_definitions(self, code_tree):
+        """Yield the classes and functions/methods without docstring, in the
+        order they appear in the file.
+        """
+        definitions = [
+            node
+            for node in ast.walk(code_tree)
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+            and not self._has_docstring(node)
+        ]
+        return sorted(definitions, key=lambda node: (node.lineno, node.col_offset))
+
+    def _has_docstring(self, node):
+        first_statement = node.body[0]
+        return (
+            isinstance(first_statement, ast.Expr)
+            and isinstance(first_statement.value, ast.Constant)
+            and isinstance(first_statement.value.value, str)
+        )
 
-        return documented_code
+    def _index_docstrings(self, items, name_key, docstring_key):
+        index = {}
+        for item in items:
+            index.setdefault(item[name_key], []).append(item[docstring_key])
+        return index
 
     def _add_file_level_docstring(self, code: str, documentation):
         """Add a top-level docstring if there isn't one already."""
@@ -86,74 +130,6 @@ class PythonAggregator:
 
         return code
 
-    def _add_placeholders(self, code: str):
-        """AST is capable of adding docstrings to the code; however, it reformats
-        the file. To avoid this, we add a placeholder that we later search for in
-        the process. This helps us determine the location where the docstring
-        should be attached.
-        """
-        code_tree = ast.parse(code)
-        placeholder_adder = Placeholder()
-        modified_ast = placeholder_adder.visit(code_tree)
-        modified_code = ast.unparse(modified_ast)
-
-        return modified_code
-
-    def _get_code_definitions(self, code_w_placeholders):
-        """Search for the placeholder we added and extract the function/method or
-        class signature.
-        """
-        code_definitions = {}
-        lines = code_w_placeholders.splitlines()
-
-        for idx, line in enumerate(lines):
-            if line.strip().startswith('"""METHOD DOCSTRING PLACEHOLDER'):
-                name = line.split()[-1].replace('"""', "")
-                code_definitions[name] = lines[idx - 1]
-            elif line.strip().startswith('"""CLASS DOCSTRING PLACEHOLDER'):
-                name = line.split()[-1].replace('"""', "")
-                code_definitions[name] = lines[idx - 1]
-        return code_definitions
-
-    def _get_docstring(self, type_item: str, name: str, documentation):
-        if type_item == "method":
-            method_info = next(
-                (
-                    method
-                    for method in documentation["methods"]
-                    if method["method_name"] == name
-                ),
-                None,
-            )
-            if method_info:
-                return method_info["method_docstring"]
-        elif type_item == "class":
-            class_info = next(
-                (cls for cls in documentation["classes"] if cls["class_name"] == name),
-                None,
-            )
-            if class_info:
-                return class_info["class_docstring"]
-        return ""
-
-    def _extract_indentation(self, text, code_line):
-        lines = text.split("\n")
-        next_code_line = None
-
-        for idx, line in enumerate(lines):
-            if code_line in line:
-                for i in range(idx + 1, len(lines)):
-                    next_line = lines[i]
-                    if next_line.strip():
-                        next_code_line = next_line
-                        break
-                break
-
-        indentation_size = (
-            len(next_code_line) - len(next_code_line.lstrip()) if next_code_line else 0
-        )
-        return indentation_size
-
     def _break_large_strings(self, string, max_lenght=90):
         """Avoid very long in-line comments by breaking them into smaller
         segments with a maximum length.
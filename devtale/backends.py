@@ -0,0 +1,260 @@
+import ast
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+
+import openai
+import requests
+from langchain.callbacks import get_openai_callback
+from langchain.chat_models import ChatOpenAI
+
+from devtale.constants import GPT_PRICE, HTTP_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# The answer of a LLM to a prompt, with its usage.
+Completion = namedtuple(
+    "Completion", ["text", "prompt_tokens", "completion_tokens", "cost"]
+)
+
+# The label that introduces the input in each template.
+_INPUT_LABEL = re.compile(
+    r"(?:Code|Input|files? data|Summaries|Folder information|Repository information"
+    r"|Information|README): <<< "
+)
+
+_backend = None
+
+
+class OpenAIBackend:
+    """Send the prompts to the OpenAI API, or to any OpenAI-compatible API
+    when base_url is given (e.g. a local vLLM or the devtale fake server).
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        # Answers of another API must not be mixed with OpenAI's in the cache.
+        self.name = "openai" if base_url is None else f"openai@{base_url}"
+        self._llms = {}
+        self._lock = threading.Lock()
+
+    def complete(self, model_name, prompt, verbose=False):
+        if verbose:
+            logger.info(f"Prompt after formatting:\n{prompt}")
+        with get_openai_callback() as cb:
+            text = self._get_llm(model_name).predict(prompt)
+        return Completion(text, cb.prompt_tokens, cb.completion_tokens, cb.total_cost)
+
+    def _get_llm(self, model_name):
+        """Return the shared ChatOpenAI client of the model. All the clients
+        send their requests through the same keep-alive connection pool.
+        """
+        with self._lock:
+            if openai.requestssession is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                openai.requestssession = session
+            if model_name not in self._llms:
+                kwargs = {}
+                if self.base_url is not None:
+                    kwargs["openai_api_base"] = self.base_url
+                # Retries are handled by the rate limiter of the model.
+                self._llms[model_name] = ChatOpenAI(
+                    model_name=model_name, max_retries=0, **kwargs
+                )
+            return self._llms[model_name]
+
+
+class FakeBackend:
+    """Answer the prompts locally, without any network call, to exercise the
+    whole pipeline offline.
+
+    Answers are built from the prompt, so they are deterministic: the code
+    extractor lists the classes and functions declared in the code, the
+    docstrings follow the FileDocumentation schema and the summaries quote
+    the start of their input. Latency, given as a distribution (see
+    parse_distribution) plus seconds_per_token of answer, server errors and
+    429 rate limits are drawn from a generator seeded with the prompt and
+    the number of times it was seen, so a run is reproducible whatever the
+    order of the calls.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency="constant:0",
+        seconds_per_token=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        seed=0,
+    ):
+        self.latency = parse_distribution(latency)
+        self.seconds_per_token = seconds_per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self._calls = Counter()
+        self._lock = threading.Lock()
+
+    def complete(self, model_name, prompt, verbose=False):
+        # Imported here as devtale.utils depends on this module.
+        from devtale.utils import count_tokens
+
+        if verbose:
+            logger.info(f"Prompt after formatting:\n{prompt}")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._calls[digest] += 1
+            generator = random.Random(f"{self.seed}:{digest}:{self._calls[digest]}")
+
+        text = fake_answer(prompt)
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(text)
+        time.sleep(self.latency(generator) + self.seconds_per_token * completion_tokens)
+
+        failure = generator.random()
+        if failure < self.rate_limit_rate:
+            raise openai.error.RateLimitError(
+                "Fake rate limit reached", http_status=429
+            )
+        if failure < self.rate_limit_rate + self.error_rate:
+            raise openai.error.APIError("Fake server error", http_status=500)
+
+        price = GPT_PRICE.get(model_name, 0)
+        cost = (prompt_tokens + completion_tokens) / 1000 * price
+        return Completion(text, prompt_tokens, completion_tokens, cost)
+
+
+def parse_distribution(spec):
+    """Parse a latency distribution, in seconds, into a function of a
+    random.Random that draws from it. The spec is one of constant:VALUE,
+    uniform:LOW:HIGH, exponential:MEAN or lognormal:MEDIAN:SIGMA.
+    """
+    name, *values = spec.split(":")
+    try:
+        values = [float(value) for value in values]
+        if name == "constant":
+            (value,) = values
+            return lambda generator: value
+        if name == "uniform":
+            low, high = values
+            return lambda generator: generator.uniform(low, high)
+        if name == "exponential":
+            (mean,) = values
+            return lambda generator: generator.expovariate(1 / mean) if mean else 0
+        if name == "lognormal":
+            median, sigma = values
+            return lambda generator: median * generator.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+def fake_answer(prompt):
+    """Build an answer with the format that devtale expects for the prompt."""
+    information = _delimited(prompt)
+    if "output the classes and method names" in prompt:
+        classes, methods = _find_declarations(information)
+        summary = f"Code defining {len(classes)} classes and {len(methods)} methods."
+        return (
+            f"classes={json.dumps(classes)}\n"
+            f"methods={json.dumps(methods)}\n"
+            f"summary={json.dumps(summary)}"
+        )
+
+    if "document a whole code file" in prompt:
+        documentation = _fake_docstrings(prompt, information)
+        excerpt = " ".join(information.split())[:80]
+        documentation["file_docstring"] = f"Fake summary of {excerpt}"
+        return json.dumps(documentation)
+
+    if "generate Google Style docstrings" in prompt:
+        return json.dumps(_fake_docstrings(prompt, information))
+
+    if "maps the ID of every file" in prompt:
+        return json.dumps(
+            {
+                item["file_id"]: "Fake summary of "
+                + " ".join(item["file_content"].split())[:80]
+                for item in json.loads(information)
+            }
+        )
+
+    excerpt = " ".join(information.split())[:80]
+    if "#### <<<folder_name>>>" in prompt:
+        return f"#### folder\nFake folder overview of {excerpt}\n\n**Files list:**\n"
+    if "# <<<repository_name>>>" in prompt:
+        return (
+            "# Repository\n\n## Description\nFake description.\n\n"
+            f"## Overview\nFake overview of {excerpt}\n"
+        )
+    return f"Fake summary of {excerpt}"
+
+
+def _fake_docstrings(prompt, code):
+    """Document the listed code elements that are declared in the code, or
+    all the declared ones if the list is empty.
+    """
+    match = re.search(r'code elements \(classes and/or methods\): "(.*?)"\.\n', prompt)
+    try:
+        code_elements = ast.literal_eval(match.group(1))
+    except (AttributeError, SyntaxError, ValueError):
+        code_elements = {}
+    classes, methods = _find_declarations(code)
+    if not code_elements:
+        code_elements = {"classes": classes, "methods": methods}
+    return {
+        "classes": [
+            {"class_name": name, "class_docstring": f"Fake docstring of {name}."}
+            for name in code_elements.get("classes", [])
+            if name in classes
+        ],
+        "methods": [
+            {"method_name": name, "method_docstring": f"Fake docstring of {name}."}
+            for name in code_elements.get("methods", [])
+            if name in methods
+        ],
+    }
+
+
+def _delimited(prompt):
+    """Return the input of the prompt, enclosed within <<< >>>."""
+    match = _INPUT_LABEL.search(prompt)
+    end = prompt.rfind(" >>>")
+    if match is None or end < match.end():
+        return prompt
+    return prompt[match.end() : end]
+
+
+def _find_declarations(code):
+    classes = re.findall(r"\b(?:class|interface|struct)\s+(\w+)", code)
+    classes += re.findall(r"\btype\s+(\w+)\s+(?:struct|interface)\b", code)
+    methods = re.findall(
+        r"\b(?:def|function|func)\s+(?:\([^)]*\)\s*)?&?(\w+)\s*[\[(<]", code
+    )
+    return list(dict.fromkeys(classes)), list(dict.fromkeys(methods))
+
+
+def configure_backend(backend):
+    """Set the process-wide backend that answers the prompts."""
+    global _backend
+    _backend = backend
+    return _backend
+
+
+def get_backend():
+    """Return the process-wide backend, OpenAI unless configured otherwise."""
+    global _backend
+    if _backend is None:
+        _backend = OpenAIBackend()
+    return _backend
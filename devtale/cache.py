@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from devtale.templates import TEMPLATES_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "devtale")
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+
+_cache = None
+
+# The names of the folders and files of the answers, see LLMCache._path.
+_FOLDER_NAME = re.compile(r"[0-9a-f]{2}")
+_ENTRY_NAME = re.compile(r"[0-9a-f]{64}\.json")
+
+
+class LLMCache:
+    """Content-addressed store for LLM answers.
+
+    Answers are kept in an in-memory LRU in front of a directory with one file
+    per answer. Files are written to a temporary name and atomically renamed,
+    so several devtale processes can share the same directory. When the
+    directory grows over max_size, the least recently used answers are
+    removed, and answers unused for more than max_age seconds are never
+    returned, whether they are in memory or on disk.
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_CACHE_DIR,
+        max_size=DEFAULT_CACHE_SIZE,
+        max_age=None,
+        memory_items=1024,
+    ):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.memory_items = memory_items
+        # key -> (answer, time it was last used).
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Approximate size of the directory, refreshed on each eviction pass.
+        self._disk_size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        content = "\0".join([TEMPLATES_VERSION, model_name, prompt])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value, used = self._memory.pop(key, (None, None))
+            hit = used is not None and not self._is_expired(used)
+            if hit:
+                self._memory[key] = (value, time.time())
+
+        path = self._path(key)
+        if hit:
+            # Keep the file as recently used as its answer in memory, so it is
+            # neither evicted nor expired on disk while it is hot.
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return value
+
+        try:
+            if self._is_expired(os.path.getmtime(path)):
+                return None
+            with open(path, "r", encoding="utf-8") as file:
+                value = json.load(file)["text"]
+            # Refresh the access time used by the LRU eviction.
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"text": value})
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.info(f"Failed to write cache entry {key} - Exception: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(data)
+            needs_eviction = self._disk_size is None or self._disk_size > self.max_size
+        if needs_eviction:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries and, if the cache is still too big, the least
+        recently used ones until it is 10% under max_size. Only the answers
+        count and get removed, not the other files of the directory, e.g. the
+        temporary files that other processes are writing.
+        """
+        entries = []
+        for folder_path in self._entry_folders():
+            try:
+                with os.scandir(folder_path) as iterator:
+                    items = list(iterator)
+            except OSError:
+                continue
+            for item in items:
+                if not _ENTRY_NAME.fullmatch(item.name):
+                    continue
+                try:
+                    stat = item.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        target_size = self.max_size * 0.9 if total_size > self.max_size else None
+        for mtime, size, path in sorted(entries):
+            expired = self._is_expired(mtime)
+            if not expired and (target_size is None or total_size <= target_size):
+                continue
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                # Another process removed it first.
+                pass
+
+        with self._lock:
+            self._disk_size = total_size
+
+    def _entry_folders(self):
+        try:
+            with os.scandir(self.cache_dir) as iterator:
+                return [
+                    item.path
+                    for item in iterator
+                    if _FOLDER_NAME.fullmatch(item.name)
+                    and item.is_dir(follow_symlinks=False)
+                ]
+        except OSError:
+            return []
+
+    def _is_expired(self, mtime):
+        return self.max_age is not None and time.time() - mtime > self.max_age
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = (value, time.time())
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+
+def configure_cache(
+    cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE, max_age=None
+):
+    """Enable the process-wide LLM cache. Passing cache_dir=None disables it."""
+    global _cache
+    _cache = LLMCache(cache_dir, max_size, max_age) if cache_dir else None
+    return _cache
+
+
+def get_cache():
+    return _cache
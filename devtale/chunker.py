@@ -0,0 +1,165 @@
+import ast
+import bisect
+import math
+
+from devtale.scanner import SCANNER_LANGUAGES, scan_declarations
+from devtale.utils import count_tokens
+
+
+class Chunk:
+    """A piece of a source file, kept as offsets into it instead of a copy.
+    Like the langchain Documents it replaces, its text is in page_content.
+    """
+
+    __slots__ = ("source", "start", "end", "tokens")
+
+    def __init__(self, source, start, end, tokens):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+
+    @property
+    def page_content(self):
+        return self.source[self.start : self.end]
+
+    def __repr__(self):
+        return f"Chunk(start={self.start}, end={self.end}, tokens={self.tokens})"
+
+
+def chunk_code(code, file_ext, *budgets):
+    """Split the code into chunks of at most the given number of tokens, one
+    list of chunks per budget (e.g. a coarse and a fine one).
+
+    The code is parsed and tokenized only once. Chunks are aligned with the
+    declarations (functions, classes...) found in it: a declaration is only
+    split, along its own inner declarations and then its lines, when it alone
+    exceeds the budget, and consecutive small declarations are packed
+    together. Token counts are summed per line, so they are a close
+    approximation of the tokens of the whole chunk.
+    """
+    line_starts = [0]
+    position = code.find("\n")
+    while position != -1:
+        line_starts.append(position + 1)
+        position = code.find("\n", position + 1)
+    if line_starts[-1] == len(code) and len(line_starts) > 1:
+        line_starts.pop()
+    line_starts.append(len(code))
+    line_count = len(line_starts) - 1
+
+    prefix = [0]
+    for number in range(line_count):
+        line = code[line_starts[number] : line_starts[number + 1]]
+        prefix.append(prefix[-1] + count_tokens(line))
+
+    spans = _declaration_spans(code, file_ext, line_starts)
+    chunks_per_budget = []
+    for budget in budgets:
+        atoms = _split(spans, 0, line_count, prefix, budget)
+        chunks_per_budget.append(_pack(code, atoms, line_starts, prefix, budget))
+    return chunks_per_budget
+
+
+def _declaration_spans(code, file_ext, line_starts):
+    """Return the (first line, last line + 1) of each declaration, sorted so
+    that a declaration comes before the ones nested in it.
+    """
+    spans = []
+    if file_ext == ".py":
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            for node in ast.walk(tree):
+                if isinstance(
+                    node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+                ):
+                    first = min(
+                        [node.lineno]
+                        + [decorator.lineno for decorator in node.decorator_list]
+                    )
+                    spans.append((first - 1, node.end_lineno))
+    elif file_ext in SCANNER_LANGUAGES:
+        for declaration in scan_declarations(code, file_ext):
+            first = bisect.bisect_right(line_starts, declaration.start) - 1
+            last = bisect.bisect_right(line_starts, max(declaration.end - 1, 0))
+            spans.append((first, last))
+
+    line_count = len(line_starts) - 1
+    spans = {(first, min(last, line_count)) for first, last in spans}
+    return sorted(spans, key=lambda span: (span[0], -span[1]))
+
+
+def _split(spans, first, last, prefix, budget):
+    """Split the lines [first, last) into atoms that fit in the budget, if
+    possible, without cutting a declaration that fits.
+    """
+    if prefix[last] - prefix[first] <= budget or last - first == 1:
+        return [(first, last)]
+
+    # The outermost declarations inside the range.
+    children = []
+    index = bisect.bisect_left(spans, (first, -last))
+    end = first
+    for span_first, span_last in spans[index:]:
+        if span_first >= last:
+            break
+        if span_first < end or span_last > last:
+            continue
+        if (span_first, span_last) == (first, last):
+            continue
+        children.append((span_first, span_last))
+        end = span_last
+
+    if not children:
+        return [(line, line + 1) for line in range(first, last)]
+
+    atoms = []
+    position = first
+    for child_first, child_last in children:
+        if child_first > position:
+            atoms.extend(_split([], position, child_first, prefix, budget))
+        atoms.extend(_split(spans, child_first, child_last, prefix, budget))
+        position = child_last
+    if position < last:
+        atoms.extend(_split([], position, last, prefix, budget))
+    return atoms
+
+
+def _pack(code, atoms, line_starts, prefix, budget):
+    """Greedily group consecutive atoms into chunks that fit in the budget."""
+    chunks = []
+    start = end = None
+    tokens = 0
+    for first, last in atoms:
+        atom_tokens = prefix[last] - prefix[first]
+        if start is not None and tokens + atom_tokens > budget:
+            chunks.append(Chunk(code, start, end, tokens))
+            start = None
+        if atom_tokens > budget:
+            # A single line longer than the budget, e.g. minified code.
+            chunks.extend(
+                _split_line(
+                    code, line_starts[first], line_starts[last], atom_tokens, budget
+                )
+            )
+            continue
+        if start is None:
+            start = line_starts[first]
+            tokens = 0
+        end = line_starts[last]
+        tokens += atom_tokens
+    if start is not None:
+        chunks.append(Chunk(code, start, end, tokens))
+    return [chunk for chunk in chunks if chunk.page_content.strip()]
+
+
+def _split_line(code, start, end, tokens, budget):
+    pieces = math.ceil(tokens / budget)
+    size = math.ceil((end - start) / pieces)
+    return [
+        Chunk(code, offset, min(offset + size, end), math.ceil(tokens / pieces))
+        for offset in range(start, end, size)
+    ]
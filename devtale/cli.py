@@ -1,31 +1,64 @@
 import copy
+import functools
 import getpass
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import click
 from dotenv import find_dotenv, load_dotenv
 
+from devtale.backends import FakeBackend, OpenAIBackend, configure_backend
+from devtale.cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_SIZE,
+    configure_cache,
+    get_cache,
+)
+from devtale.chunker import chunk_code
 from devtale.constants import (
-    ALLOWED_EXTENSIONS,
     ALLOWED_NO_CODE_EXTENSIONS,
     DOCSTRING_LABEL,
-    LANGUAGES,
+    EXTRACTION_CHUNK_TOKENS,
+    MAX_CHUNK_REQUESTS,
+    SMALL_FILE_TOKENS,
+    TALE_CHUNK_TOKENS,
+)
+from devtale.dedup import (
+    Reference,
+    changed_declarations,
+    find_duplicates,
+    own_declarations,
 )
+from devtale.estimation import estimate_cost
+from devtale.extractors import extract_local_code_elements
+from devtale.fingerprint import (
+    configure_docstring_index,
+    fingerprint_declarations,
+    get_docstring_index,
+)
+from devtale.ledger import configure_ledger, get_ledger
+from devtale.manifest import RunManifest
+from devtale.packer import format_pack, pack_no_code_files, split_answer
+from devtale.profiling import annotate, disable_profiling, enable_profiling, span
+from devtale.ratelimit import configure_rate_limits
+from devtale.scheduler import TaskScheduler
 from devtale.utils import (
-    build_project_tree,
     extract_code_elements,
     fuse_documentation,
     fuse_tales_chunks,
+    get_small_file_tale,
     get_unit_tale,
     prepare_code_elements,
     redact_tale_information,
-    split_code,
     split_text,
 )
+from devtale.walker import group_by_folder, walk_repository
 
 DEFAULT_OUTPUT_PATH = "devtale_demo/"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,16 +70,17 @@ def process_repository(
     fuse: bool = False,
     debug: bool = False,
     cost_estimation: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    since: str = None,
+    dedup: bool = True,
 ) -> None:
     """It creates a dev tale for each file in the repository, and it
-    generates a README for the whole repository.
+    generates a README for the whole repository. In incremental mode, only the
+    files that changed since the last run (or since the `since` git reference)
+    are documented again. With dedup, copies and near copies of a file reuse
+    its tale.
     """
-    cost = 0
-    folder_tales = {
-        "repository_name": os.path.basename(os.path.abspath(root_path)),
-        "folders": [],
-    }
-
     # Extract the content of the original README if there is one already.
     original_readme_content = None
     for file_name in ["readme.md", "README.md"]:
@@ -61,69 +95,234 @@ def process_repository(
                     logger.info(f"Error keeping the original readme file: {e}")
             break
 
-    # Check if we have a gitignore file to extract the correct project tree
-    # and files.
-    gitignore_path = os.path.join(root_path, ".gitignore")
-    if os.path.exists(gitignore_path):
-        with open(gitignore_path, "r") as gitignore_file:
-            gitignore_patterns = [
-                line.strip() for line in gitignore_file if line.strip()
-            ]
-    else:
-        gitignore_patterns = None
+    project_tree, folder_files = _explore_repository(root_path)
+    folders = list(folder_files)
+    file_paths = [entry.path for entries in folder_files.values() for entry in entries]
+
+    manifest = None
+    if (incremental or since) and not cost_estimation and not debug:
+        manifest = RunManifest(root_path, output_path, since=since)
+        manifest.remove_deleted_tales(file_paths)
+
+    duplicates = {}
+    # The code of the references of the duplicates, as it was read before
+    # being fused, which rewrites the file when the output is the repository.
+    reference_codes = {}
+    if dedup and not cost_estimation and not debug:
+        # The files that did not change since the last run are not read
+        # again, they only count as the references of their exact copies.
+        digests = {}
+        if manifest is not None:
+            for file_path in file_paths:
+                digest = manifest.unchanged_digest(file_path)
+                if digest is not None:
+                    digests[file_path] = digest
+        with span("dedup"):
+            duplicates = find_duplicates(file_paths, digests=digests)
+        # A near copy only reuses the docstrings of the declarations it shares
+        # with its reference, so the config/script files are not near copies:
+        # they are summarized in packs instead.
+        duplicates = {
+            file_path: duplicate
+            for file_path, duplicate in duplicates.items()
+            if duplicate.exact or not _is_no_code_file(file_path)
+        }
+        exact = sum(duplicate.exact for duplicate in duplicates.values())
+        logger.info(
+            f"Found {exact} copies of other files, that reuse their tales, and "
+            f"{len(duplicates) - exact} near copies, that reuse their docstrings."
+        )
+
+    # Every file, folder and the root are tasks of a single DAG: a folder only
+    # waits for its own files, and the root waits for all the folders. Files
+    # that are ready at the same time are dispatched largest first so that long
+    # files do not end up as the tail of the run.
+    scheduler = TaskScheduler(workers=jobs)
+    reference_paths = {duplicate.reference for duplicate in duplicates.values()}
+    folder_tasks = []
+    for folder_path, entries in folder_files.items():
+        # Fix folder path to avoid issues with file system.
+        if not folder_path.endswith("/"):
+            folder_path += "/"
+
+        folder_full_name = os.path.relpath(folder_path, root_path)
+        folder_output_path = (
+            os.path.join(output_path, folder_full_name)
+            if folder_full_name != "."
+            else output_path
+        )
+        save_path = os.path.join(folder_output_path, os.path.basename(folder_path))
 
-    # Get the project tree before modify it along with the complete list of files
-    # that the repository has.
-    project_tree, file_paths = build_project_tree(
-        root_path, gitignore_patterns=gitignore_patterns
+        file_names = [os.path.basename(entry.path) for entry in entries]
+
+        # The small config/script files of the folder are summarized in packs,
+        # and each of them waits for the answer of its pack.
+        pack_tasks = {}
+        packs = _pack_files(
+            [entry.path for entry in entries], debug, manifest, duplicates
+        )
+        for index, pack in enumerate(packs):
+            pack_task = scheduler.add_task(
+                f"pack:{folder_path}:{index}",
+                functools.partial(_summarize_pack, folder_path, pack, cost_estimation),
+                priority=float("inf"),
+            )
+            for item in pack:
+                pack_tasks[item.path] = pack_task.name
+
+        file_tasks = []
+        for entry in entries:
+            file_path = entry.path
+            func = functools.partial(
+                _process_file_safely,
+                file_path,
+                save_path,
+                fuse,
+                debug,
+                cost_estimation,
+                manifest,
+                reference_codes=(
+                    reference_codes if file_path in reference_paths else None
+                ),
+            )
+            # A duplicate waits for the tale of its reference, which always
+            # comes before it in file_paths.
+            dependencies = []
+            if file_path in duplicates:
+                reference_path = duplicates[file_path].reference
+                func = functools.partial(
+                    _process_duplicate, func, duplicates[file_path], reference_codes
+                )
+                dependencies.append(f"file:{reference_path}")
+            elif file_path in pack_tasks:
+                func = functools.partial(_process_packed, func, file_path)
+                dependencies.append(pack_tasks[file_path])
+            file_tasks.append(
+                scheduler.add_task(
+                    f"file:{file_path}",
+                    func,
+                    dependencies=dependencies,
+                    priority=entry.size,
+                )
+            )
+
+        # Folder and root tasks are on the critical path by definition, so they
+        # go before any file that is ready at the same time.
+        folder_tasks.append(
+            scheduler.add_task(
+                f"folder:{folder_path}",
+                functools.partial(
+                    _document_folder_safely,
+                    folder_path,
+                    save_path,
+                    file_names,
+                    debug,
+                    folder_full_name,
+                    cost_estimation,
+                ),
+                dependencies=[task.name for task in file_tasks],
+                priority=float("inf"),
+            )
+        )
+
+    root_task = scheduler.add_task(
+        "root",
+        functools.partial(
+            _document_root,
+            root_path,
+            output_path,
+            folders,
+            project_tree,
+            original_readme_content,
+            debug,
+            cost_estimation,
+        ),
+        dependencies=[task.name for task in folder_tasks],
+        priority=float("inf"),
     )
-    project_tree = ".\n" + project_tree
 
-    # Extract the folder paths from files list. This allows to avoid processing
-    # folders that should be ignored, and to use the process_folder logic.
-    folders = list(set([os.path.dirname(file_path) for file_path in file_paths]))
+    results = scheduler.run()
+    scheduler.log_critical_path()
 
-    # sort to always have the root folder at the beggining of the list.
-    folders = sorted(folders, key=lambda path: path.count("/"))
+    if manifest is not None:
+        manifest.save(file_paths)
+    return results[root_task.name]
 
-    # Get the folder's README section of each folder while it create a dev tale
-    # for each file.
-    folders_readmes = []
-    for folder_path in folders:
-        try:
-            # Fix folder path to avoid issues with file system.
-            if not folder_path.endswith("/"):
-                folder_path += "/"
 
-            folder_full_name = os.path.relpath(folder_path, root_path)
+def estimate_documentation_cost(path: str, recursive: bool = False, jobs: int = None):
+    """It estimates offline the GPT calls, tokens and cost of documenting the
+    repository, folder, or file, without making any call.
+    """
+    if os.path.isfile(path):
+        root_path = os.path.dirname(path)
+        return estimate_cost(
+            root_path,
+            {root_path: [path]},
+            include_folders=False,
+            include_root=False,
+            jobs=jobs,
+        )
 
-            # Generate folder's README, folder's one-line sentence description, and
-            # extract the cost of documenting the folder.
-            folder_readme, folder_tale, folder_cost = process_folder(
-                folder_path=folder_path,
-                output_path=os.path.join(output_path, folder_full_name)
-                if folder_full_name != "."
-                else output_path,
-                fuse=fuse,
-                debug=debug,
-                folder_full_name=folder_full_name,
-                cost_estimation=cost_estimation,
-            )
-            cost += folder_cost
+    if recursive:
+        _, folder_files = _explore_repository(path)
+    else:
+        folder_files = {path: _list_folder_files(path)}
+    folder_files = {
+        folder_path: [entry.path for entry in entries]
+        for folder_path, entries in folder_files.items()
+    }
+    return estimate_cost(path, folder_files, include_root=recursive, jobs=jobs)
 
-        except Exception as e:
-            folder_name = os.path.basename(folder_path)
-            logger.info(
-                f"Failed to create folder-level tale for {folder_name} - Exception: {e}"
-            )
-            folder_tale = None
+
+def _explore_repository(root_path):
+    """Return the project tree and the files to process of each folder, with
+    the root folder first, in a single walk of the repository.
+    """
+    # The walk applies the .gitignore and .devtaleignore files to extract the
+    # correct project tree and files.
+    with span("walk"):
+        project_tree, entries = walk_repository(root_path)
+        project_tree = ".\n" + project_tree
+
+        # Extract the folders from the files. This allows to avoid processing
+        # folders that should be ignored or that have nothing to document.
+        return project_tree, group_by_folder(entries)
+
+
+def _document_root(
+    root_path,
+    output_path,
+    folders,
+    project_tree,
+    original_readme_content,
+    debug,
+    cost_estimation,
+    *folder_results,
+):
+    """Generate the main README of the repository using as context the
+    folders results, and return the total cost of the run.
+    """
+    cost = 0
+    folder_tales = {
+        "repository_name": os.path.basename(os.path.abspath(root_path)),
+        "folders": [],
+    }
+
+    # Get the folder's README section of each folder.
+    folders_readmes = []
+    for folder_path, folder_result in zip(folders, folder_results):
+        if folder_result is None:
+            continue
+        folder_readme, folder_tale, folder_cost = folder_result
+        cost += folder_cost
 
         # Create a dictionary with the folder's info that serves as context for
         # generating the main repository README.
         if folder_tale:
             folders_readmes.append("\n\n" + folder_readme)
+            folder_full_name = os.path.relpath(folder_path, root_path)
             # Fix root folder information.
-            if folder_path == folders[0]:
+            if folder_full_name == ".":
                 folder_tales["folders"].append(
                     {
                         "folder_name": os.path.basename(os.path.abspath(root_path)),
@@ -142,14 +341,13 @@ def process_repository(
     # For debugging, we only care in seeing the files input workflow
     if debug:
         logger.debug(f"FOLDER_TALES: {folder_tales}")
-        return None
+        return cost
 
     if folder_tales:
         # Generate main README using as context the folders summaries.
-        folder_summaries = split_text(str(folder_tales), chunk_size=15000)
         root_readme, call_cost = redact_tale_information(
             "root-level",
-            folder_summaries,
+            folder_tales,
             model_name="gpt-3.5-turbo-16k",
             cost_estimation=cost_estimation,
         )
@@ -181,11 +379,13 @@ def process_repository(
         # save main README if we are not pre-estimating cost.
         if not cost_estimation:
             logger.info("save root json..")
-            with open(os.path.join(output_path, "root_level.json"), "w") as json_file:
+            with span("write"), open(
+                os.path.join(output_path, "root_level.json"), "w"
+            ) as json_file:
                 json.dump(folder_tales, json_file, indent=2)
 
             logger.info(f"saving root index in {output_path}")
-            with open(
+            with span("write"), open(
                 os.path.join(output_path, "README.md"), "w", encoding="utf-8"
             ) as file:
                 file.write(root_readme)
@@ -200,98 +400,146 @@ def process_folder(
     debug: bool = False,
     folder_full_name: str = None,
     cost_estimation: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    since: str = None,
 ) -> None:
     """It creates a dev tale for each file in the directory without exploring
-    subdirectories, and it generates a README section for the folder.
+    subdirectories, and it generates a README section for the folder. Up to
+    `jobs` files are documented at the same time. In incremental mode, only the
+    files that changed since the last run (or since the `since` git reference)
+    are documented again.
     """
-    cost = 0
     save_path = os.path.join(output_path, os.path.basename(folder_path))
-    tales = []
+    entries = _list_folder_files(folder_path)
+    file_names = [os.path.basename(entry.path) for entry in entries]
+    file_paths = [entry.path for entry in entries]
+
+    manifest = None
+    if (incremental or since) and not cost_estimation and not debug:
+        manifest = RunManifest(folder_path, save_path, since=since)
+        manifest.remove_deleted_tales(file_paths)
+
+    # Create a dev tale for each file. The files are processed concurrently, but
+    # executor.map returns the results in the same order as file_names, so the
+    # folder tales do not depend on which file finishes first. The small
+    # config/script files are summarized in packs first.
+    packs = _pack_files(file_paths, debug, manifest)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        packed = {}
+        for pack_result in executor.map(
+            lambda pack: _summarize_pack(folder_path, pack, cost_estimation), packs
+        ):
+            packed.update(pack_result)
+        file_results = list(
+            executor.map(
+                lambda file_path: _process_file_safely(
+                    file_path,
+                    save_path,
+                    fuse,
+                    debug,
+                    cost_estimation,
+                    manifest,
+                    packed=packed.get(file_path),
+                ),
+                file_paths,
+            )
+        )
+
+    if manifest is not None:
+        manifest.save(file_paths)
+
+    return _document_folder(
+        folder_path,
+        save_path,
+        file_names,
+        debug,
+        folder_full_name,
+        cost_estimation,
+        *file_results,
+    )
 
-    # Iterate through each file in the folder
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
 
-        # Check it if is a file that we need to process
-        if os.path.isfile(file_path) and (
-            os.path.splitext(file_name)[1] in ALLOWED_EXTENSIONS
-            or os.path.splitext(file_name)[1] in ALLOWED_NO_CODE_EXTENSIONS
-        ):
-            logger.info(f"processing {file_path}")
-            # Create dev tale for the file
-            try:
-                file_tale, file_cost = process_file(
-                    file_path, save_path, fuse, debug, cost_estimation
+def _list_folder_files(folder_path):
+    """Return the FileEntry of the files in the folder that we need to
+    process, without exploring subdirectories.
+    """
+    with span("walk"):
+        _, entries = walk_repository(folder_path, recursive=False)
+    return [entry for entry in entries if entry.language is not None]
+
+
+def _document_folder(
+    folder_path,
+    save_path,
+    file_names,
+    debug,
+    folder_full_name,
+    cost_estimation,
+    *file_results,
+):
+    """Generate the folder's README section using the tales of its files. The
+    file_results must follow the order of file_names.
+    """
+    cost = 0
+    tales = []
+    for file_name, (file_tale, file_cost) in zip(file_names, file_results):
+        cost += file_cost
+
+        # Create a dictionary with the tale's file_docstrings values to use them
+        # as context for the folder's README section
+        if file_tale is not None:
+            if file_tale["file_docstring"]:
+                if not folder_full_name:
+                    folder_full_name = os.path.basename(os.path.abspath(folder_path))
+
+                # If this is a root folder, make its name more aesthetic.
+                if folder_full_name == ".":
+                    folder_full_name = "./"
+
+                # Check if we already have the folder_name as key, if yes, then
+                # append the file_docstring on it. Useful when working in a
+                # repository level.
+                folder_entry = next(
+                    (item for item in tales if item["folder_name"] == folder_full_name),
+                    None,
                 )
-                cost += file_cost
-            except Exception as e:
-                logger.info(
-                    f"Failed to create dev tale for {file_path} - Exception: {e}"
+                if folder_entry is None:
+                    folder_entry = {
+                        "folder_name": folder_full_name,
+                        "folder_files": [],
+                    }
+                    # Add a generic description in case this is a root directory.
+                    if folder_full_name == "./":
+                        folder_entry[
+                            "folder_description"
+                        ] = """
+                        This is the root path of the repository. The top-level
+                        directory.
+                        """
+
+                    tales.append(folder_entry)
+
+                folder_entry["folder_files"].append(
+                    {
+                        "file_name": file_name,
+                        "file_description": file_tale["file_docstring"],
+                    }
                 )
-                file_tale = None
-
-            # Create a dictionary with the tale's file_docstrings values to use them
-            # as context for the folder's README section
-            if file_tale is not None:
-                if file_tale["file_docstring"]:
-                    if not folder_full_name:
-                        folder_full_name = os.path.basename(
-                            os.path.abspath(folder_path)
-                        )
-
-                    # If this is a root folder, make its name more aesthetic.
-                    if folder_full_name == ".":
-                        folder_full_name = "./"
-
-                    # Check if we already have the folder_name as key, if yes, then
-                    # append the file_docstring on it. Useful when working in a
-                    # repository level.
-                    folder_entry = next(
-                        (
-                            item
-                            for item in tales
-                            if item["folder_name"] == folder_full_name
-                        ),
-                        None,
-                    )
-                    if folder_entry is None:
-                        folder_entry = {
-                            "folder_name": folder_full_name,
-                            "folder_files": [],
-                        }
-                        # Add a generic description in case this is a root directory.
-                        if folder_full_name == "./":
-                            folder_entry[
-                                "folder_description"
-                            ] = """
-                            This is the root path of the repository. The top-level
-                            directory.
-                            """
-
-                        tales.append(folder_entry)
-
-                    folder_entry["folder_files"].append(
-                        {
-                            "file_name": file_name,
-                            "file_description": file_tale["file_docstring"],
-                        }
-                    )
 
     # For the debugging mode we do not want to generate the folder's README
     # section. We only want to verify the input flow.
     if debug:
         logger.debug(f"FOLDER INFO: folder_path: {folder_path}")
-        logger.debug(f"FOLDER INFO: output_path: {output_path}")
         logger.debug(f"FOLDER INFO: save_path: {save_path}")
         logger.debug(f"FILE_TALES: {tales}")
         return "-", "-", cost
 
     if tales:
         # Generate the folder's README section using as context the tales summaries.
-        files_summaries = split_text(str(tales), chunk_size=10000)
         folder_readme, fl_cost = redact_tale_information(
             "folder-level",
-            files_summaries,
+            tales,
             model_name="gpt-3.5-turbo-16k",
             cost_estimation=cost_estimation,
         )
@@ -316,11 +564,13 @@ def process_folder(
         # save folder tale if we are not pre-estimating cost.
         if not cost_estimation:
             logger.info("save folder json..")
-            with open(os.path.join(save_path, "folder_level.json"), "w") as json_file:
+            with span("write"), open(
+                os.path.join(save_path, "folder_level.json"), "w"
+            ) as json_file:
                 json.dump(tales, json_file, indent=2)
 
             logger.info(f"saving index in {save_path}")
-            with open(
+            with span("write"), open(
                 os.path.join(save_path, "README.md"), "w", encoding="utf-8"
             ) as file:
                 file.write(folder_readme)
@@ -329,14 +579,41 @@ def process_folder(
     return None, None, cost
 
 
+def _document_folder_safely(*args):
+    """Run _document_folder without letting a single failing folder stop the
+    rest of the repository.
+    """
+    try:
+        with annotate(folder=args[0]):
+            return _document_folder(*args)
+    except Exception as e:
+        folder_name = os.path.basename(args[0])
+        logger.info(
+            f"Failed to create folder-level tale for {folder_name} - Exception: {e}"
+        )
+        return None
+
+
 def process_file(
     file_path: str,
     output_path: str = DEFAULT_OUTPUT_PATH,
     fuse: bool = False,
     debug: bool = False,
     cost_estimation: bool = False,
+    manifest: RunManifest = None,
+    reference: Reference = None,
+    packed: tuple = None,
+    reference_codes: dict = None,
 ) -> None:
-    """It creates a dev tale for the file input."""
+    """It creates a dev tale for the file input. When a manifest of the last
+    run is given, files that did not change since then are not read again.
+    When the file copies the reference, a file documented before it, its tale
+    is reused, and when it nearly copies it, only the docstrings of the
+    declarations that differ are generated. For a config/script file, packed
+    is the (file docstring, cost) that it got from the call of its pack, the
+    file being summarized on its own if the docstring is None. When the file
+    is the reference of duplicates, its code is kept in reference_codes.
+    """
     cost = 0
     file_name = os.path.basename(file_path)
     file_ext = os.path.splitext(file_name)[-1]
@@ -350,12 +627,34 @@ def process_file(
 
     # Create output dir if it does not exists and only if we are not
     # pre-estimating the cost.
-    if not os.path.exists(output_path) and not cost_estimation:
-        os.makedirs(output_path)
+    # Several files of the same folder can reach this point at the same time.
+    if not cost_estimation:
+        os.makedirs(output_path, exist_ok=True)
+
+    is_no_code_file = _is_no_code_file(file_path)
+
+    # In incremental mode, reuse the tale of the last run if the file did not
+    # change. Their fused version, if any, was already written by that run.
+    if manifest is not None and manifest.is_unchanged(file_path):
+        if is_no_code_file:
+            found_tale = manifest.previous_tale(file_path)
+        elif os.path.exists(save_path):
+            with open(save_path, "r") as file:
+                found_tale = json.load(file)
+        else:
+            found_tale = None
+
+        if found_tale is not None:
+            logger.info(f"Skipping {file_name} as it did not change.")
+            if is_no_code_file:
+                manifest.record_tale(file_path, found_tale)
+            return found_tale, cost
 
     logger.info("read dev draft")
     with open(file_path, "r") as file:
         code = file.read()
+    if reference_codes is not None:
+        reference_codes[file_path] = code
 
     # Return empty devtale if the input file is empty.
     if not code:
@@ -363,8 +662,9 @@ def process_file(
 
     # Avoid processing a file twice if we already have a tale for it.
     # Only fuse it again. Useful to avoid GPT calls in case of debugging
-    # aggregators.
-    if os.path.exists(save_path):
+    # aggregators. In incremental mode, an existing tale belongs to an older
+    # version of the file.
+    if manifest is None and os.path.exists(save_path):
         logger.info(f"Skipping {file_name} as its tale file already exists.")
         with open(save_path, "r") as file:
             found_tale = json.load(file)
@@ -377,9 +677,28 @@ def process_file(
             )
         return found_tale, cost
 
+    if reference is not None and reference.code in (None, code):
+        logger.info(f"Reusing the tale of {reference.path} for {file_name}.")
+        _record_reuse(file_path, reference.path, exact=True)
+        tale = copy.deepcopy(reference.tale)
+        if is_no_code_file:
+            if manifest is not None:
+                manifest.record_tale(file_path, tale)
+            return tale, cost
+        _save_tale(
+            tale,
+            tale["file_docstring"],
+            code,
+            file_name,
+            output_path,
+            fuse,
+            cost_estimation,
+        )
+        return tale, cost
+
     # For config/bash files we do not aim to document the file itself. We
     # care about understanding what the file does.
-    if not file_ext or file_ext in ALLOWED_NO_CODE_EXTENSIONS:
+    if is_no_code_file:
         # a small single chunk is enough
         no_code_file = split_text(code, chunk_size=5000)[0].page_content
         # prepare input
@@ -387,93 +706,265 @@ def process_file(
             "file_name": file_name,
             "file_content": no_code_file,
         }
-        file_docstring, call_cost = redact_tale_information(
-            content_type="no-code-file",
-            docs=no_code_file_data,
-            model_name="gpt-3.5-turbo",
-            cost_estimation=cost_estimation,
-        )
-        cost += call_cost
+        file_docstring, cost = packed or (None, cost)
+        if file_docstring is None:
+            file_docstring, call_cost = redact_tale_information(
+                content_type="no-code-file",
+                docs=no_code_file_data,
+                model_name="gpt-3.5-turbo",
+                cost_estimation=cost_estimation,
+            )
+            cost += call_cost
 
-        return {"file_docstring": file_docstring}, cost
+        tale = {"file_docstring": file_docstring}
+        if manifest is not None and not cost_estimation:
+            manifest.record_tale(file_path, tale)
+        return tale, cost
 
     # big_docs reduces the number of GPT-4 calls as we want to extract
     # functions/classes names, while short_docs allows GPT-4 to focus in
     # a more granular context to accurately generate the docstring for each
-    # function/class that it found.
+    # function/class that it found. Both are aligned with the declarations
+    # of the code and computed in a single pass.
     logger.info("split dev draft ideas")
-    big_docs = split_code(code, language=LANGUAGES[file_ext], chunk_size=10000)
-    short_docs = split_code(code, language=LANGUAGES[file_ext], chunk_size=3000)
-
-    logger.info("extract code elements")
-    code_elements = []
-    for idx, doc in enumerate(big_docs):
-        elements_set, call_cost = extract_code_elements(
-            big_doc=doc,
+    with span("split"):
+        big_docs, short_docs = chunk_code(
+            code, file_ext, EXTRACTION_CHUNK_TOKENS, TALE_CHUNK_TOKENS
+        )
+
+    # Get the functions/classes names without GPT when we can parse the code
+    # ourselves. In that case GPT is only needed for the docstrings and the
+    # top-level summary.
+    with span("extract"):
+        code_elements_dict = extract_local_code_elements(code, file_ext)
+    local_extraction = code_elements_dict is not None
+
+    # For a near copy of the reference, the docstrings of the declarations
+    # that did not change are reused, and only the chunks with a changed
+    # declaration are sent to GPT.
+    reused_tales = []
+    reused_names = set()
+    changed = None
+    if reference is not None and local_extraction and "classes" in reference.tale:
+        changed = changed_declarations(code, reference.code, file_ext)
+    if changed is not None:
+        logger.info(f"Reusing the docstrings of {reference.path} for {file_name}.")
+        _record_reuse(file_path, reference.path, exact=False)
+        changed_names = {declaration.name for declaration in changed}
+        reused_tale = _reused_docstrings(
+            reference.tale, code_elements_dict, changed_names
+        )
+        reused_tales.append(reused_tale)
+        # The declarations that did not change but have no docstring in the
+        # reference, e.g. as GPT skipped them, are documented as well.
+        reused_names.update(info["class_name"] for info in reused_tale["classes"])
+        reused_names.update(info["method_name"] for info in reused_tale["methods"])
+        pending_spans = [
+            own_span
+            for declaration in own_declarations(code, file_ext)
+            if declaration.name not in reused_names
+            for own_span in declaration.own_spans
+        ]
+        short_docs = [
+            doc
+            for doc in short_docs
+            if any(start < doc.end and doc.start < end for start, end in pending_spans)
+        ]
+
+    # Declarations with the same structure as one documented before, e.g.
+    # getters, setters or constructors, reuse its docstring with their own
+    # names, and the chunks with only such declarations are not sent.
+    docstring_index = get_docstring_index()
+    fingerprinted = None
+    if docstring_index is not None and local_extraction and not cost_estimation:
+        fingerprinted = fingerprint_declarations(code, file_ext)
+    if fingerprinted:
+        names = set(code_elements_dict["classes"] + code_elements_dict["methods"])
+        matched_tale = docstring_index.lookup(
+            fingerprinted, code_elements_dict, names - reused_names
+        )
+        matched_names = {info["class_name"] for info in matched_tale["classes"]}
+        matched_names.update(info["method_name"] for info in matched_tale["methods"])
+        if matched_names:
+            logger.info(
+                f"Reusing the docstrings of {len(matched_names)} declarations "
+                f"with a known structure for {file_name}."
+            )
+            reused_tales.append(matched_tale)
+            reused_names |= matched_names
+            short_docs = [
+                doc
+                for doc in short_docs
+                if not _only_reused(doc, fingerprinted, reused_names)
+            ]
+
+    # A small file is documented in a single call that returns the docstrings
+    # of its elements along with its summary, found by GPT itself when we can
+    # not parse the code.
+    code_elements_copy = {}
+    if local_extraction:
+        code_elements_copy = _pending_code_elements(code_elements_dict, reused_names)
+    if (
+        changed is None
+        and sum(doc.tokens for doc in big_docs) <= SMALL_FILE_TOKENS
+        and (code_elements_copy or not local_extraction)
+    ):
+        logger.info("create dev tale in a single call")
+        answer, cost = get_small_file_tale(
+            code=code,
+            code_elements=code_elements_copy,
             model_name="gpt-4-1106-preview",
             cost_estimation=cost_estimation,
         )
-        cost += call_cost
-        if elements_set:
-            code_elements.append(elements_set)
-
-    # Combine all the code elements extracted into a single general Dict
-    # without duplicates.
-    logger.info("prepare code elements")
-    code_elements_dict = prepare_code_elements(code_elements)
-
-    # Make a copy to keep the original dict intact.
-    code_elements_copy = copy.deepcopy(code_elements_dict)
-
-    # Clean dict copy to remove keys with empty values and the summaries
-    # of each code chunk.
-    code_elements_copy.pop("summary", None)
-    if not code_elements_copy["classes"]:
-        code_elements_copy.pop("classes", None)
-    if not code_elements_copy["methods"]:
-        code_elements_copy.pop("methods", None)
-
-    logger.info("create tale sections")
-    tales_list = []
-    # Generate a docstring for each class and function/method in the
-    # code_elements.
-    if code_elements_copy or cost_estimation:
-        for idx, doc in enumerate(short_docs):
-            tale, call_cost = get_unit_tale(
-                short_doc=doc,
-                code_elements=code_elements_copy,
-                model_name="gpt-4-1106-preview",
-                cost_estimation=cost_estimation,
+        file_docstring = answer.pop("file_docstring", None)
+        if not local_extraction:
+            code_elements_dict = _answered_code_elements(answer)
+        with span("tale"):
+            tale, errors = fuse_tales_chunks(
+                reused_tales + [answer], code, code_elements_dict
+            )
+        if fingerprinted:
+            docstring_index.update(fingerprinted, tale)
+        if errors:
+            logger.info(
+                f"We encountered errors while fusing the tale of {file_name} - "
+                f"Corrupted tales: {errors}"
             )
-            cost += call_cost
-            tales_list.append(tale)
-            logger.info(f"tale section {str(idx+1)}/{len(short_docs)} done.")
 
-    # Combine all generated docstrings JSON-formated ouputs into a single,
-    # general one.
-    logger.info("create dev tale")
-    tale, errors = fuse_tales_chunks(tales_list, code, code_elements_dict)
+        # Fall back on a summary call if the answer did not include it.
+        if not file_docstring and not cost_estimation:
+            logger.info("add dev tale summary")
+            file_docstring, call_cost = _summarize_from_tale(
+                tale, code, file_name, cost_estimation
+            )
+            cost += call_cost
 
-    # Check if we discarded some docstrings.
-    if len(errors) > 0:
-        logger.info(
-            f"We encountered errors while fusing the following \
-                    tales for {file_name} - Corrupted tales: {errors}"
+        _save_tale(
+            tale,
+            file_docstring or "",
+            code,
+            file_name,
+            output_path,
+            fuse,
+            cost_estimation,
         )
+        return tale, cost
+
+    # All the GPT calls of this file share a small pool, so the chunks are
+    # requested concurrently without letting a single huge file take every
+    # connection.
+    with ThreadPoolExecutor(max_workers=MAX_CHUNK_REQUESTS) as executor:
+        summary_future = None
+        if not local_extraction:
+            logger.info("extract code elements")
+            code_elements = []
+
+            def extract(index, doc):
+                with annotate(file=file_path, chunk=index):
+                    return extract_code_elements(
+                        big_doc=doc,
+                        model_name="gpt-4-1106-preview",
+                        cost_estimation=cost_estimation,
+                    )
 
-    # Generate a top-level docstrings using as context all the summaries we got
-    # from each big_doc code chunk output.
-    logger.info("add dev tale summary")
-    summaries = split_text(str(code_elements_dict["summary"]), chunk_size=9000)
+            extraction_results = executor.map(extract, range(len(big_docs)), big_docs)
+            for elements_set, call_cost in extraction_results:
+                cost += call_cost
+                if elements_set:
+                    code_elements.append(elements_set)
+
+            # Combine all the code elements extracted into a single general Dict
+            # without duplicates.
+            logger.info("prepare code elements")
+            code_elements_dict = prepare_code_elements(code_elements)
+
+            # Generate a top-level docstrings using as context all the summaries
+            # we got from each big_doc code chunk output. It only depends on the
+            # extraction, so it runs while the docstrings are generated and fused.
+            logger.info("add dev tale summary")
+            summary_future = executor.submit(
+                annotate(file=file_path)(redact_tale_information),
+                content_type="top-level",
+                docs=code_elements_dict["summary"],
+                model_name="gpt-3.5-turbo",
+                cost_estimation=cost_estimation,
+            )
 
-    file_docstring, call_cost = redact_tale_information(
-        content_type="top-level",
-        docs=summaries,
-        model_name="gpt-3.5-turbo",
-        cost_estimation=cost_estimation,
-    )
+        code_elements_copy = _pending_code_elements(code_elements_dict, reused_names)
+
+        logger.info("create tale sections")
+        tales_list = list(reused_tales)
+        # Generate a docstring for each class and function/method in the
+        # code_elements.
+        if code_elements_copy or cost_estimation:
+
+            def tell(index, doc):
+                with annotate(file=file_path, chunk=index):
+                    return get_unit_tale(
+                        short_doc=doc,
+                        code_elements=code_elements_copy,
+                        model_name="gpt-4-1106-preview",
+                        cost_estimation=cost_estimation,
+                    )
+
+            tale_results = executor.map(tell, range(len(short_docs)), short_docs)
+            for idx, (tale, call_cost) in enumerate(tale_results):
+                cost += call_cost
+                tales_list.append(tale)
+                logger.info(f"tale section {str(idx+1)}/{len(short_docs)} done.")
+
+        # Combine all generated docstrings JSON-formated ouputs into a single,
+        # general one.
+        logger.info("create dev tale")
+        with span("tale"):
+            tale, errors = fuse_tales_chunks(tales_list, code, code_elements_dict)
+        if fingerprinted:
+            docstring_index.update(fingerprinted, tale)
+
+        # Check if we discarded some docstrings.
+        if len(errors) > 0:
+            logger.info(
+                f"We encountered errors while fusing the following \
+                        tales for {file_name} - Corrupted tales: {errors}"
+            )
+
+    if summary_future is not None:
+        file_docstring, call_cost = summary_future.result()
+    elif changed is not None:
+        file_docstring, call_cost = reference.tale["file_docstring"], 0
+    else:
+        # Without GPT extraction we do not have chunk summaries, so we use the
+        # generated docstrings as context instead, or the code itself if the
+        # file does not define any function/class.
+        logger.info("add dev tale summary")
+        file_docstring, call_cost = _summarize_from_tale(
+            tale, code, file_name, cost_estimation
+        )
     cost += call_cost
 
+    _save_tale(
+        tale, file_docstring, code, file_name, output_path, fuse, cost_estimation
+    )
+    return tale, cost
+
+
+def _is_no_code_file(file_path):
+    """Return whether the file is a config/script file, that is summarized
+    without docstrings.
+    """
+    file_ext = os.path.splitext(file_path)[-1]
+    return not file_ext or file_ext in ALLOWED_NO_CODE_EXTENSIONS
+
+
+def _save_tale(
+    tale, file_docstring, code, file_name, output_path, fuse, cost_estimation
+):
+    """Write the tale of a code file in output_path, and the file with its
+    docstrings when fuse is True.
+    """
+    file_ext = os.path.splitext(file_name)[-1]
+    save_path = os.path.join(output_path, f"{file_name}.json")
+
     # Add the docstrings in the code file.
     if fuse and not cost_estimation:
         # add devtale label into the top-file summary.
@@ -487,10 +978,267 @@ def process_file(
 
     logger.info(f"save dev tale in: {save_path}")
     if not cost_estimation:
-        with open(save_path, "w") as json_file:
+        with span("write"), open(save_path, "w") as json_file:
             json.dump(tale, json_file, indent=2)
 
-    return tale, cost
+
+def _pending_code_elements(code_elements_dict, reused_names):
+    """Return a copy of the code elements that still need a docstring,
+    without the chunk summaries nor the empty keys.
+    """
+    code_elements_copy = {}
+    for key in ["classes", "methods"]:
+        names = [name for name in code_elements_dict[key] if name not in reused_names]
+        if names:
+            code_elements_copy[key] = names
+    return code_elements_copy
+
+
+def _answered_code_elements(answer):
+    """Return the code elements that GPT documented in the answer."""
+    return {
+        key: [
+            info.get(name_key)
+            for info in answer.get(key, [])
+            if isinstance(info, dict) and info.get(name_key)
+        ]
+        for key, name_key in [("classes", "class_name"), ("methods", "method_name")]
+    }
+
+
+def _record_reuse(file_path, reference_path, exact):
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.record_reuse(file_path, reference_path, exact)
+
+
+def _only_reused(doc, declarations, reused_names):
+    """Return whether the declarations in the chunk all have a reused
+    docstring, so that it does not need to be sent.
+    """
+    names = [
+        declaration.name
+        for declaration in declarations
+        if declaration.start < doc.end and doc.start < declaration.end
+    ]
+    return bool(names) and all(name in reused_names for name in names)
+
+
+def _reused_docstrings(reference_tale, code_elements_dict, changed_names):
+    """Return a tale with the docstrings of the reference for the elements
+    of the code that did not change, without their devtale label.
+    """
+    tale = {"classes": [], "methods": []}
+    for kind, name_key, docstring_key in [
+        ("classes", "class_name", "class_docstring"),
+        ("methods", "method_name", "method_docstring"),
+    ]:
+        for info in reference_tale.get(kind, []):
+            name = info.get(name_key)
+            if name in changed_names or name not in code_elements_dict[kind]:
+                continue
+            tale[kind].append(
+                {
+                    name_key: name,
+                    docstring_key: info[docstring_key]
+                    .replace(DOCSTRING_LABEL, "")
+                    .strip(),
+                }
+            )
+    return tale
+
+
+def _summarize_from_tale(tale, code, file_name, cost_estimation):
+    """Generate the top-level docstring of a file from its element docstrings."""
+    docstrings = [
+        class_info["class_docstring"].replace(DOCSTRING_LABEL, "").strip()
+        for class_info in tale["classes"]
+    ] + [
+        method_info["method_docstring"].replace(DOCSTRING_LABEL, "").strip()
+        for method_info in tale["methods"]
+    ]
+    if docstrings:
+        return redact_tale_information(
+            content_type="top-level",
+            docs=docstrings,
+            model_name="gpt-3.5-turbo",
+            cost_estimation=cost_estimation,
+        )
+
+    file_data = {
+        "file_name": file_name,
+        "file_content": split_text(code, chunk_size=5000)[0].page_content,
+    }
+    return redact_tale_information(
+        content_type="no-code-file",
+        docs=file_data,
+        model_name="gpt-3.5-turbo",
+        cost_estimation=cost_estimation,
+    )
+
+
+def _process_file_safely(
+    file_path,
+    output_path,
+    fuse,
+    debug,
+    cost_estimation,
+    manifest=None,
+    reference=None,
+    packed=None,
+    reference_codes=None,
+):
+    """Run process_file without letting a single failing file stop the rest
+    of the folder.
+    """
+    logger.info(f"processing {file_path}")
+    try:
+        with annotate(file=file_path):
+            return process_file(
+                file_path,
+                output_path,
+                fuse,
+                debug,
+                cost_estimation,
+                manifest,
+                reference,
+                packed,
+                reference_codes,
+            )
+    except Exception as e:
+        logger.info(f"Failed to create dev tale for {file_path} - Exception: {e}")
+        if manifest is not None:
+            manifest.record_failure(file_path)
+        return None, 0
+
+
+def _process_duplicate(process, duplicate, reference_codes, reference_result):
+    """Run the process of a duplicate file with the code and tale of its
+    reference, or without them if the reference could not be documented.
+    The code of the reference is not needed for an exact copy, but a near
+    copy goes without reference if it was not read, e.g. as it did not
+    change since the last run.
+    """
+    if reference_result is None or reference_result[0] is None:
+        return process(reference=None)
+    reference_code = reference_codes.get(duplicate.reference)
+    if reference_code is None and not duplicate.exact:
+        return process(reference=None)
+    return process(
+        reference=Reference(duplicate.reference, reference_code, reference_result[0])
+    )
+
+
+def _process_packed(process, file_path, pack_result):
+    """Run the process of a packed file with the summary that its pack got."""
+    return process(packed=pack_result.get(file_path))
+
+
+def _pack_files(file_paths, debug, manifest=None, duplicates=()):
+    """Return the packs of the small config/script files to summarize
+    together, without the exact copies, that reuse the tale of their
+    reference, nor the files that did not change since the last run.
+    """
+    if debug:
+        return []
+    skipped = {
+        file_path
+        for file_path in file_paths
+        if (file_path in duplicates and duplicates[file_path].exact)
+        or (manifest is not None and manifest.is_unchanged(file_path))
+    }
+    with span("split"):
+        return pack_no_code_files(file_paths, skipped)
+
+
+def _summarize_pack(folder_path, pack, cost_estimation):
+    """Summarize the files of the pack in a single call, and return a dict of
+    file path -> (file docstring, cost), the cost of the call being shared by
+    the files. The docstring is None for the files that the answer does not
+    cover, so that they get summarized on their own.
+    """
+    logger.info(f"summarizing {len(pack)} files of {folder_path} together")
+    try:
+        with annotate(folder=folder_path):
+            answer, cost = redact_tale_information(
+                content_type="no-code-files",
+                docs=format_pack(pack),
+                model_name="gpt-3.5-turbo-16k",
+                cost_estimation=cost_estimation,
+            )
+    except Exception as e:
+        logger.info(f"Failed to summarize the files of {folder_path} - Exception: {e}")
+        return {}
+
+    if cost_estimation:
+        summaries = {item.item_id: "" for item in pack}
+    else:
+        summaries = split_answer(answer, pack)
+    if len(summaries) < len(pack):
+        logger.info(
+            f"The answer for the pack of {folder_path} misses "
+            f"{len(pack) - len(summaries)} files, that are summarized on their own."
+        )
+    return {item.path: (summaries.get(item.item_id), cost / len(pack)) for item in pack}
+
+
+def _parse_rate_limits(values):
+    """Parse the --rate-limit values into a dict of model name -> (tokens
+    per minute, requests per minute).
+    """
+    rate_limits = {}
+    for value in values:
+        try:
+            model_name, limits = value.split("=", 1)
+            tokens_per_minute, requests_per_minute = limits.split(":", 1)
+            rate_limits[model_name.strip()] = (
+                int(tokens_per_minute),
+                int(requests_per_minute),
+            )
+        except ValueError:
+            raise click.BadParameter(
+                f"{value} is not MODEL=TOKENS_PER_MINUTE:REQUESTS_PER_MINUTE"
+            )
+    return rate_limits
+
+
+def _log_profile(profiler, profile_path=None):
+    """Log the time, GPT calls, tokens and peak memory of each stage, and
+    write the trace of the run if a path is given.
+    """
+    lines = [f"{'stage':<11}{'seconds':>9}{'spans':>7}{'calls':>7}{'tokens':>9}"]
+    if profiler.memory:
+        lines[0] += f"{'peak MB':>9}"
+    for stage, stats in profiler.report().items():
+        line = (
+            f"{stage:<11}{stats['seconds']:>9.2f}{stats['count']:>7}"
+            f"{stats['calls']:>7}{stats['tokens']:>9}"
+        )
+        if profiler.memory:
+            line += f"{stats['peak_memory'] / 1024 / 1024:>9.1f}"
+        lines.append(line)
+    logger.info("Profile of the stages:\n" + "\n".join(lines))
+    if profile_path:
+        profiler.write_trace(profile_path)
+        logger.info(f"Trace saved in {profile_path}")
+
+
+def _log_ledger(ledger, ledger_path=None, metrics_path=None):
+    """Log the summary of the GPT calls of the run and write its metrics."""
+    ledger.close()
+    if not ledger.records:
+        return
+    logger.info("GPT calls of the run:\n" + ledger.summary())
+    if ledger_path:
+        logger.info(f"Calls saved in {ledger_path}")
+    if metrics_path:
+        ledger.write_metrics(metrics_path)
+        logger.info(f"Metrics saved in {metrics_path}")
+
+
+def _is_local_url(url):
+    """Return whether the base URL points at an API served on this machine."""
+    return url is not None and urlparse(url).hostname in LOCAL_HOSTS
 
 
 @click.command()
@@ -538,7 +1286,145 @@ def process_file(
     "cost_estimation",
     is_flag=True,
     default=False,
-    help="When true, estimate the cost of openAI's API usage, without making any call.",
+    help="When true, estimate the cost of openAI's API usage, without making any call. \
+        The breakdown per file, folder and model is saved in cost_estimation.json",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=int,
+    default=1,
+    help=(
+        "Number of files, folder READMEs and pack summaries documented "
+        "concurrently. With -r, they share a single pool across the repository, "
+        "where a folder README starts as soon as its files are done. Default: 1"
+    ),
+)
+@click.option(
+    "--cache-dir",
+    "cache_dir",
+    default=DEFAULT_CACHE_DIR,
+    help="Folder where GPT answers are cached to avoid paying twice for the same \
+        prompt. Default: ~/.cache/devtale",
+)
+@click.option(
+    "--cache-size",
+    "cache_size",
+    type=int,
+    default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+    help="Maximum size of the cache folder in MB. Default: 512",
+)
+@click.option(
+    "--cache-max-age",
+    "cache_max_age",
+    type=float,
+    default=None,
+    help="Days after which an unused cached answer is no longer returned. \
+        Default: never",
+)
+@click.option(
+    "--no-cache",
+    "no_cache",
+    is_flag=True,
+    default=False,
+    help="Do not read nor write cached GPT answers.",
+)
+@click.option(
+    "--incremental",
+    "incremental",
+    is_flag=True,
+    default=False,
+    help="Only document the files that changed since the last run.",
+)
+@click.option(
+    "--since",
+    "since",
+    default=None,
+    help="Only document the files that changed since the given git reference.",
+)
+@click.option(
+    "--rate-limit",
+    "rate_limits",
+    multiple=True,
+    callback=lambda ctx, param, value: _parse_rate_limits(value),
+    help="Quota of a model as MODEL=TOKENS_PER_MINUTE:REQUESTS_PER_MINUTE, e.g. \
+        gpt-3.5-turbo=90000:3500. Can be repeated. Defaults to the tier 1 quotas.",
+)
+@click.option(
+    "--backend",
+    "backend",
+    type=click.Choice(["openai", "fake"]),
+    default="openai",
+    help="Where the prompts are sent. The fake backend answers locally with \
+        deterministic placeholder documentation, to try devtale offline. \
+        Default: openai",
+)
+@click.option(
+    "--llm-base-url",
+    "llm_base_url",
+    default=None,
+    help="Base URL of an OpenAI-compatible API to use instead of OpenAI's, e.g. \
+        http://localhost:8000/v1",
+)
+@click.option(
+    "--fake-latency",
+    "fake_latency",
+    default="constant:0",
+    help="Latency distribution of the fake backend in seconds: constant:VALUE, \
+        uniform:LOW:HIGH, exponential:MEAN or lognormal:MEDIAN:SIGMA.",
+)
+@click.option(
+    "--fake-error-rate",
+    "fake_error_rate",
+    type=float,
+    default=0.0,
+    help="Fraction of the fake backend calls that fail with a server error.",
+)
+@click.option(
+    "--fake-429-rate",
+    "fake_rate_limit_rate",
+    type=float,
+    default=0.0,
+    help="Fraction of the fake backend calls that fail with a 429 rate limit.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    default=None,
+    help="Record the stages and GPT calls of the run in a trace file, e.g. \
+        trace.json, that opens in https://ui.perfetto.dev or chrome://tracing.",
+)
+@click.option(
+    "--profile-memory",
+    "profile_memory",
+    is_flag=True,
+    default=False,
+    help="Also trace the peak memory of each stage with tracemalloc, which slows \
+        the run down.",
+)
+@click.option(
+    "--ledger",
+    "ledger_path",
+    default=None,
+    help="Append a JSON line per GPT call to this file, with its file, chunk, \
+        template, model, tokens, cost, latency, retries and cache hit or miss.",
+)
+@click.option(
+    "--metrics",
+    "metrics_path",
+    default=None,
+    help="Write the calls, tokens, cost, retries and latency of each model to \
+        this file in the OpenMetrics text format at the end of the run.",
+)
+@click.option(
+    "--no-dedup",
+    "no_dedup",
+    is_flag=True,
+    default=False,
+    help="Document the copies and near copies of a file on their own, instead \
+        of reusing its tale, and the declarations with the same structure as \
+        one documented before, e.g. getters, instead of reusing its docstring.",
 )
 def main(
     path: str,
@@ -547,48 +1433,128 @@ def main(
     output_path: str = DEFAULT_OUTPUT_PATH,
     debug: bool = False,
     cost_estimation: bool = False,
+    jobs: int = 1,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    cache_size: int = DEFAULT_CACHE_SIZE // (1024 * 1024),
+    cache_max_age: float = None,
+    no_cache: bool = False,
+    incremental: bool = False,
+    since: str = None,
+    rate_limits: dict = None,
+    backend: str = "openai",
+    llm_base_url: str = None,
+    fake_latency: str = "constant:0",
+    fake_error_rate: float = 0.0,
+    fake_rate_limit_rate: float = 0.0,
+    profile_path: str = None,
+    profile_memory: bool = False,
+    ledger_path: str = None,
+    metrics_path: str = None,
+    no_dedup: bool = False,
 ):
     load_dotenv(find_dotenv(usecwd=True))
 
-    if not os.environ.get("OPENAI_API_KEY"):
-        os.environ["OPENAI_API_KEY"] = getpass.getpass(
-            prompt="Enter your OpenAI API key: "
+    # The estimation is fully offline, so it does not need an API key.
+    if cost_estimation and os.path.exists(path):
+        report = estimate_documentation_cost(path, recursive, jobs)
+        os.makedirs(output_path, exist_ok=True)
+        report_path = os.path.join(output_path, "cost_estimation.json")
+        with open(report_path, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+        logger.info(f"Cost breakdown saved in {report_path}")
+        logger.info(f"Approximate cost: ${report['total']['cost']:.5f} USD")
+        return
+
+    if not no_cache:
+        configure_cache(
+            cache_dir,
+            max_size=cache_size * 1024 * 1024,
+            max_age=cache_max_age * 24 * 3600 if cache_max_age is not None else None,
         )
+    configure_rate_limits(rate_limits)
 
-    if os.path.isdir(path):
-        if recursive:
-            logger.info("Processing repository")
-            price = process_repository(
-                root_path=path,
-                output_path=output_path,
-                fuse=fuse,
-                debug=debug,
-                cost_estimation=cost_estimation,
+    if backend == "fake":
+        try:
+            configure_backend(
+                FakeBackend(
+                    latency=fake_latency,
+                    error_rate=fake_error_rate,
+                    rate_limit_rate=fake_rate_limit_rate,
+                )
             )
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--fake-latency")
+    else:
+        configure_backend(OpenAIBackend(base_url=llm_base_url))
+
+    if backend == "openai" and not os.environ.get("OPENAI_API_KEY"):
+        if _is_local_url(llm_base_url):
+            # A local server, e.g. the fake one, does not check the key, but
+            # the OpenAI client refuses to send a request without one.
+            os.environ["OPENAI_API_KEY"] = "local"
         else:
-            logger.info("Processing folder")
-            _, _, price = process_folder(
-                folder_path=path,
-                output_path=output_path,
-                fuse=fuse,
-                debug=debug,
-                cost_estimation=cost_estimation,
+            os.environ["OPENAI_API_KEY"] = getpass.getpass(
+                prompt="Enter your OpenAI API key: "
             )
-    elif os.path.isfile(path):
-        logger.info("Processing file")
-        _, price = process_file(
-            file_path=path,
-            output_path=output_path,
-            fuse=fuse,
-            debug=debug,
-            cost_estimation=cost_estimation,
-        )
 
-    else:
-        raise f"Invalid input path {path}. Path must be a directory or code file."
+    ledger = None
+    if not cost_estimation and not debug:
+        ledger = configure_ledger(ledger_path)
+        if not no_dedup:
+            configure_docstring_index(get_cache())
+    if profile_path or profile_memory:
+        enable_profiling(memory=profile_memory, trace=bool(profile_path))
+    try:
+        if os.path.isdir(path):
+            if recursive:
+                logger.info("Processing repository")
+                price = process_repository(
+                    root_path=path,
+                    output_path=output_path,
+                    fuse=fuse,
+                    debug=debug,
+                    cost_estimation=cost_estimation,
+                    jobs=jobs,
+                    incremental=incremental,
+                    since=since,
+                    dedup=not no_dedup,
+                )
+            else:
+                logger.info("Processing folder")
+                _, _, price = process_folder(
+                    folder_path=path,
+                    output_path=output_path,
+                    fuse=fuse,
+                    debug=debug,
+                    cost_estimation=cost_estimation,
+                    jobs=jobs,
+                    incremental=incremental,
+                    since=since,
+                )
+        elif os.path.isfile(path):
+            logger.info("Processing file")
+            with annotate(file=path):
+                _, price = process_file(
+                    file_path=path,
+                    output_path=output_path,
+                    fuse=fuse,
+                    debug=debug,
+                    cost_estimation=cost_estimation,
+                )
+
+        else:
+            raise f"Invalid input path {path}. Path must be a directory or code file."
+    finally:
+        profiler = disable_profiling()
+        if profiler is not None:
+            _log_profile(profiler, profile_path)
+        if ledger is not None:
+            _log_ledger(ledger, ledger_path, metrics_path)
 
     if cost_estimation:
         logger.info(f"Approximate cost: ${price:.5f} USD")
+    elif ledger is not None:
+        logger.info(f"Total cost: ${ledger.total_cost():.5f} USD")
     else:
         logger.info(f"Total cost: ${price:.5f} USD")
 
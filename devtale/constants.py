@@ -16,9 +16,79 @@ LANGUAGES = {
 
 DOCSTRING_LABEL = "@DEVTALE-GENERATED:"
 
+# maximum number of tokens of code sent in each GPT call of a code file. The
+# extraction answer is short, so it gets big chunks, while the docstrings
+# answer grows with the code and must fit in the 4096 output tokens of
+# gpt-4-1106-preview.
+EXTRACTION_CHUNK_TOKENS = 4000
+TALE_CHUNK_TOKENS = 1000
+
+# files of at most this many tokens of code are documented in a single GPT
+# call, that returns their docstrings and their summary together
+SMALL_FILE_TOKENS = 1000
+
+# config/script files of at most PACK_ITEM_TOKENS tokens are summarized
+# together, up to PACK_TOKENS tokens and PACK_MAX_ITEMS files per GPT call
+PACK_ITEM_TOKENS = 500
+PACK_TOKENS = 6000
+PACK_MAX_ITEMS = 30
+
+# maximum number of GPT calls that a single file can have in flight at once
+MAX_CHUNK_REQUESTS = 4
+
+# context window of each model, prompt and answer included. The file, folder
+# and root summaries split their input in chunks that fit in it, keeping
+# SUMMARY_ANSWER_TOKENS for the answer, and merge the chunk summaries until
+# they fit in a single call, asking for shorter ones if they do not shrink.
+CONTEXT_TOKENS = {
+    "gpt-4-1106-preview": 128000,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-3.5-turbo": 4096,
+}
+SUMMARY_ANSWER_TOKENS = 1000
+
+# maximum number of keep-alive connections shared by all the GPT calls
+HTTP_POOL_SIZE = 32
+
 # Extracted from https://openai.com/pricing on January 15th, 2024.
 GPT_PRICE = {
     "gpt-4-1106-preview": 0.01,
     "gpt-3.5-turbo-16k": 0.0010,
     "gpt-3.5-turbo": 0.0010,
 }
+
+# Quota of each model as (tokens per minute, requests per minute), see
+# https://platform.openai.com/account/limits. They can be changed with the
+# --rate-limit option.
+RATE_LIMITS = {
+    "gpt-4-1106-preview": (150000, 500),
+    "gpt-3.5-turbo-16k": (60000, 3500),
+    "gpt-3.5-turbo": (60000, 3500),
+}
+
+# fraction of the quota that we use, to stay just under it
+RATE_LIMIT_HEADROOM = 0.95
+
+# output tokens charged up front for each GPT call, until its real usage is
+# known
+EXPECTED_COMPLETION_TOKENS = 500
+
+# retries of a GPT call that was rate limited or failed temporarily, with a
+# jittered exponential backoff between RETRY_BASE_DELAY and RETRY_MAX_DELAY
+# seconds
+MAX_RETRIES = 8
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 60
+
+# near-duplicate files are found with MinHash signatures of their shingles of
+# SHINGLE_SIZE tokens, indexed by LSH in bands of rows = permutations / bands.
+# Files whose estimated Jaccard similarity reaches the threshold reuse the
+# docstrings of the declarations they share.
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# declarations of at most this many tokens reuse the docstring of a
+# declaration with the same structure, e.g. getters, setters or constructors
+FINGERPRINT_MAX_TOKENS = 300
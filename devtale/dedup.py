@@ -0,0 +1,271 @@
+import ast
+import hashlib
+import os
+import re
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from devtale.constants import (
+    LSH_BANDS,
+    MINHASH_PERMUTATIONS,
+    NEAR_DUPLICATE_THRESHOLD,
+    SHINGLE_SIZE,
+)
+from devtale.scanner import SCANNER_LANGUAGES, scan_declarations
+
+# The reference of a duplicate file: the file documented before it that it
+# copies (exact) or nearly copies, with their estimated similarity, which
+# can reach 1 for a near copy too.
+Duplicate = namedtuple("Duplicate", ["reference", "similarity", "exact"])
+
+# The code and tale of the reference of a duplicate, once documented. code is
+# None for the reference of an exact copy that was not read, e.g. as it did
+# not change since the last run.
+Reference = namedtuple("Reference", ["path", "code", "tale"])
+
+# A declaration of a file. own_spans are its (start, end) offsets without
+# the declarations nested in it, and own_text the code of these spans.
+OwnDeclaration = namedtuple("OwnDeclaration", ["name", "own_spans", "own_text"])
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Files whose shingles are hashed at once, and shingles permuted at once.
+# The (permutations, shingles) uint64 matrix is computed in place, in a
+# single buffer of 16 MB for the default 128 permutations.
+FILES_PER_BATCH = 256
+SHINGLES_PER_BATCH = 1 << 14
+
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """Compute the MinHash signatures of sets of 64-bit shingle hashes, with
+    multiply-shift hash functions standing for the random permutations.
+    """
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=0):
+        generator = np.random.default_rng(seed)
+        self.permutations = permutations
+        # Odd multipliers make a * x + b a bijection modulo 2**64.
+        self._a = generator.integers(0, 2**63, permutations, dtype=np.uint64)
+        self._a = self._a * np.uint64(2) + np.uint64(1)
+        self._b = generator.integers(0, 2**63, permutations, dtype=np.uint64)
+
+    def signatures(self, shingle_sets):
+        """Return a (sets, permutations) uint32 array of the signatures of
+        the shingle_sets. Empty sets get a signature of 0xFFFFFFFF values.
+        """
+        signatures = np.full(
+            (len(shingle_sets), self.permutations), _MAX_HASH, dtype=np.uint64
+        )
+        lengths = np.array([len(shingles) for shingles in shingle_sets])
+        if not lengths.sum():
+            return signatures.astype(np.uint32)
+
+        values = np.concatenate(shingle_sets)
+        owners = np.repeat(np.arange(len(shingle_sets)), lengths)
+        buffer = np.empty(
+            (self.permutations, min(len(values), SHINGLES_PER_BATCH)), dtype=np.uint64
+        )
+        for start in range(0, len(values), SHINGLES_PER_BATCH):
+            batch = values[start : start + SHINGLES_PER_BATCH]
+            batch_owners = owners[start : start + SHINGLES_PER_BATCH]
+            permuted = buffer[:, : len(batch)]
+            np.multiply(self._a[:, None], batch[None, :], out=permuted)
+            np.add(permuted, self._b[:, None], out=permuted)
+            np.right_shift(permuted, np.uint64(32), out=permuted)
+            # The shingles of a set are contiguous, so each run of the same
+            # owner is reduced to its minimum.
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(batch_owners)) + 1))
+            minima = np.minimum.reduceat(permuted, starts, axis=1)
+            rows = batch_owners[starts]
+            signatures[rows] = np.minimum(signatures[rows], minima.T)
+        return signatures.astype(np.uint32)
+
+
+class LSHIndex:
+    """Index signatures by bands of rows, so that a query only returns the
+    keys that share at least a band with it, i.e. that are likely similar.
+    """
+
+    def __init__(self, bands=LSH_BANDS, permutations=MINHASH_PERMUTATIONS):
+        self.bands = bands
+        self.rows = permutations // bands
+        self._buckets = {}
+
+    def add(self, key, signature, namespace=""):
+        for bucket in self._bucket_keys(signature, namespace):
+            self._buckets.setdefault(bucket, []).append(key)
+
+    def query(self, signature, namespace=""):
+        candidates = {}
+        for bucket in self._bucket_keys(signature, namespace):
+            for key in self._buckets.get(bucket, []):
+                candidates[key] = None
+        return list(candidates)
+
+    def _bucket_keys(self, signature, namespace):
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            yield namespace, band, rows.tobytes()
+
+
+def shingle_hashes(code, size=SHINGLE_SIZE):
+    """Return the sorted unique hashes of the shingles of size consecutive
+    tokens of the code.
+    """
+    tokens = _TOKEN.findall(code)
+    if len(tokens) < size:
+        return np.empty(0, dtype=np.uint64)
+    # crc32 instead of hash() keeps the results the same from run to run.
+    token_hashes = np.fromiter(
+        (zlib.crc32(token.encode("utf-8")) for token in tokens),
+        dtype=np.uint64,
+        count=len(tokens),
+    )
+    count = len(tokens) - size + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        shingles = shingles * np.uint64(1099511628211) + token_hashes[offset:][:count]
+    return np.unique(shingles)
+
+
+def find_duplicates(paths, threshold=NEAR_DUPLICATE_THRESHOLD, digests=None):
+    """Find the files of paths that copy, or nearly copy, a file that comes
+    before them, and return a dict of path -> Duplicate.
+
+    Exact copies are found by content hash. The others are compared by the
+    MinHash signatures of their shingles, computed in batches, and looked up
+    in an LSH index of the files that are not duplicates themselves, among
+    the files with the same extension. The most similar candidate whose
+    estimated similarity reaches the threshold becomes the reference.
+
+    digests is a dict of path -> known sha256 hex digest, e.g. of the files
+    that did not change since the last run. These files are not read: they
+    are only the references of the exact copies of their digest.
+    """
+    digests = digests or {}
+    hasher = MinHasher()
+    index = LSHIndex()
+    by_digest = {}
+    signatures = {}
+    duplicates = {}
+    for start in range(0, len(paths), FILES_PER_BATCH):
+        batch = []
+        for path in paths[start : start + FILES_PER_BATCH]:
+            if path in digests:
+                digest = (os.path.splitext(path)[1], bytes.fromhex(digests[path]))
+                by_digest.setdefault(digest, path)
+                continue
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+            except OSError:
+                continue
+            # Copies in another language are documented differently.
+            digest = (os.path.splitext(path)[1], hashlib.sha256(data).digest())
+            if digest in by_digest:
+                duplicates[path] = Duplicate(by_digest[digest], 1.0, True)
+                continue
+            by_digest[digest] = path
+            batch.append((path, data.decode("utf-8", errors="replace")))
+
+        shingle_sets = [shingle_hashes(code) for _, code in batch]
+        batch_signatures = hasher.signatures(shingle_sets)
+        for (path, _), shingles, signature in zip(
+            batch, shingle_sets, batch_signatures
+        ):
+            if not len(shingles):
+                continue
+            extension = os.path.splitext(path)[1]
+            best, best_similarity = None, threshold
+            for candidate in index.query(signature, extension):
+                similarity = float(np.mean(signatures[candidate] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is not None:
+                duplicates[path] = Duplicate(best, best_similarity, False)
+            else:
+                signatures[path] = signature
+                index.add(path, signature, extension)
+    return duplicates
+
+
+def own_declarations(code, file_ext):
+    """Return the OwnDeclaration of each class and function of the code, or
+    None if the language is not supported or the code can not be parsed.
+    """
+    spans = _declaration_spans(code, file_ext)
+    if spans is None:
+        return None
+
+    # Sorted so that a declaration comes before the ones nested in it.
+    spans.sort(key=lambda span: (span[1], -span[2]))
+    declarations = []
+    for position, (name, start, end) in enumerate(spans):
+        own_spans = []
+        cursor = start
+        for _, child_start, child_end in spans[position + 1 :]:
+            if child_start >= end:
+                break
+            if child_start < cursor:
+                continue
+            own_spans.append((cursor, child_start))
+            cursor = child_end
+        own_spans.append((cursor, end))
+        own_text = " ".join(
+            " ".join(code[first:last].split()) for first, last in own_spans
+        )
+        declarations.append(OwnDeclaration(name, own_spans, own_text))
+    return declarations
+
+
+def changed_declarations(code, reference_code, file_ext):
+    """Return the declarations of the code whose own text differs from the
+    declarations of the same name in the reference code, or None if they
+    can not be compared.
+    """
+    declarations = own_declarations(code, file_ext)
+    reference_declarations = own_declarations(reference_code, file_ext)
+    if declarations is None or reference_declarations is None:
+        return None
+
+    reference_texts = {}
+    for declaration in reference_declarations:
+        reference_texts.setdefault(declaration.name, set()).add(declaration.own_text)
+    texts = {}
+    for declaration in declarations:
+        texts.setdefault(declaration.name, set()).add(declaration.own_text)
+    return [
+        declaration
+        for declaration in declarations
+        if texts[declaration.name] != reference_texts.get(declaration.name)
+    ]
+
+
+def _declaration_spans(code, file_ext):
+    if file_ext == ".py":
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return None
+        line_starts = [0] + [match.end() for match in re.finditer("\n", code)]
+        line_starts.append(len(code))
+        spans = []
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                first = min(
+                    [node.lineno]
+                    + [decorator.lineno for decorator in node.decorator_list]
+                )
+                last = min(node.end_lineno, len(line_starts) - 1)
+                spans.append((node.name, line_starts[first - 1], line_starts[last]))
+        return spans
+    if file_ext in SCANNER_LANGUAGES:
+        return [
+            (declaration.name, declaration.start, declaration.end)
+            for declaration in scan_declarations(code, file_ext)
+        ]
+    return None
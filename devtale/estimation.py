@@ -0,0 +1,170 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from devtale.chunker import chunk_code
+from devtale.constants import (
+    ALLOWED_NO_CODE_EXTENSIONS,
+    EXTRACTION_CHUNK_TOKENS,
+    GPT_PRICE,
+    SMALL_FILE_TOKENS,
+    TALE_CHUNK_TOKENS,
+)
+from devtale.extractors import extract_local_code_elements
+from devtale.packer import format_pack, pack_no_code_files
+from devtale.utils import _get_encoding, _get_prompt, count_tokens, split_text
+
+# Models used by each GPT call of the pipeline, see devtale.cli.
+EXTRACTION_MODEL = "gpt-4-1106-preview"
+TALE_MODEL = "gpt-4-1106-preview"
+SUMMARY_MODEL = "gpt-3.5-turbo"
+README_MODEL = "gpt-3.5-turbo-16k"
+
+
+def estimate_cost(
+    root_path, folders, include_folders=True, include_root=True, jobs=None
+):
+    """Estimate offline the GPT calls, input tokens and cost of documenting
+    the given folders, a dict of folder path -> list of file paths.
+
+    The prompts of every file are built and token-counted across a pool of
+    processes. As in the online pipeline, the prompts that depend on GPT
+    answers (folder and root READMEs) are counted without those answers, and
+    output tokens are not included.
+
+    Returns a JSON-serializable breakdown per file, per folder and per model.
+    """
+    file_paths = [file_path for paths in folders.values() for file_path in paths]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_get_encoding) as executor:
+        file_calls = dict(
+            zip(
+                file_paths,
+                executor.map(_estimate_file, file_paths, chunksize=16),
+            )
+        )
+
+    report = {
+        "total": _empty_entry(),
+        "models": defaultdict(_empty_entry),
+        "folders": {},
+        "files": {},
+    }
+
+    for folder_path, paths in folders.items():
+        folder_name = os.path.relpath(folder_path, root_path)
+        folder_entry = _empty_entry()
+        # The small config/script files are summarized in packs, whose calls
+        # count for the folder.
+        packed_paths = set()
+        for pack in pack_no_code_files(paths):
+            prompt = _get_prompt("no-code-files").format(information=format_pack(pack))
+            _add_call(report, README_MODEL, count_tokens(prompt), folder_entry)
+            packed_paths.update(item.path for item in pack)
+        for file_path in paths:
+            file_entry = _empty_entry()
+            if file_path not in packed_paths:
+                for model, tokens in file_calls[file_path]:
+                    _add_call(report, model, tokens, file_entry, folder_entry)
+            report["files"][os.path.relpath(file_path, root_path)] = file_entry
+
+        if paths and include_folders:
+            for template_type in ["folder-level", "folder-description"]:
+                tokens = count_tokens(_get_prompt(template_type).format(information=""))
+                _add_call(report, README_MODEL, tokens, folder_entry)
+        report["folders"][folder_name] = folder_entry
+
+    if include_root:
+        tokens = count_tokens(_get_prompt("root-level").format(information=""))
+        report["root"] = _empty_entry()
+        _add_call(report, README_MODEL, tokens, report["root"])
+
+    report["models"] = dict(report["models"])
+    return report
+
+
+def _estimate_file(file_path):
+    """Return the (model, input tokens) of each GPT call needed to document
+    the file, mirroring devtale.cli.process_file.
+    """
+    try:
+        with open(file_path, "r") as file:
+            code = file.read()
+    except (OSError, UnicodeDecodeError):
+        return []
+    if not code:
+        return []
+
+    file_name = os.path.basename(file_path)
+    file_ext = os.path.splitext(file_name)[-1]
+
+    if not file_ext or file_ext in ALLOWED_NO_CODE_EXTENSIONS:
+        return [_no_code_file_call(file_name, code)]
+
+    calls = []
+    big_docs, short_docs = chunk_code(
+        code, file_ext, EXTRACTION_CHUNK_TOKENS, TALE_CHUNK_TOKENS
+    )
+    code_elements = extract_local_code_elements(code, file_ext)
+    local_extraction = code_elements is not None
+    if local_extraction:
+        code_elements = {
+            key: value
+            for key, value in code_elements.items()
+            if key != "summary" and value
+        }
+
+    # A small file takes a single call for its docstrings and its summary.
+    if sum(doc.tokens for doc in big_docs) <= SMALL_FILE_TOKENS and (
+        code_elements or not local_extraction
+    ):
+        prompt = _get_prompt("small-file").format(
+            code=code, code_elements=str(code_elements or {})
+        )
+        return [(TALE_MODEL, count_tokens(prompt))]
+
+    if not local_extraction:
+        code_elements = {}
+        for doc in big_docs:
+            prompt = _get_prompt("code-extractor").format(code=doc.page_content)
+            calls.append((EXTRACTION_MODEL, count_tokens(prompt)))
+
+    # A parsed file without functions/classes does not need docstrings, and
+    # is summarized from its code.
+    if local_extraction and not code_elements:
+        return [_no_code_file_call(file_name, code)]
+    for doc in short_docs:
+        prompt = _get_prompt("code-level").format(
+            code=doc.page_content, code_elements=str(code_elements)
+        )
+        calls.append((TALE_MODEL, count_tokens(prompt)))
+
+    # A single docstring or chunk summary is the file summary itself.
+    if local_extraction:
+        summaries = sum(len(names) for names in code_elements.values())
+    else:
+        summaries = len(big_docs)
+    if summaries != 1:
+        prompt = _get_prompt("top-level").format(information=str([]))
+        calls.append((SUMMARY_MODEL, count_tokens(prompt)))
+    return calls
+
+
+def _no_code_file_call(file_name, code):
+    no_code_file_data = {
+        "file_name": file_name,
+        "file_content": split_text(code, chunk_size=5000)[0].page_content,
+    }
+    prompt = _get_prompt("no-code-file").format(information=str(no_code_file_data))
+    return SUMMARY_MODEL, count_tokens(prompt)
+
+
+def _empty_entry():
+    return {"calls": 0, "input_tokens": 0, "cost": 0.0}
+
+
+def _add_call(report, model, tokens, *entries):
+    cost = (tokens / 1000) * GPT_PRICE[model]
+    for entry in [report["total"], report["models"][model], *entries]:
+        entry["calls"] += 1
+        entry["input_tokens"] += tokens
+        entry["cost"] += cost
@@ -0,0 +1,55 @@
+import ast
+
+from devtale.scanner import CLASS_KINDS, SCANNER_LANGUAGES, scan_declarations
+
+
+def extract_local_code_elements(code, file_ext):
+    """Extract the classes and methods defined in the code without any GPT
+    call. It returns a dict with the same keys as prepare_code_elements, or
+    None if the language is not supported or the code can not be parsed, in
+    which case GPT must be used instead.
+    """
+    if file_ext == ".py":
+        return extract_python_elements(code)
+    if file_ext in SCANNER_LANGUAGES:
+        return extract_scanned_elements(code, file_ext)
+    return None
+
+
+def extract_python_elements(code):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    classes = []
+    methods = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef):
+            classes.append(node.name)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            methods.append(node.name)
+
+    # remove duplicates
+    return {
+        "classes": list(dict.fromkeys(classes)),
+        "methods": list(dict.fromkeys(methods)),
+        "summary": [],
+    }
+
+
+def extract_scanned_elements(code, file_ext):
+    classes = []
+    methods = []
+    for declaration in scan_declarations(code, file_ext):
+        if declaration.kind in CLASS_KINDS:
+            classes.append(declaration.name)
+        else:
+            methods.append(declaration.name)
+
+    # remove duplicates
+    return {
+        "classes": list(dict.fromkeys(classes)),
+        "methods": list(dict.fromkeys(methods)),
+        "summary": [],
+    }
@@ -0,0 +1,140 @@
+"""Serve the fake backend as an OpenAI-compatible chat completions API on
+localhost, to load-test devtale end to end, HTTP client included:
+
+    python -m devtale.fake_server --port 8000 --latency lognormal:2:0.5
+    devtale -r -p . --llm-base-url http://localhost:8000/v1
+"""
+import json
+import logging
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+import openai
+
+from devtale.backends import FakeBackend
+
+logger = logging.getLogger(__name__)
+
+
+def make_handler(backend):
+    class FakeCompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, _error("Not found", "invalid_request_error"))
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            model_name = body.get("model", "")
+            prompt = "\n".join(
+                message.get("content", "") for message in body.get("messages", [])
+            )
+            try:
+                completion = backend.complete(model_name, prompt)
+            except openai.error.RateLimitError as e:
+                self._send(429, _error(str(e), "rate_limit_exceeded"))
+                return
+            except openai.error.OpenAIError as e:
+                self._send(500, _error(str(e), "server_error"))
+                return
+
+            self._send(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model_name,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": completion.text,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": completion.prompt_tokens,
+                        "completion_tokens": completion.completion_tokens,
+                        "total_tokens": completion.prompt_tokens
+                        + completion.completion_tokens,
+                    },
+                },
+            )
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return FakeCompletionsHandler
+
+
+def _error(message, code):
+    return {"error": {"message": message, "type": code, "code": code}}
+
+
+def serve(backend, host="127.0.0.1", port=8000):
+    """Serve the backend until interrupted. Each request runs in its own
+    thread, so the latency of concurrent requests overlaps like with a real
+    API.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    logger.info(f"Fake OpenAI API listening on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+@click.command()
+@click.option("--host", "host", default="127.0.0.1", help="Default: 127.0.0.1")
+@click.option("--port", "port", type=int, default=8000, help="Default: 8000")
+@click.option(
+    "--latency",
+    "latency",
+    default="constant:0",
+    help="Latency distribution in seconds: constant:VALUE, uniform:LOW:HIGH, \
+        exponential:MEAN or lognormal:MEDIAN:SIGMA.",
+)
+@click.option(
+    "--seconds-per-token",
+    "seconds_per_token",
+    type=float,
+    default=0.0,
+    help="Latency added per answer token.",
+)
+@click.option(
+    "--error-rate",
+    "error_rate",
+    type=float,
+    default=0.0,
+    help="Fraction of the requests that fail with a server error.",
+)
+@click.option(
+    "--429-rate",
+    "rate_limit_rate",
+    type=float,
+    default=0.0,
+    help="Fraction of the requests that fail with a 429 rate limit.",
+)
+@click.option("--seed", "seed", type=int, default=0, help="Default: 0")
+def main(host, port, latency, seconds_per_token, error_rate, rate_limit_rate, seed):
+    logging.basicConfig(level=logging.INFO)
+    backend = FakeBackend(latency, seconds_per_token, error_rate, rate_limit_rate, seed)
+    serve(backend, host, port)
+
+
+if __name__ == "__main__":
+    main()
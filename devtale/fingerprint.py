@@ -0,0 +1,452 @@
+import ast
+import hashlib
+import json
+import re
+import threading
+from collections import namedtuple
+
+from devtale.constants import DOCSTRING_LABEL, FINGERPRINT_MAX_TOKENS
+from devtale.scanner import SCANNER_LANGUAGES, scan_declarations
+
+# A declaration with the hash of its structure, and the identifiers that
+# were abstracted away from it, in order of first appearance.
+FingerprintedDeclaration = namedtuple(
+    "FingerprintedDeclaration",
+    ["name", "start", "end", "fingerprint", "identifiers"],
+)
+
+# Fields of the Python AST nodes that hold a name that the code binds, e.g.
+# a parameter, as opposed to the attributes, modules or keyword arguments.
+_BINDING_FIELDS = {"name", "id", "arg", "rest"}
+_NOT_BINDING_NODES = (ast.alias, ast.keyword)
+
+# The tokens of the scanned languages: their comments, which are skipped,
+# their strings, kept whole, and the rest. Only PHP has # comments.
+_STRING = r"""(?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`)"""
+_TOKEN = re.compile(r"[A-Za-z_$][\w$]*|\d[\w.]*|\S")
+_LEXEME = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)|" + _STRING + "|" + _TOKEN.pattern, re.DOTALL
+)
+_PHP_LEXEME = re.compile(
+    r"(?P<comment>//[^\n]*|\#(?!\[)[^\n]*|/\*.*?\*/)|" + _STRING + "|" + _TOKEN.pattern,
+    re.DOTALL,
+)
+
+# Keywords of Go, JavaScript/TypeScript and PHP, kept as they are in the
+# token stream since they carry the structure of the code.
+_KEYWORDS = set(
+    """
+    abstract as async await break case catch chan class const continue default defer
+    delete do else enum export extends false final finally fn for foreach func
+    function go goto if implements import in instanceof interface let map match
+    new nil null package private protected public range readonly return select
+    self static struct super switch this throw trait true try type typeof var
+    void while yield
+    """.split()
+)
+
+# The PHP variables that are not local to a function.
+_PHP_GLOBALS = {
+    "$this",
+    "$GLOBALS",
+    "$_SERVER",
+    "$_GET",
+    "$_POST",
+    "$_FILES",
+    "$_COOKIE",
+    "$_SESSION",
+    "$_REQUEST",
+    "$_ENV",
+}
+
+# Keywords of Go and JavaScript/TypeScript followed by the name they bind.
+_BINDING_KEYWORDS = {"let", "const", "var", "function", "class"}
+
+_index = None
+
+
+class DocstringIndex:
+    """Map the structural fingerprint of a declaration to the docstring that
+    GPT generated for it, so that declarations with the same structure, e.g.
+    getters, setters or constructors, reuse it with their own names.
+
+    The index lives in memory for the run, and in the LLM cache when one is
+    given, so that it persists from one run to the next.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        """Return the (identifiers, docstring) of the fingerprint, or None."""
+        with self._lock:
+            entry = self._memory.get(fingerprint)
+        if entry is None and self.cache is not None:
+            value = self.cache.get(self._key(fingerprint))
+            if value is not None:
+                entry = json.loads(value)
+                with self._lock:
+                    self._memory[fingerprint] = entry
+        if entry is None:
+            return None
+        return entry["identifiers"], entry["docstring"]
+
+    def add(self, fingerprint, identifiers, docstring):
+        entry = {"identifiers": identifiers, "docstring": docstring}
+        with self._lock:
+            if fingerprint in self._memory:
+                return
+            self._memory[fingerprint] = entry
+        if self.cache is not None:
+            self.cache.set(self._key(fingerprint), json.dumps(entry))
+
+    def lookup(self, declarations, code_elements_dict, names):
+        """Return a tale with a docstring for each of the names whose
+        declaration matches one of the index, with its names substituted.
+        """
+        tale = {"classes": [], "methods": []}
+        found = set()
+        for declaration in declarations:
+            if declaration.fingerprint is None:
+                continue
+            if declaration.name not in names or declaration.name in found:
+                continue
+            match = self.get(declaration.fingerprint)
+            if match is None:
+                continue
+            identifiers, docstring = match
+            docstring = substitute_names(
+                docstring, identifiers, declaration.identifiers
+            )
+            found.add(declaration.name)
+            if declaration.name in code_elements_dict["classes"]:
+                tale["classes"].append(
+                    {"class_name": declaration.name, "class_docstring": docstring}
+                )
+            else:
+                tale["methods"].append(
+                    {"method_name": declaration.name, "method_docstring": docstring}
+                )
+        return tale
+
+    def update(self, declarations, tale):
+        """Add the docstrings of the tale to the index, under the fingerprint
+        of the first declaration of each name.
+        """
+        docstrings = {}
+        for info in tale.get("classes", []):
+            docstrings[info["class_name"]] = info["class_docstring"]
+        for info in tale.get("methods", []):
+            docstrings[info["method_name"]] = info["method_docstring"]
+        seen = set()
+        for declaration in declarations:
+            if declaration.fingerprint is None:
+                continue
+            if declaration.name in seen or declaration.name not in docstrings:
+                continue
+            seen.add(declaration.name)
+            docstring = docstrings[declaration.name].replace(DOCSTRING_LABEL, "")
+            self.add(
+                declaration.fingerprint, declaration.identifiers, docstring.strip()
+            )
+
+    def _key(self, fingerprint):
+        return self.cache.make_key("docstring-index", fingerprint)
+
+
+def fingerprint_declarations(code, file_ext, max_tokens=FINGERPRINT_MAX_TOKENS):
+    """Return a FingerprintedDeclaration for each class and function of the
+    code, or None if the language is not supported or the code can not be
+    parsed. Declarations of more than max_tokens tokens get no fingerprint.
+
+    The fingerprint hashes the structure of the declaration without its
+    docstrings and comments: the Python AST, or the token stream of the
+    other languages. Only the names that the declaration binds, i.e. its own
+    name, its parameters and its locals, are replaced by their order of
+    appearance. The functions it calls, the attributes, modules and
+    literals it uses are kept, so that declarations share a fingerprint only
+    if they do the same thing.
+    """
+    if file_ext == ".py":
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return None
+        line_starts = [0] + [match.end() for match in re.finditer("\n", code)]
+        line_starts.append(len(code))
+        declarations = []
+        for node in ast.walk(tree):
+            if not isinstance(
+                node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+            ):
+                continue
+            first = min(
+                [node.lineno] + [decorator.lineno for decorator in node.decorator_list]
+            )
+            start = line_starts[first - 1]
+            end = line_starts[min(node.end_lineno, len(line_starts) - 1)]
+            fingerprint, names = None, {}
+            if len(_TOKEN.findall(code, start, end)) <= max_tokens:
+                parts = []
+                _serialize(node, _python_bound_names(node), names, parts)
+                fingerprint = _hash(parts)
+            declarations.append(
+                FingerprintedDeclaration(
+                    node.name, start, end, fingerprint, list(names)
+                )
+            )
+        return declarations
+
+    if file_ext not in SCANNER_LANGUAGES:
+        return None
+    lexeme = _PHP_LEXEME if file_ext == ".php" else _LEXEME
+    declarations = []
+    for declaration in scan_declarations(code, file_ext):
+        tokens = [
+            match.group()
+            for match in lexeme.finditer(code, declaration.start, declaration.end)
+            if match.lastgroup != "comment"
+        ]
+        fingerprint, names = None, {}
+        if len(tokens) <= max_tokens:
+            bound = _bound_tokens(tokens, declaration, file_ext)
+            parts = [file_ext]
+            for position, token in enumerate(tokens):
+                if token in bound and not _is_member(tokens, position, file_ext):
+                    parts.append(names.setdefault(token, f"#{len(names)}"))
+                else:
+                    parts.append(token)
+            fingerprint = _hash(parts)
+        declarations.append(
+            FingerprintedDeclaration(
+                declaration.name,
+                declaration.start,
+                declaration.end,
+                fingerprint,
+                list(names),
+            )
+        )
+    return declarations
+
+
+def substitute_names(docstring, identifiers, new_identifiers):
+    """Replace in the docstring each identifier by the new identifier at the
+    same position.
+    """
+    mapping = {
+        old: new
+        for old, new in zip(identifiers, new_identifiers)
+        if old != new and len(old) > 1
+    }
+    if not mapping:
+        return docstring
+    pattern = re.compile(
+        r"\b(?:"
+        + "|".join(re.escape(name) for name in sorted(mapping, key=len, reverse=True))
+        + r")\b"
+    )
+    return pattern.sub(lambda match: mapping[match.group()], docstring)
+
+
+def _python_bound_names(node):
+    """Return the names that the declaration binds: its own name, its
+    parameters and its locals, including the ones of the declarations nested
+    in it, but not the names it declares global or nonlocal.
+    """
+    bound = {node.name}
+    free = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.arg):
+            bound.add(child.arg)
+        elif isinstance(child, ast.Name) and not isinstance(child.ctx, ast.Load):
+            bound.add(child.id)
+        elif isinstance(child, (ast.Global, ast.Nonlocal)):
+            free.update(child.names)
+        elif not isinstance(child, _NOT_BINDING_NODES):
+            # Nested declarations, exception handlers and match captures.
+            for field in ("name", "rest"):
+                value = getattr(child, field, None)
+                if isinstance(value, str):
+                    bound.add(value)
+    return bound - free
+
+
+def _serialize(node, bound, names, parts):
+    parts.append(type(node).__name__)
+    body = None
+    if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+        body = node.body
+        if (
+            body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            body = body[1:]
+    for field, value in ast.iter_fields(node):
+        if field in ("ctx", "type_comment", "kind"):
+            continue
+        if field == "body" and body is not None:
+            value = body
+        if isinstance(value, list):
+            parts.append("[")
+            for item in value:
+                if isinstance(item, ast.AST):
+                    _serialize(item, bound, names, parts)
+                else:
+                    parts.append(_abstract(node, field, item, bound, names))
+            parts.append("]")
+        elif isinstance(value, ast.AST):
+            _serialize(value, bound, names, parts)
+        else:
+            parts.append(_abstract(node, field, value, bound, names))
+
+
+def _abstract(node, field, value, bound, names):
+    if (
+        field in _BINDING_FIELDS
+        and value in bound
+        and not isinstance(node, _NOT_BINDING_NODES)
+    ):
+        return names.setdefault(value, f"#{len(names)}")
+    # Other names and literals, e.g. the value of a Constant, as they are.
+    return repr(value)
+
+
+def _bound_tokens(tokens, declaration, file_ext):
+    """Return the identifiers that the declaration binds: its own name, its
+    parameters and its locals. All the variables of PHP are local, unless
+    they are global. For Go and JavaScript/TypeScript, these are the names
+    of the parameters of the declaration and its arrow functions, and the
+    names declared with a keyword, with := or by a catch.
+    """
+    bound = {declaration.name}
+    if file_ext == ".php":
+        bound.update(
+            token
+            for token in tokens
+            if token[0] == "$" and token not in _PHP_GLOBALS and len(token) > 1
+        )
+        return bound
+
+    if declaration.kind in ("function", "method"):
+        bound.update(_parameter_names(tokens, file_ext))
+    for position, token in enumerate(tokens):
+        following = tokens[position + 1 : position + 3]
+        if token in _BINDING_KEYWORDS and following:
+            bound.add(following[0])
+        elif token == "catch" and following[:1] == ["("] and len(following) > 1:
+            bound.add(following[1])
+        elif token == ":" and following[:1] == ["="]:
+            # e.g. "value, err := ..." in Go.
+            index = position - 1
+            while index >= 0 and _is_identifier(tokens[index]):
+                bound.add(tokens[index])
+                if index == 0 or tokens[index - 1] != ",":
+                    break
+                index -= 2
+        elif token == "=" and following[:1] == [">"] and position > 0:
+            # The parameters of an arrow function, e.g. "item => item.id" or
+            # "(total, item) => total + item".
+            if tokens[position - 1] != ")":
+                bound.add(tokens[position - 1])
+                continue
+            depth, opening = 0, position - 1
+            while opening >= 0:
+                depth += {")": 1, "(": -1}.get(tokens[opening], 0)
+                if depth == 0:
+                    break
+                opening -= 1
+            bound.update(_parameter_names(tokens[opening:position], file_ext))
+    return {
+        token for token in bound if _is_identifier(token) and token not in _KEYWORDS
+    }
+
+
+def _parameter_names(tokens, file_ext):
+    """Return the names of the parameters in the parentheses of the header
+    of the declaration, i.e. before its body. Go parameters are either all
+    named or not at all, in which case they are only types.
+    """
+    groups = []
+    depth = 0
+    for position, token in enumerate(tokens):
+        if depth == 0 and (
+            token == "{" or tokens[position : position + 2] == ["=", ">"]
+        ):
+            break
+        if token in "([{":
+            depth += 1
+            if depth == 1 and token == "(":
+                groups.append([[]])
+                continue
+        elif token in ")]}":
+            depth -= 1
+        if not groups or depth == 0:
+            continue
+        if depth == 1 and token == ",":
+            groups[-1].append([])
+        else:
+            groups[-1][-1].append(token)
+
+    names = set()
+    for elements in groups:
+        elements = [element for element in elements if element]
+        if file_ext == ".go":
+            if any(_is_go_named(element) for element in elements):
+                names.update(element[0] for element in elements)
+            continue
+        for element in elements:
+            # Skip the modifiers of TypeScript and the dots of a rest one.
+            element = [
+                token for token in element if token != "." and token not in _KEYWORDS
+            ]
+            if element:
+                names.add(element[0])
+    return names
+
+
+def _is_go_named(element):
+    """Return whether a Go parameter is a name followed by its type, rather
+    than a type alone such as pkg.Type.
+    """
+    return (
+        len(element) > 1
+        and _is_identifier(element[0])
+        and element[0] not in _KEYWORDS
+        and (element[1] != "." or element[2:3] == ["."])
+    )
+
+
+def _is_member(tokens, position, file_ext):
+    """Return whether the token is a property or method: after -> or :: in
+    PHP, where dots concatenate strings, or else after a dot that is not
+    part of a spread.
+    """
+    before = tokens[max(position - 2, 0) : position]
+    if file_ext == ".php":
+        return before in (["-", ">"], [":", ":"])
+    return before[-1:] == ["."] and before[:1] != ["."]
+
+
+def _is_identifier(token):
+    return token[0].isalpha() or token[0] in "_$"
+
+
+def _hash(parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def configure_docstring_index(cache=None):
+    """Enable the process-wide docstring index, persisted in the cache if
+    given.
+    """
+    global _index
+    _index = DocstringIndex(cache)
+    return _index
+
+
+def get_docstring_index():
+    return _index
@@ -0,0 +1,274 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+from devtale.profiling import current_annotations
+
+# Quantiles of the call latency in the metrics and the summary.
+LATENCY_QUANTILES = [0.5, 0.95]
+
+_ledger = None
+
+
+class RunLedger:
+    """Record every LLM call of a run, with the file, folder and chunk it was
+    made for (see devtale.profiling.annotate), its template, model, tokens,
+    cost, latency, retries and whether the cache answered it.
+
+    Records are kept in memory for the metrics and the summary, and appended
+    to a JSONL file as they come when a path is given, so the calls of an
+    interrupted run are not lost. Calls of all the threads can be recorded
+    concurrently.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = []
+        # (file, reference, exact) of the duplicates that reused a tale.
+        self.reuses = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def record(
+        self,
+        template,
+        model_name,
+        prompt_tokens=0,
+        completion_tokens=0,
+        cost=0.0,
+        latency=0.0,
+        elapsed=0.0,
+        retries=0,
+        cache="miss",
+        error=None,
+    ):
+        """Record a call. latency is the time of the attempt that answered,
+        and elapsed the whole time of the call, waits and retries included.
+        cache is "hit", "miss" or "off".
+        """
+        annotations = current_annotations()
+        record = {
+            "time": time.time(),
+            "file": annotations.get("file"),
+            "folder": annotations.get("folder"),
+            "chunk": annotations.get("chunk"),
+            "template": template,
+            "model": model_name,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "latency": latency,
+            "elapsed": elapsed,
+            "retries": retries,
+            "cache": cache,
+            "error": error,
+        }
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+        return record
+
+    def record_reuse(self, file_path, reference_path, exact):
+        """Record that the file reused the tale of the reference, entirely
+        if exact, or the docstrings of its unchanged declarations otherwise.
+        """
+        with self._lock:
+            self.reuses.append((file_path, reference_path, exact))
+
+    def saved_calls(self):
+        """Return the number of calls that the duplicates saved: the calls
+        made for their reference minus their own ones.
+        """
+        with self._lock:
+            calls = defaultdict(int)
+            for record in self.records:
+                if record["cache"] != "hit":
+                    calls[record["file"]] += 1
+            return sum(
+                max(calls[reference_path] - calls[file_path], 0)
+                for file_path, reference_path, _ in self.reuses
+            )
+
+    def total_cost(self):
+        with self._lock:
+            return sum(record["cost"] for record in self.records)
+
+    def write_metrics(self, path):
+        """Write a snapshot of the calls, tokens, cost, retries and latency
+        of each model and template in the OpenMetrics text format.
+        """
+        with self._lock:
+            records = list(self.records)
+            reuses = list(self.reuses)
+
+        calls = defaultdict(int)
+        tokens = defaultdict(int)
+        costs = defaultdict(float)
+        retries = defaultdict(int)
+        latencies = defaultdict(list)
+        for record in records:
+            model, template = record["model"], record["template"]
+            status = "error" if record["error"] else "ok"
+            calls[(model, template, record["cache"], status)] += 1
+            tokens[(model, template, "prompt")] += record["prompt_tokens"]
+            tokens[(model, template, "completion")] += record["completion_tokens"]
+            costs[(model, template)] += record["cost"]
+            retries[(model, template)] += record["retries"]
+            if record["cache"] != "hit" and not record["error"]:
+                latencies[model].append(record["latency"])
+
+        lines = [
+            "# TYPE devtale_llm_calls counter",
+            "# HELP devtale_llm_calls LLM calls.",
+        ]
+        for (model, template, cache, status), value in sorted(calls.items()):
+            labels = _labels(model=model, template=template, cache=cache, status=status)
+            lines.append(f"devtale_llm_calls_total{labels} {value}")
+        lines += [
+            "# TYPE devtale_llm_tokens counter",
+            "# HELP devtale_llm_tokens Tokens sent to and received from the LLM.",
+        ]
+        for (model, template, kind), value in sorted(tokens.items()):
+            labels = _labels(model=model, template=template, kind=kind)
+            lines.append(f"devtale_llm_tokens_total{labels} {value}")
+        lines += [
+            "# TYPE devtale_llm_cost_usd counter",
+            "# HELP devtale_llm_cost_usd Cost of the LLM calls.",
+        ]
+        for (model, template), value in sorted(costs.items()):
+            labels = _labels(model=model, template=template)
+            lines.append(f"devtale_llm_cost_usd_total{labels} {value:.6f}")
+        lines += [
+            "# TYPE devtale_llm_retries counter",
+            "# HELP devtale_llm_retries Failed attempts that were retried.",
+        ]
+        for (model, template), value in sorted(retries.items()):
+            labels = _labels(model=model, template=template)
+            lines.append(f"devtale_llm_retries_total{labels} {value}")
+        lines += [
+            "# TYPE devtale_llm_latency_seconds summary",
+            "# UNIT devtale_llm_latency_seconds seconds",
+            "# HELP devtale_llm_latency_seconds Latency of the answered LLM calls.",
+        ]
+        for model, values in sorted(latencies.items()):
+            for quantile in LATENCY_QUANTILES:
+                labels = _labels(model=model, quantile=str(quantile))
+                value = percentile(values, quantile)
+                lines.append(f"devtale_llm_latency_seconds{labels} {value:.6f}")
+            labels = _labels(model=model)
+            lines.append(f"devtale_llm_latency_seconds_count{labels} {len(values)}")
+            lines.append(f"devtale_llm_latency_seconds_sum{labels} {sum(values):.6f}")
+        exact = sum(reuse[2] for reuse in reuses)
+        lines += [
+            "# TYPE devtale_duplicate_files counter",
+            "# HELP devtale_duplicate_files Files that reused the tale of a copy.",
+            f'devtale_duplicate_files_total{{kind="exact"}} {exact}',
+            f'devtale_duplicate_files_total{{kind="near"}} {len(reuses) - exact}',
+            "# TYPE devtale_llm_calls_saved counter",
+            "# HELP devtale_llm_calls_saved LLM calls saved by reusing tales.",
+            f"devtale_llm_calls_saved_total {self.saved_calls()}",
+            "# EOF",
+        ]
+
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+    def summary(self, top=10):
+        """Return a table of the calls, tokens, cost and latency quantiles of
+        each model, followed by the top files by tokens and the calls saved
+        by the duplicates.
+        """
+        with self._lock:
+            records = list(self.records)
+            reuses = list(self.reuses)
+
+        models = defaultdict(list)
+        files = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for record in records:
+            models[record["model"]].append(record)
+            stats = files[record["file"] or record["folder"] or "(repository)"]
+            stats[0] += 1
+            stats[1] += record["prompt_tokens"] + record["completion_tokens"]
+            stats[2] += record["cost"]
+            stats[3] += record["elapsed"]
+
+        lines = [
+            f"{'model':<22}{'calls':>7}{'cached':>8}{'retries':>9}{'errors':>8}"
+            f"{'tokens':>10}{'cost $':>10}{'p50 s':>8}{'p95 s':>8}"
+        ]
+        for model, calls in sorted(models.items()):
+            answered = [c for c in calls if c["cache"] != "hit" and not c["error"]]
+            latencies = [call["latency"] for call in answered]
+            cached = sum(call["cache"] == "hit" for call in calls)
+            retries = sum(call["retries"] for call in calls)
+            errors = sum(bool(call["error"]) for call in calls)
+            tokens = sum(c["prompt_tokens"] + c["completion_tokens"] for c in calls)
+            cost = sum(call["cost"] for call in calls)
+            lines.append(
+                f"{model:<22}{len(calls):>7}{cached:>8}{retries:>9}{errors:>8}"
+                f"{tokens:>10}{cost:>10.4f}"
+                f"{percentile(latencies, 0.5):>8.2f}{percentile(latencies, 0.95):>8.2f}"
+            )
+
+        lines += [
+            "",
+            f"{'file':<50}{'calls':>7}{'tokens':>10}{'cost $':>10}{'time s':>9}",
+        ]
+        ranked = sorted(files.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (count, tokens, cost, elapsed) in ranked[:top]:
+            if len(name) > 49:
+                name = "..." + name[-46:]
+            lines.append(
+                f"{name:<50}{count:>7}{tokens:>10}{cost:>10.4f}{elapsed:>9.2f}"
+            )
+        if reuses:
+            exact = sum(reuse[2] for reuse in reuses)
+            lines += [
+                "",
+                f"{exact} copies and {len(reuses) - exact} near copies reused "
+                f"the tale of another file, saving {self.saved_calls()} calls.",
+            ]
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def percentile(values, quantile):
+    """Return the nearest-rank quantile of the values, 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(quantile * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def _labels(**labels):
+    values = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + values + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def configure_ledger(path=None):
+    """Start recording the LLM calls of the process, in the JSONL file at
+    path if given.
+    """
+    global _ledger
+    if _ledger is not None:
+        _ledger.close()
+    _ledger = RunLedger(path)
+    return _ledger
+
+
+def get_ledger():
+    return _ledger
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = ".devtale_manifest.json"
+
+
+class RunManifest:
+    """Track the files documented by a run to only re-document what changed
+    on the next one.
+
+    The manifest stores the path, size, mtime and content hash of each file,
+    relative to root_path. A file whose size and mtime did not change is
+    considered unchanged without reading it; if only the mtime changed (e.g.
+    after a fresh checkout), the content hash decides. Alternatively, passing
+    a git reference as `since` marks as changed every file that differs from
+    it, tracked or not.
+    """
+
+    def __init__(self, root_path, output_path, since=None):
+        self.root_path = root_path
+        self.output_path = output_path
+        self.since = since
+        self.previous_files = {}
+        self.changed_files = None
+        self.deleted_files = None
+        self._tales = {}
+        self._failed_files = set()
+        self._lock = threading.Lock()
+
+        manifest_path = os.path.join(output_path, MANIFEST_FILE_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file:
+                self.previous_files = json.load(file).get("files", {})
+
+        if since:
+            self.changed_files = set(
+                self._git("diff", "--name-only", "--relative", since)
+                + self._git("ls-files", "--others", "--exclude-standard")
+            )
+            self.deleted_files = set(
+                self._git("diff", "--name-only", "--relative", "--diff-filter=D", since)
+            )
+
+    def is_unchanged(self, file_path):
+        relative_path = self._relative_path(file_path)
+        if self.changed_files is not None:
+            return relative_path not in self.changed_files
+
+        entry = self.previous_files.get(relative_path)
+        if entry is None:
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        return _hash_file(file_path) == entry["sha256"]
+
+    def unchanged_digest(self, file_path):
+        """Return the sha256 that the last run recorded for the file if its
+        size and mtime did not change since then, without reading it, and
+        None otherwise.
+        """
+        relative_path = self._relative_path(file_path)
+        if self.changed_files is not None and relative_path in self.changed_files:
+            return None
+        entry = self.previous_files.get(relative_path)
+        if entry is None:
+            return None
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+            return None
+        return entry["sha256"]
+
+    def previous_tale(self, file_path):
+        """Return the tale that the last run kept in the manifest for the
+        file, if any. Only files without a tale file have one.
+        """
+        entry = self.previous_files.get(self._relative_path(file_path), {})
+        return entry.get("tale")
+
+    def record_tale(self, file_path, tale):
+        """Keep the tale of a file that does not have its own tale file."""
+        with self._lock:
+            self._tales[self._relative_path(file_path)] = tale
+
+    def record_failure(self, file_path):
+        """Keep the state of the last run for a file that could not be
+        documented, so that the next run documents it again instead of
+        reusing its stale tale.
+        """
+        with self._lock:
+            self._failed_files.add(self._relative_path(file_path))
+
+    def remove_deleted_tales(self, file_paths):
+        """Remove the tale files of the files that do not exist anymore."""
+        current_files = {self._relative_path(file_path) for file_path in file_paths}
+        if self.deleted_files is not None:
+            deleted_files = self.deleted_files
+        else:
+            deleted_files = set(self.previous_files) - current_files
+
+        # When documenting into another folder, the fused copies are ours too.
+        outputs = [".json"]
+        if os.path.abspath(self.output_path) != os.path.abspath(self.root_path):
+            outputs.append("")
+
+        for relative_path in sorted(deleted_files):
+            for suffix in outputs:
+                output_file = os.path.join(self.output_path, relative_path + suffix)
+                if os.path.isfile(output_file):
+                    logger.info(f"Removing output of deleted file: {output_file}")
+                    os.remove(output_file)
+
+    def save(self, file_paths):
+        """Write the state of the files at the end of the run. The files that
+        failed keep their previous entry, if any.
+        """
+        files = {}
+        for file_path in file_paths:
+            relative_path = self._relative_path(file_path)
+            entry = self.previous_files.get(relative_path)
+            if relative_path in self._failed_files:
+                if entry is not None:
+                    files[relative_path] = entry
+                continue
+            stat = os.stat(file_path)
+            # Avoid reading the file again if it did not change at all.
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime_ns"] != stat.st_mtime_ns
+            ):
+                entry = {"sha256": _hash_file(file_path)}
+            entry = {
+                "path": relative_path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": entry["sha256"],
+            }
+            tale = self._tales.get(relative_path)
+            if tale is not None:
+                entry["tale"] = tale
+            files[relative_path] = entry
+
+        os.makedirs(self.output_path, exist_ok=True)
+        with open(os.path.join(self.output_path, MANIFEST_FILE_NAME), "w") as file:
+            json.dump({"files": files}, file, indent=2)
+
+    def _relative_path(self, file_path):
+        return os.path.relpath(file_path, self.root_path)
+
+    def _git(self, *args):
+        result = subprocess.run(
+            ["git", *args],
+            cwd=self.root_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return [line for line in result.stdout.splitlines() if line]
+
+
+def _hash_file(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
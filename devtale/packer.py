@@ -0,0 +1,96 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+from devtale.constants import (
+    ALLOWED_NO_CODE_EXTENSIONS,
+    PACK_ITEM_TOKENS,
+    PACK_MAX_ITEMS,
+    PACK_TOKENS,
+)
+from devtale.utils import count_tokens, split_text
+
+# A file summarized along with others in a single GPT call. item_id is its
+# name, which is stable from run to run and unique in its folder.
+PackedItem = namedtuple("PackedItem", ["item_id", "path", "content", "tokens"])
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def pack_no_code_files(file_paths, skipped=()):
+    """Group the small config/script files of a folder into packs of at most
+    PACK_TOKENS tokens and PACK_MAX_ITEMS files, that are summarized in a
+    single call each. Files in skipped, empty or unreadable files, and files
+    of more than PACK_ITEM_TOKENS tokens are left out, as well as the packs
+    of a single file.
+    """
+    items = []
+    for file_path in file_paths:
+        file_ext = os.path.splitext(file_path)[-1]
+        if file_ext and file_ext not in ALLOWED_NO_CODE_EXTENSIONS:
+            continue
+        if file_path in skipped:
+            continue
+        try:
+            with open(file_path, "r") as file:
+                code = file.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if not code.strip():
+            continue
+        # The same excerpt as the file would send on its own.
+        content = split_text(code, chunk_size=5000)[0].page_content
+        tokens = count_tokens(content)
+        if tokens <= PACK_ITEM_TOKENS:
+            items.append(
+                PackedItem(os.path.basename(file_path), file_path, content, tokens)
+            )
+    return [pack for pack in pack_items(items) if len(pack) > 1]
+
+
+def pack_items(items, budget=PACK_TOKENS, max_items=PACK_MAX_ITEMS):
+    """Split the items, in order, into packs of at most budget tokens and
+    max_items items. An item bigger than the budget gets a pack of its own.
+    """
+    packs = []
+    pack, tokens = [], 0
+    for item in items:
+        if pack and (tokens + item.tokens > budget or len(pack) >= max_items):
+            packs.append(pack)
+            pack, tokens = [], 0
+        pack.append(item)
+        tokens += item.tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def format_pack(pack):
+    """Return the files of the pack as the JSON list of the prompt."""
+    return json.dumps(
+        [{"file_id": item.item_id, "file_content": item.content} for item in pack],
+        indent=1,
+    )
+
+
+def split_answer(answer, pack):
+    """Return a dict of item_id -> summary of the items of the pack that the
+    answer, a JSON object mapping the IDs to their summaries, covers. It is
+    empty if the answer is malformed.
+    """
+    match = _JSON_OBJECT.search(answer or "")
+    if match is None:
+        return {}
+    try:
+        summaries = json.loads(match.group())
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(summaries, dict):
+        return {}
+    return {
+        item.item_id: summaries[item.item_id].strip()
+        for item in pack
+        if isinstance(summaries.get(item.item_id), str)
+        and summaries[item.item_id].strip()
+    }
@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Stages of the pipeline, in the order of the report.
+STAGES = [
+    "walk",
+    "dedup",
+    "split",
+    "extract",
+    "tale",
+    "parse",
+    "summarize",
+    "fuse",
+    "write",
+]
+
+_profiler = None
+# The annotate() blocks open in each thread.
+_annotations = threading.local()
+
+
+class StageStats:
+    __slots__ = ("count", "seconds", "calls", "tokens", "peak_memory")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.calls = 0
+        self.tokens = 0
+        self.peak_memory = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Profiler:
+    """Aggregate the time spent in each stage of the pipeline, along with
+    the LLM calls and tokens made inside it.
+
+    seconds adds up the time of every span of the stage, so concurrent
+    spans count once each. With memory=True, tracemalloc is started and
+    peak_memory is the highest traced memory of the process while a span of
+    the stage was open: it is exact when files are processed one at a time,
+    and includes the other threads' allocations otherwise.
+
+    With trace=True, every span and LLM call is also kept as an event of the
+    Chrome trace-event format, tagged with its arguments and the ones of the
+    enclosing annotate() blocks of its thread, see write_trace.
+    """
+
+    def __init__(self, memory=False, trace=False):
+        self.memory = memory
+        self.trace = trace
+        self.stats = {}
+        self.events = []
+        # Names of the threads of the events, that may be gone by the end.
+        self.threads = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Spans open in any thread, for the memory peaks.
+        self._open = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, stage, **args):
+        stack = self._stack()
+        stats = StageStats()
+        stack.append(stats)
+        if self.memory:
+            with self._lock:
+                self._update_peaks()
+                self._open.append(stats)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            with self._lock:
+                if self.memory:
+                    self._update_peaks()
+                    self._open.remove(stats)
+                total = self.stats.setdefault(stage, StageStats())
+                total.count += 1
+                total.seconds += end - start
+                total.calls += stats.calls
+                total.tokens += stats.tokens
+                total.peak_memory = max(total.peak_memory, stats.peak_memory)
+            if self.trace:
+                if stats.calls:
+                    args.update(calls=stats.calls, tokens=stats.tokens)
+                self._add_event(stage, "stage", start, end, args)
+
+    def record_call(self, tokens, start=None, end=None, **args):
+        """Count a LLM call in the innermost span of the current thread."""
+        stack = self._stack()
+        if stack:
+            stack[-1].calls += 1
+            stack[-1].tokens += tokens
+        if self.trace and start is not None:
+            self._add_event("llm", "llm", start, end, dict(args, tokens=tokens))
+
+    def report(self):
+        """Return the stats of each stage as a dict, the known stages first."""
+        with self._lock:
+            names = [stage for stage in STAGES if stage in self.stats]
+            names += sorted(stage for stage in self.stats if stage not in STAGES)
+            return {stage: self.stats[stage].to_dict() for stage in names}
+
+    def write_trace(self, path):
+        """Write the events in the trace-event JSON format, which opens in
+        Perfetto (https://ui.perfetto.dev) or chrome://tracing. The stats of
+        the stages are kept in its otherData.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in threads.items()
+        ]
+        for event in events:
+            event["pid"] = pid
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "traceEvents": metadata + events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"stages": self.report()},
+                },
+                file,
+            )
+
+    def stop(self):
+        if self.memory:
+            tracemalloc.stop()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add_event(self, name, category, start, end, args):
+        merged = current_annotations()
+        merged.update(args)
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._start) * 1e6,
+            "dur": (end - start) * 1e6,
+            "tid": threading.get_ident(),
+            "args": merged,
+        }
+        with self._lock:
+            self.events.append(event)
+            self.threads[event["tid"]] = threading.current_thread().name
+
+    def _update_peaks(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for stats in self._open:
+            stats.peak_memory = max(stats.peak_memory, peak)
+        tracemalloc.reset_peak()
+        if self.trace:
+            self.events.append(
+                {
+                    "name": "traced memory",
+                    "ph": "C",
+                    "ts": (time.perf_counter() - self._start) * 1e6,
+                    "tid": threading.get_ident(),
+                    "args": {"bytes": current},
+                }
+            )
+
+
+def enable_profiling(memory=False, trace=False):
+    """Start profiling the stages of the pipeline in this process."""
+    global _profiler
+    _profiler = Profiler(memory, trace)
+    return _profiler
+
+
+def disable_profiling():
+    """Stop profiling and return the profiler with the collected stats."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+@contextmanager
+def span(stage, **args):
+    """Time the stage of the pipeline, if profiling is enabled."""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.span(stage, **args):
+        yield
+
+
+@contextmanager
+def annotate(**args):
+    """Tag the spans and LLM calls of the current thread inside the block,
+    e.g. with the file being processed.
+    """
+    stack = getattr(_annotations, "stack", None)
+    if stack is None:
+        stack = _annotations.stack = []
+    stack.append(args)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def current_annotations():
+    """Return the tags of the annotate() blocks open in the current thread,
+    the innermost block winning over the outer ones.
+    """
+    merged = {}
+    for args in getattr(_annotations, "stack", ()):
+        merged.update(args)
+    return merged
+
+
+def record_call(tokens, start=None, end=None, **args):
+    if _profiler is not None:
+        _profiler.record_call(tokens, start, end, **args)
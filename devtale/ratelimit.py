@@ -0,0 +1,249 @@
+import logging
+import random
+import threading
+import time
+
+import openai
+
+from devtale.constants import (
+    EXPECTED_COMPLETION_TOKENS,
+    HTTP_POOL_SIZE,
+    MAX_RETRIES,
+    RATE_LIMIT_HEADROOM,
+    RATE_LIMITS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the same call can succeed if we try again later.
+RETRYABLE_ERRORS = (
+    openai.error.APIConnectionError,
+    openai.error.APIError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+# A call slower than this many times the average, per token, means that the
+# API is queueing our requests.
+LATENCY_TOLERANCE = 2.0
+
+_limits = dict(RATE_LIMITS)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Allow up to capacity units at once, refilled at a steady rate.
+
+    The usage settled after the fact can leave the bucket in debt, which
+    the next callers wait for.
+    """
+
+    def __init__(self, capacity, per_second):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount):
+        """Wait until the amount is available and take it from the bucket."""
+        # An amount bigger than the bucket waits for it to be full.
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                delay = (amount - self.level) / self.per_second
+            time.sleep(delay)
+
+    def settle(self, amount):
+        """Charge an amount used on top of the reservation, or give back
+        what was not used if the amount is negative.
+        """
+        with self._lock:
+            self._refill()
+            self.level = min(self.level - amount, self.capacity)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the API told us that we are over
+        the quota.
+        """
+        with self._lock:
+            self._refill()
+            self.level = min(self.level, 0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(
+            self.level + (now - self._updated) * self.per_second, self.capacity
+        )
+        self._updated = now
+
+
+class AdaptiveConcurrency:
+    """Limit the number of calls in flight, adjusting the limit AIMD-style:
+    it grows by one every limit calls that succeed in a normal time, and it
+    is halved when a call is rate limited. A call much slower than usual
+    shrinks it slightly, as the requests are being queued. The calls that
+    were already in flight when the limit shrank do not shrink it again.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=HTTP_POOL_SIZE):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        # Running average of the seconds per token of a call.
+        self._baseline = None
+        self._decreased = time.monotonic()
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, start=None, tokens=None, throttled=False):
+        """Release a call started at the given time.monotonic(), that used
+        the given tokens or was rate limited.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease(start, 0.5)
+            elif start is not None and tokens:
+                per_token = (time.monotonic() - start) / tokens
+                if self._baseline is None:
+                    self._baseline = per_token
+                slow = per_token > self._baseline * LATENCY_TOLERANCE
+                self._baseline += 0.1 * (per_token - self._baseline)
+                if slow:
+                    self._decrease(start, 0.9)
+                else:
+                    self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            self._condition.notify_all()
+
+    def _decrease(self, start, factor):
+        if start is None or start >= self._decreased:
+            self.limit = max(self.limit * factor, self.minimum)
+            self._decreased = time.monotonic()
+
+
+class RateLimiter:
+    """Keep the GPT calls of a model under its tokens and requests per
+    minute quota, with as many calls in flight as the API handles well.
+
+    Each call is charged its prompt tokens plus a pessimistic estimate of its
+    output tokens up front, and the difference with its real usage
+    afterwards, or all of it if the call fails. Calls that are rate limited
+    or fail temporarily are retried with a jittered exponential backoff.
+    """
+
+    def __init__(self, tokens_per_minute=None, requests_per_minute=None):
+        self.tokens = self.requests = None
+        if tokens_per_minute:
+            capacity = tokens_per_minute * RATE_LIMIT_HEADROOM
+            self.tokens = TokenBucket(capacity, capacity / 60)
+        if requests_per_minute:
+            capacity = requests_per_minute * RATE_LIMIT_HEADROOM
+            self.requests = TokenBucket(capacity, capacity / 60)
+        self.concurrency = AdaptiveConcurrency()
+        # Running average and deviation of the output tokens of a call.
+        self.completion_tokens = EXPECTED_COMPLETION_TOKENS
+        self.completion_deviation = 0
+
+    def call(self, func, prompt_tokens):
+        """Run func, that returns its result and the tokens it used, within
+        the limits.
+        """
+        estimated_tokens = prompt_tokens + int(
+            self.completion_tokens + 2 * self.completion_deviation
+        )
+        for attempt in range(MAX_RETRIES + 1):
+            self._reserve(estimated_tokens)
+            self.concurrency.acquire()
+            start = time.monotonic()
+            try:
+                result, used_tokens = func()
+            except openai.error.RateLimitError as e:
+                self.concurrency.release(start=start, throttled=True)
+                if self.tokens is not None:
+                    self.tokens.drain()
+                if attempt == MAX_RETRIES:
+                    raise
+                self._backoff(attempt, e)
+                continue
+            except RETRYABLE_ERRORS as e:
+                self.concurrency.release()
+                self._refund(estimated_tokens)
+                if attempt == MAX_RETRIES:
+                    raise
+                self._backoff(attempt, e)
+                continue
+            except Exception:
+                self.concurrency.release()
+                self._refund(estimated_tokens)
+                raise
+
+            self.concurrency.release(start, used_tokens)
+            if used_tokens:
+                error = max(used_tokens - prompt_tokens, 0) - self.completion_tokens
+                self.completion_tokens += 0.2 * error
+                self.completion_deviation += 0.2 * (
+                    abs(error) - self.completion_deviation
+                )
+                if self.tokens is not None:
+                    self.tokens.settle(used_tokens - estimated_tokens)
+            return result
+
+    def _reserve(self, estimated_tokens):
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None:
+            self.tokens.acquire(estimated_tokens)
+
+    def _refund(self, estimated_tokens):
+        """Give back the tokens reserved by a call that failed without using
+        them. The request itself still counts.
+        """
+        if self.tokens is not None:
+            self.tokens.settle(-estimated_tokens)
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(RETRY_BASE_DELAY * 2**attempt, RETRY_MAX_DELAY))
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        logger.info(
+            f"GPT call failed, retrying in {delay:.1f}s "
+            f"({attempt + 1}/{MAX_RETRIES}) - Exception: {error}"
+        )
+        time.sleep(delay)
+
+
+def configure_rate_limits(limits=None):
+    """Set the (tokens per minute, requests per minute) of some models, on
+    top of the default RATE_LIMITS.
+    """
+    global _limits
+    with _limiters_lock:
+        _limits = dict(RATE_LIMITS)
+        _limits.update(limits or {})
+        _limiters.clear()
+
+
+def get_rate_limiter(model_name):
+    """Return the process-wide RateLimiter of the model."""
+    with _limiters_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter(*_limits.get(model_name, (None, None)))
+        return _limiters[model_name]
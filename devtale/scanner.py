@@ -0,0 +1,184 @@
+import re
+from collections import namedtuple
+
+# kind is one of: function, method, class, struct, interface, trait, enum.
+# start is the offset of the declaration keyword (or name) in the source, and
+# end the offset right after its body.
+Declaration = namedtuple("Declaration", ["kind", "name", "start", "end"])
+
+SCANNER_LANGUAGES = {
+    ".go": "go",
+    ".js": "javascript",
+    ".ts": "javascript",
+    ".tsx": "javascript",
+    ".php": "php",
+}
+
+CLASS_KINDS = ["class", "struct", "interface", "trait", "enum"]
+
+_JS_NOT_METHODS = {
+    "if",
+    "for",
+    "while",
+    "switch",
+    "catch",
+    "return",
+    "function",
+    "with",
+}
+
+# Each pattern is an alternation where comments and strings come first, so
+# that anything inside them is skipped, followed by the punctuation we track
+# and the declarations of the language. Declarations stop right before their
+# opening parenthesis, which is tracked as a regular token.
+_PATTERNS = {
+    "go": re.compile(
+        r"""
+        (?P<comment>//[^\n]*|/\*.*?\*/)
+        |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`[^`]*`)
+        |(?P<punct>[{}();])
+        |\bfunc\s*\([^()]*\)\s*(?P<go_method>\w+)(?=\s*[\[(])
+        |\bfunc\s+(?P<go_function>\w+)(?=\s*[\[(])
+        |\btype\s+(?P<go_type>\w+)(?:\[[^\]]*\])?\s+(?P<go_kind>struct|interface)\b
+        """,
+        re.VERBOSE | re.DOTALL,
+    ),
+    "javascript": re.compile(
+        r"""
+        (?P<comment>//[^\n]*|/\*.*?\*/)
+        |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)
+        |(?P<punct>[{}();])
+        |\b(?:async\s+)?function\s*\*?\s*(?P<js_function>[\w$]+)(?=\s*[<(])
+        |\b(?P<js_kind>class|interface)\s+(?P<js_class>[\w$]+)
+        |\b(?:const|let|var)\s+(?P<js_arrow>[\w$]+)\s*(?::[^=;\n]+)?=\s*
+            (?:async\s+)?(?:\([^()]*\)|[\w$]+)\s*(?::[^=;\n]+)?=>\s*(?P<js_open>[{(])?
+        |^[ \t]*(?:(?:public|private|protected|static|abstract|async|get|set|readonly|override)\s+)*
+            \*?(?P<js_method>[\w$#]+)(?=\s*(?:<[^>\n]*>)?\s*\()
+        """,
+        re.VERBOSE | re.DOTALL | re.MULTILINE,
+    ),
+    "php": re.compile(
+        r"""
+        (?P<comment>//[^\n]*|\#(?!\[)[^\n]*|/\*.*?\*/)
+        |(?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+        |(?P<punct>[{}();])
+        |\bfunction\s+&?\s*(?P<php_function>\w+)(?=\s*\()
+        |(?<!::)(?<!\$)\b(?P<php_kind>class|interface|trait|enum)\s+
+            (?!extends\b|implements\b)(?P<php_class>\w+)
+        """,
+        re.VERBOSE | re.DOTALL,
+    ),
+}
+
+
+def scan_declarations(code, file_ext):
+    """Find the functions, methods, arrow-function components, classes,
+    structs and interfaces declared in Go, JavaScript/TypeScript or PHP code.
+
+    It is a single regex-driven pass that skips comments and strings and
+    tracks braces and parentheses, so it is fast even on large vendored files,
+    but it does not fully parse the language: e.g. JavaScript regex literals
+    containing quotes or braces can confuse it. Returns a list of Declaration
+    sorted by start offset.
+    """
+    language = SCANNER_LANGUAGES[file_ext]
+    declarations = []
+
+    # Each open brace/parenthesis is a frame: (kind, declaration whose body it
+    # opens, if any). The kind of a brace frame is "class" for class bodies.
+    braces = []
+    parens = []
+    # Declarations waiting for their body, with the parentheses depth at
+    # which the body has to open.
+    pending = []
+
+    for match in _PATTERNS[language].finditer(code):
+        group = match.lastgroup
+        if group in ("comment", "string"):
+            continue
+
+        if group == "punct":
+            char = match.group()
+            if char == "(":
+                parens.append(None)
+            elif char == ")":
+                if parens:
+                    declaration = parens.pop()
+                    if declaration is not None:
+                        declaration[3] = match.end()
+                # Declarations opened inside these parentheses will not get a
+                # body anymore.
+                while pending and pending[-1][1] > len(parens):
+                    pending.pop()[0][3] = match.end()
+            elif char == "{":
+                if pending and pending[-1][1] == len(parens):
+                    declaration = pending.pop()[0]
+                    kind = "class" if declaration[0] in CLASS_KINDS else "code"
+                    braces.append((kind, declaration))
+                else:
+                    braces.append(("code", None))
+            elif char == "}":
+                if braces:
+                    _, declaration = braces.pop()
+                    if declaration is not None:
+                        declaration[3] = match.end()
+            elif char == ";":
+                # A declaration without body, e.g. an abstract method.
+                if pending and pending[-1][1] == len(parens):
+                    pending.pop()[0][3] = match.end()
+            continue
+
+        in_class = bool(braces) and braces[-1][0] == "class"
+        kind, name, opener = _declaration(language, match, in_class)
+        if name is None:
+            continue
+
+        # Declarations are stored as lists until their end is known.
+        declaration = [kind, name, match.start(), None]
+        declarations.append(declaration)
+        if opener == "{":
+            braces.append(("code", declaration))
+        elif opener == "(":
+            parens.append(declaration)
+        elif opener == "line":
+            line_end = code.find("\n", match.end())
+            declaration[3] = line_end if line_end != -1 else len(code)
+        else:
+            pending.append((declaration, len(parens)))
+
+    return [
+        Declaration(kind, name, start, end if end is not None else len(code))
+        for kind, name, start, end in declarations
+    ]
+
+
+def _declaration(language, match, in_class):
+    """Return the kind, name and already consumed body opener (if any) of the
+    declaration matched, or a None name if it must be ignored.
+    """
+    if language == "go":
+        if match.group("go_method"):
+            return "method", match.group("go_method"), None
+        if match.group("go_function"):
+            return "function", match.group("go_function"), None
+        return match.group("go_kind"), match.group("go_type"), None
+
+    if language == "javascript":
+        if match.group("js_function"):
+            return "function", match.group("js_function"), None
+        if match.group("js_class"):
+            return match.group("js_kind"), match.group("js_class"), None
+        if match.group("js_arrow"):
+            # An arrow function without braces or parentheses ends with its
+            # line.
+            opener = match.group("js_open") or "line"
+            return "function", match.group("js_arrow"), opener
+        name = match.group("js_method")
+        if in_class and name not in _JS_NOT_METHODS:
+            return "method", name, None
+        return None, None, None
+
+    if match.group("php_function"):
+        kind = "method" if in_class else "function"
+        return kind, match.group("php_function"), None
+    return match.group("php_kind"), match.group("php_class"), None
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, name, func, dependencies=None, priority=0):
+        self.name = name
+        self.func = func
+        self.dependencies = list(dependencies or [])
+        self.priority = priority
+        self.dependents = []
+        self.result = None
+        self.start = None
+        self.end = None
+
+
+class TaskScheduler:
+    """Run a DAG of tasks on a shared pool of workers.
+
+    A task starts as soon as all its dependencies are done, and it receives
+    their results as positional arguments, in the same order as they were
+    declared. Among the ready tasks, the ones with the highest priority are
+    dispatched first. A task that raises an exception is logged and its
+    result is None, so its dependents still run.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self.tasks = {}
+        self._start = None
+
+    def add_task(self, name, func, dependencies=None, priority=0):
+        if name in self.tasks:
+            raise ValueError(f"Task {name} already exists")
+        for dependency in dependencies or []:
+            if dependency not in self.tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dependency}")
+        task = Task(name, func, dependencies, priority)
+        for dependency in task.dependencies:
+            self.tasks[dependency].dependents.append(task)
+        self.tasks[name] = task
+        return task
+
+    def run(self):
+        """Execute every task and return a dict with their results."""
+        self._start = time.perf_counter()
+        pending = {name: len(task.dependencies) for name, task in self.tasks.items()}
+        # The counter breaks priority ties by insertion order.
+        counter = itertools.count()
+        ready = [
+            (-task.priority, next(counter), task)
+            for task in self.tasks.values()
+            if not task.dependencies
+        ]
+        heapq.heapify(ready)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while ready or running:
+                while ready and len(running) < self.workers:
+                    _, _, task = heapq.heappop(ready)
+                    running[executor.submit(self._execute, task)] = task
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    for dependent in task.dependents:
+                        pending[dependent.name] -= 1
+                        if pending[dependent.name] == 0:
+                            heapq.heappush(
+                                ready, (-dependent.priority, next(counter), dependent)
+                            )
+
+        return {name: task.result for name, task in self.tasks.items()}
+
+    def critical_path(self):
+        """Return the chain of tasks that determined the total run time, as a
+        list of (task name, duration in seconds), starting from the first task.
+        """
+        finished = [task for task in self.tasks.values() if task.end is not None]
+        if not finished:
+            return []
+
+        path = []
+        task = max(finished, key=lambda item: item.end)
+        while task is not None:
+            path.append((task.name, task.end - task.start))
+            # The dependency that finished last is the one that kept this task
+            # waiting.
+            task = max(
+                (self.tasks[name] for name in task.dependencies),
+                key=lambda item: item.end,
+                default=None,
+            )
+        return list(reversed(path))
+
+    def log_critical_path(self):
+        path = self.critical_path()
+        if not path:
+            return
+        total = max(task.end for task in self.tasks.values() if task.end is not None)
+        logger.info(f"Critical path ({total - self._start:.2f}s in total):")
+        for name, duration in path:
+            logger.info(f"  {duration:8.2f}s  {name}")
+
+    def _execute(self, task):
+        dependency_results = [self.tasks[name].result for name in task.dependencies]
+        task.start = time.perf_counter()
+        try:
+            task.result = task.func(*dependency_results)
+        except Exception as e:
+            logger.info(f"Task {task.name} failed - Exception: {e}")
+            task.result = None
+        finally:
+            task.end = time.perf_counter()
@@ -34,3 +34,11 @@ class FileDocumentation(BaseModel):
         description="List of entities containing method names along with with \
         their respective docstrings.",
     )
+
+
+class SmallFileDocumentation(FileDocumentation):
+    file_docstring: str = Field(
+        default=None,
+        description="A concise summary of the purpose of the whole file, in a \
+        single paragraph.",
+    )
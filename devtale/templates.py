@@ -1,3 +1,7 @@
+# Part of the LLM cache key. Bump it whenever the answers to the same prompt
+# should not be reused anymore, e.g. when their parsing changes.
+TEMPLATES_VERSION = "1"
+
 CODE_EXTRACTOR_TEMPLATE = """
 Given the provided code snippet enclosed within the <<< >>> delimiters, your \
 task is to output the classes and method names that are defined within the code. \
@@ -39,6 +43,32 @@ use escaped newlines.
 Input: <<< {code} >>>
 """
 
+SMALL_FILE_TEMPLATE = """
+Your objective is to document a whole code file provided in the input: generate \
+Google Style docstrings for its code elements, and a summary of the file.
+The input consists of two parts:
+
+1. The code of the file enclosed within the <<< >>> delimiters.
+2. A list of code elements (classes and/or methods): "{code_elements}".
+
+Your task involves the following steps:
+
+1. Analyze the code to locate the methods and/or classes of the list of code \
+elements that are defined within it. If the list is empty, locate all the methods \
+and classes defined within the code.
+2. For each located code element, generate a Google Style docstring.
+3. Write a concise summary of the purpose of the whole file, as the file docstring.
+
+And please refrain from including docstrings within the code.
+
+{format_instructions}
+
+Do not introduce your answer, just output using the above JSON schema, and always \
+use escaped newlines.
+
+Input: <<< {code} >>>
+"""
+
 NO_CODE_FILE_TEMPLATE = """
 Using the following file data enclosed within the <<< >>> delimeters write a \
 top-file level concise summary that effectively captures the overall purpose and \
@@ -49,6 +79,14 @@ file data: <<< {information} >>>
 Ensure your final summary is no longer than three sentences.
 """
 
+NO_CODE_FILES_TEMPLATE = """
+The following files data enclosed within the <<< >>> delimeters is a JSON list of files, each with its ID and its content. For each file, write a top-file level concise summary that effectively captures the overall purpose and functionality of the file.
+
+files data: <<< {information} >>>
+
+Output a JSON object that maps the ID of every file to its summary, with no other text. Ensure each summary is no longer than three sentences.
+"""
+
 FILE_LEVEL_TEMPLATE = """
 The following summaries enclosed within the <<< >>> delimeters are derived from the \
 same code file. Write a top-file level docstring that combines them into a concise  \
@@ -60,6 +98,16 @@ Summaries: <<< {information} >>>
 Ensure your final summary is no longer than three sentences.
 """
 
+PARTIAL_SUMMARY_TEMPLATE = """
+The following information enclosed within the <<< >>> delimeters is a part of a \
+larger context that is too big to be processed at once. Write a concise summary of \
+it, of at most {max_words} words, that keeps the names of the files, folders, \
+classes and methods it mentions, along with a short description of their purpose, \
+so that it can be combined with the summaries of the other parts.
+
+Information: <<< {information} >>>
+"""
+
 FOLDER_LEVEL_TEMPLATE = """
 Generate a markdown text using the enclosed \
 information within the <<< >>> delimiters as your context. \
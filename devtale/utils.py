@@ -1,14 +1,16 @@
+import functools
 import json
+import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
-from pathlib import Path
 
 import json_repair
 import tiktoken
-from langchain import LLMChain, PromptTemplate
-from langchain.callbacks import get_openai_callback
-from langchain.chat_models import ChatOpenAI
+from langchain import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
@@ -18,8 +20,19 @@ from devtale.aggregators import (
     PHPAggregator,
     PythonAggregator,
 )
-from devtale.constants import DOCSTRING_LABEL, GPT_PRICE
-from devtale.schema import FileDocumentation
+from devtale.backends import get_backend
+from devtale.cache import get_cache
+from devtale.constants import (
+    CONTEXT_TOKENS,
+    DOCSTRING_LABEL,
+    GPT_PRICE,
+    MAX_CHUNK_REQUESTS,
+    SUMMARY_ANSWER_TOKENS,
+)
+from devtale.ledger import get_ledger
+from devtale.profiling import annotate, current_annotations, record_call, span
+from devtale.ratelimit import get_rate_limiter
+from devtale.schema import FileDocumentation, SmallFileDocumentation
 from devtale.templates import (
     CODE_EXTRACTOR_TEMPLATE,
     CODE_LEVEL_TEMPLATE,
@@ -27,17 +40,37 @@ from devtale.templates import (
     FOLDER_LEVEL_TEMPLATE,
     FOLDER_SHORT_DESCRIPTION_TEMPLATE,
     NO_CODE_FILE_TEMPLATE,
+    NO_CODE_FILES_TEMPLATE,
+    PARTIAL_SUMMARY_TEMPLATE,
     ROOT_LEVEL_TEMPLATE,
+    SMALL_FILE_TEMPLATE,
 )
+from devtale.walker import walk_repository
 
 TYPE_INFORMATION = {
     "top-level": FILE_LEVEL_TEMPLATE,
     "folder-level": FOLDER_LEVEL_TEMPLATE,
     "root-level": ROOT_LEVEL_TEMPLATE,
     "no-code-file": NO_CODE_FILE_TEMPLATE,
+    "no-code-files": NO_CODE_FILES_TEMPLATE,
     "folder-description": FOLDER_SHORT_DESCRIPTION_TEMPLATE,
+    "partial-summary": PARTIAL_SUMMARY_TEMPLATE,
 }
 
+# Prompts that only combine their inputs, so that a single input is already
+# the answer.
+COMBINE_CONTENT_TYPES = ["top-level"]
+
+# Next to the LLM cache rather than inside it, so that its eviction never
+# touches the vocabulary.
+TIKTOKEN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "devtale-tiktoken")
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry of prompts, see _get_prompt.
+_registry_lock = threading.Lock()
+_prompts = {}
+
 
 def split_text(text, chunk_size=1000, chunk_overlap=0):
     text_splitter = RecursiveCharacterTextSplitter(
@@ -58,25 +91,17 @@ def split_code(code, language, chunk_size=1000, chunk_overlap=0):
 def extract_code_elements(
     big_doc, verbose=False, model_name="gpt-4-1106-preview", cost_estimation=False
 ):
-    prompt = PromptTemplate(
-        template=CODE_EXTRACTOR_TEMPLATE,
-        input_variables=["code"],
-    )
-    extractor = LLMChain(
-        llm=ChatOpenAI(model_name=model_name), prompt=prompt, verbose=verbose
-    )
-
     if cost_estimation:
+        prompt = _get_prompt("code-extractor")
         estimated_cost = _calculate_cost(
             prompt.format(code=big_doc.page_content), model_name
         )
         return "", estimated_cost
 
-    with get_openai_callback() as cb:
-        result_string = extractor({"code": big_doc.page_content})
-        cost = cb.total_cost
-
-    return result_string["text"], cost
+    with span("extract"):
+        return _run_prompt(
+            "code-extractor", {"code": big_doc.page_content}, model_name, verbose
+        )
 
 
 def get_unit_tale(
@@ -86,17 +111,8 @@ def get_unit_tale(
     verbose=False,
     cost_estimation=False,
 ):
-    parser = PydanticOutputParser(pydantic_object=FileDocumentation)
-    prompt = PromptTemplate(
-        template=CODE_LEVEL_TEMPLATE,
-        input_variables=["code", "code_elements"],
-        partial_variables={"format_instructions": parser.get_format_instructions()},
-    )
-    teller_of_tales = LLMChain(
-        llm=ChatOpenAI(model_name=model_name), prompt=prompt, verbose=verbose
-    )
-
     if cost_estimation:
+        prompt = _get_prompt("code-level")
         estimated_cost = _calculate_cost(
             prompt.format(
                 code=short_doc.page_content, code_elements=str(code_elements)
@@ -105,19 +121,58 @@ def get_unit_tale(
         )
         return {"classes": [], "methods": []}, estimated_cost
 
-    with get_openai_callback() as cb:
-        result_string = teller_of_tales(
-            {"code": short_doc.page_content, "code_elements": code_elements}
+    with span("tale"):
+        text_answer, cost = _run_prompt(
+            "code-level",
+            {"code": short_doc.page_content, "code_elements": code_elements},
+            model_name,
+            verbose,
         )
-        cost = cb.total_cost
 
-    json_answer = _convert_to_json(result_string)
+    with span("parse"):
+        json_answer = _convert_to_json(text_answer)
     if not json_answer:
         print("Returning empty JSON due to a failure")
         json_answer = {"classes": [], "methods": []}
     return json_answer, cost
 
 
+def get_small_file_tale(
+    code,
+    code_elements,
+    model_name="gpt-4-1106-preview",
+    verbose=False,
+    cost_estimation=False,
+):
+    """Document a small file in a single call, that returns the docstrings of
+    its code elements along with its file docstring. Without code elements,
+    GPT finds them in the code itself.
+    """
+    if cost_estimation:
+        prompt = _get_prompt("small-file")
+        estimated_cost = _calculate_cost(
+            prompt.format(code=code, code_elements=str(code_elements)), model_name
+        )
+        return {"classes": [], "methods": [], "file_docstring": ""}, estimated_cost
+
+    with span("tale"):
+        text_answer, cost = _run_prompt(
+            "small-file",
+            {"code": code, "code_elements": code_elements},
+            model_name,
+            verbose,
+        )
+
+    with span("parse"):
+        json_answer = _convert_to_json(text_answer)
+    if not isinstance(json_answer, dict):
+        logger.info("Returning empty JSON due to a failure")
+        json_answer = {}
+    json_answer.setdefault("classes", [])
+    json_answer.setdefault("methods", [])
+    return json_answer, cost
+
+
 def redact_tale_information(
     content_type,
     docs,
@@ -125,28 +180,126 @@ def redact_tale_information(
     model_name="gpt-3.5-turbo",
     cost_estimation=False,
 ):
-    prompt = PromptTemplate(
-        template=TYPE_INFORMATION[content_type], input_variables=["information"]
+    """Return the answer of the content_type prompt for the docs, with its
+    cost. The file, folder and root summaries take their whole input, e.g.
+    the list of summaries of a file, see summarize_map_reduce.
+    """
+    if content_type in ["no-code-file", "no-code-files", "folder-description"]:
+        return _summarize(content_type, str(docs), model_name, verbose, cost_estimation)
+    return summarize_map_reduce(
+        content_type, docs, model_name, verbose, cost_estimation
+    )
+
+
+def summarize_map_reduce(
+    content_type,
+    docs,
+    model_name="gpt-3.5-turbo",
+    verbose=False,
+    cost_estimation=False,
+):
+    """Summarize the docs with the content_type prompt, however big they are.
+
+    A single summary to combine is returned as it is, without any call.
+    Otherwise the docs are split in chunks that fit in the context of the
+    model, and while there is more than one, the chunks are summarized in
+    parallel and their summaries split again, so that the final call gets
+    the information of every chunk. If the summaries do not get shorter,
+    the next ones are asked to fit in a single chunk all together, and a
+    RuntimeError is raised if they still do not.
+    """
+    if content_type in COMBINE_CONTENT_TYPES and isinstance(docs, list):
+        if len(docs) == 1:
+            return str(docs[0]), 0
+
+    budget = min(
+        _summary_budget(content_type, model_name),
+        _summary_budget("partial-summary", model_name),
     )
-    teller_of_tales = LLMChain(
-        llm=ChatOpenAI(model_name=model_name), prompt=prompt, verbose=verbose
+    chunks = _split_tokens(str(docs), budget)
+    answer_tokens = SUMMARY_ANSWER_TOKENS
+    shortened = False
+    cost = 0
+    # The annotations of the calls, e.g. the file, live in this thread.
+    annotations = current_annotations()
+
+    def summarize_chunk(chunk):
+        with annotate(**annotations):
+            return _summarize(
+                "partial-summary",
+                chunk,
+                model_name,
+                verbose,
+                cost_estimation,
+                max_words=_answer_words(answer_tokens),
+            )
+
+    with ThreadPoolExecutor(max_workers=MAX_CHUNK_REQUESTS) as executor:
+        while len(chunks) > 1:
+            summaries = []
+            for summary, call_cost in executor.map(summarize_chunk, chunks):
+                summaries.append(summary)
+                cost += call_cost
+            if cost_estimation:
+                # The summaries are unknown offline, assume that they fit.
+                chunks = [""]
+                break
+            merged = _split_tokens("\n\n".join(summaries), budget)
+            if len(merged) >= len(chunks):
+                if shortened:
+                    raise RuntimeError(
+                        f"The summaries of {len(chunks)} chunks do not get "
+                        f"shorter, even with at most {_answer_words(answer_tokens)} "
+                        "words each."
+                    )
+                shortened = True
+                answer_tokens = min(answer_tokens, budget // len(merged))
+                logger.info(
+                    f"The summaries of {len(chunks)} chunks do not get shorter, "
+                    f"asking for at most {_answer_words(answer_tokens)} words each."
+                )
+            chunks = merged
+
+    answer, call_cost = _summarize(
+        content_type, chunks[0], model_name, verbose, cost_estimation
     )
-    if content_type not in ["no-code-file", "folder-description"]:
-        information = str(docs[0].page_content)
-    else:
-        information = str(docs)
+    return answer, cost + call_cost
+
 
+def _summarize(
+    content_type, information, model_name, verbose, cost_estimation, **inputs
+):
+    inputs["information"] = information
     if cost_estimation:
-        estimated_cost = _calculate_cost(
-            prompt.format(information=information), model_name
-        )
+        prompt = _get_prompt(content_type)
+        estimated_cost = _calculate_cost(prompt.format(**inputs), model_name)
         return "", estimated_cost
 
-    with get_openai_callback() as cb:
-        text_answer = teller_of_tales({"information": information})
-        cost = cb.total_cost
+    with span("summarize"):
+        return _run_prompt(content_type, inputs, model_name, verbose)
+
+
+def _summary_budget(content_type, model_name):
+    """Return the tokens of information that fit in a call of the prompt."""
+    prompt = _get_prompt(content_type).format(information="")
+    return CONTEXT_TOKENS[model_name] - count_tokens(prompt) - SUMMARY_ANSWER_TOKENS
 
-    return text_answer["text"], cost
+
+def _answer_words(tokens):
+    """Return the words of an answer of about that many tokens, as English
+    text takes about 4 tokens for 3 words.
+    """
+    return tokens * 3 // 4
+
+
+def _split_tokens(text, budget):
+    """Split the text in chunks of at most budget tokens."""
+    if count_tokens(text) <= budget:
+        return [text]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=budget, chunk_overlap=0, length_function=count_tokens
+    )
+    return [doc.page_content for doc in splitter.create_documents([text])]
 
 
 def prepare_code_elements(code_elements):
@@ -214,29 +367,10 @@ def fuse_tales_chunks(tales_list, code, code_elements_dict):
 
 
 def build_project_tree(root_dir, indent="", gitignore_patterns=None):
-    if gitignore_patterns is None:
-        gitignore_patterns = []
-
-    tree = ""
-    items = [item for item in os.listdir(root_dir) if not item.startswith(".")]
-    file_paths = []
-
-    for item in sorted(items):
-        item_path = os.path.join(root_dir, item)
-        if _should_ignore(item_path, gitignore_patterns):
-            continue
-        if os.path.isdir(item_path):
-            tree += indent + "├── " + item + "\n"
-            subtree, subfile_paths = build_project_tree(
-                item_path, indent + "│   ", gitignore_patterns
-            )
-            tree += subtree
-            file_paths.extend(subfile_paths)
-        else:
-            tree += indent + "└── " + item + "\n"
-            file_paths.append(item_path)
-
-    return tree, file_paths
+    tree, entries = walk_repository(
+        root_dir, extra_patterns=gitignore_patterns, indent=indent
+    )
+    return tree, [entry.path for entry in entries]
 
 
 def fuse_documentation(code, tale, file_ext, save_path):
@@ -249,23 +383,168 @@ def fuse_documentation(code, tale, file_ext, save_path):
     elif file_ext == ".js" or file_ext == ".ts" or file_ext == ".tsx":
         aggregator = JavascriptAggregator()
 
-    fused_tale = aggregator.document(code=code, documentation=tale)
-    with open(save_path, "w") as file:
+    with span("fuse"):
+        fused_tale = aggregator.document(code=code, documentation=tale)
+    with span("write"), open(save_path, "w") as file:
         file.write(fused_tale)
 
 
+def _get_prompt(template_type):
+    """Return the shared PromptTemplate of the template type, creating it on
+    the first use.
+    """
+    with _registry_lock:
+        if template_type not in _prompts:
+            if template_type == "code-extractor":
+                prompt = PromptTemplate(
+                    template=CODE_EXTRACTOR_TEMPLATE, input_variables=["code"]
+                )
+            elif template_type == "code-level":
+                parser = PydanticOutputParser(pydantic_object=FileDocumentation)
+                prompt = PromptTemplate(
+                    template=CODE_LEVEL_TEMPLATE,
+                    input_variables=["code", "code_elements"],
+                    partial_variables={
+                        "format_instructions": parser.get_format_instructions()
+                    },
+                )
+            elif template_type == "small-file":
+                parser = PydanticOutputParser(pydantic_object=SmallFileDocumentation)
+                prompt = PromptTemplate(
+                    template=SMALL_FILE_TEMPLATE,
+                    input_variables=["code", "code_elements"],
+                    partial_variables={
+                        "format_instructions": parser.get_format_instructions()
+                    },
+                )
+            elif template_type == "partial-summary":
+                prompt = PromptTemplate(
+                    template=PARTIAL_SUMMARY_TEMPLATE,
+                    input_variables=["information"],
+                    partial_variables={
+                        "max_words": _answer_words(SUMMARY_ANSWER_TOKENS)
+                    },
+                )
+            else:
+                prompt = PromptTemplate(
+                    template=TYPE_INFORMATION[template_type],
+                    input_variables=["information"],
+                )
+            _prompts[template_type] = prompt
+        return _prompts[template_type]
+
+
+def _run_prompt(template_type, inputs, model_name, verbose=False):
+    """Send the prompt to the configured backend and return its text answer
+    along with its cost. When the LLM cache is enabled, an answer to the same
+    prompt is reused for free. The call goes through the rate limiter of the
+    model, and is recorded in the run ledger if there is one.
+    """
+    prompt = _get_prompt(template_type).format(**inputs)
+    backend = get_backend()
+    cache = get_cache()
+    ledger = get_ledger()
+    if cache is not None:
+        # Answers of another backend must not be mixed with OpenAI's.
+        cache_name = model_name
+        if backend.name != "openai":
+            cache_name = f"{backend.name}:{model_name}"
+        key = cache.make_key(cache_name, prompt)
+        text_answer = cache.get(key)
+        if text_answer is not None:
+            if ledger is not None:
+                ledger.record(template_type, model_name, cache="hit")
+            return text_answer, 0
+
+    attempts = 0
+
+    def call():
+        nonlocal attempts
+        attempts += 1
+        start = time.perf_counter()
+        completion = backend.complete(model_name, prompt, verbose)
+        end = time.perf_counter()
+        usage = completion.prompt_tokens + completion.completion_tokens
+        record_call(
+            usage,
+            start,
+            end,
+            model=model_name,
+            template=template_type,
+            prompt_tokens=completion.prompt_tokens,
+            completion_tokens=completion.completion_tokens,
+        )
+        return (completion, end - start), usage
+
+    start = time.perf_counter()
+    try:
+        completion, latency = get_rate_limiter(model_name).call(
+            call, count_tokens(prompt)
+        )
+    except Exception as e:
+        if ledger is not None:
+            ledger.record(
+                template_type,
+                model_name,
+                elapsed=time.perf_counter() - start,
+                retries=max(attempts - 1, 0),
+                cache="off" if cache is None else "miss",
+                error=str(e),
+            )
+        raise
+
+    if ledger is not None:
+        ledger.record(
+            template_type,
+            model_name,
+            prompt_tokens=completion.prompt_tokens,
+            completion_tokens=completion.completion_tokens,
+            cost=completion.cost,
+            latency=latency,
+            elapsed=time.perf_counter() - start,
+            retries=attempts - 1,
+            cache="off" if cache is None else "miss",
+        )
+    if cache is not None:
+        cache.set(key, completion.text)
+    return completion.text, completion.cost
+
+
+def count_tokens(text):
+    """Count the tokens of the text with the GPT tokenizer. If the tokenizer is
+    not available offline, approximate it with 4 characters per token.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding():
+    """Load the tokenizer only once per process. tiktoken downloads its
+    vocabulary on the first use, so we keep it in TIKTOKEN_CACHE_DIR to be
+    able to load it offline afterwards.
+    """
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.info(f"Tokenizer not available, approximating tokens - Exception: {e}")
+        return None
+
+
 def _calculate_cost(input: str, model: str):
-    tokens = tiktoken.get_encoding("cl100k_base").encode(input)
-    return (len(tokens) / 1000) * GPT_PRICE[model]
+    return (count_tokens(input) / 1000) * GPT_PRICE[model]
 
 
 def _convert_to_json(text_answer):
     try:
-        result_json = json.loads(text_answer["text"])
+        result_json = json.loads(text_answer)
         return result_json
     except JSONDecodeError:
         try:
-            text = text_answer["text"].replace("\\n", "\n")
+            text = text_answer.replace("\\n", "\n")
             start_index = text.find("{")
             end_index = text.rfind("}")
 
@@ -278,7 +557,7 @@ def _convert_to_json(text_answer):
         except Exception as e:
             print(
                 f"Error getting the JSON. \
-                Error: {e} \n Result: {text_answer['text']}"
+                Error: {e} \n Result: {text_answer}"
             )
             return None
 
@@ -327,11 +606,3 @@ def _is_hallucination(code_definition, code, expected_definitions):
     if not re.search(r"\b" + re.escape(code_definition) + r"\b", code):
         return True
     return False
-
-
-def _should_ignore(path, gitignore_patterns):
-    path = Path(path)
-    for pattern in gitignore_patterns:
-        if path.match(pattern) or any(p.match(pattern) for p in path.parents):
-            return True
-    return False
@@ -0,0 +1,303 @@
+import bisect
+import os
+import re
+from collections import namedtuple
+from itertools import groupby, repeat
+from operator import attrgetter
+
+from devtale.constants import ALLOWED_EXTENSIONS, ALLOWED_NO_CODE_EXTENSIONS, LANGUAGES
+
+IGNORE_FILE_NAMES = [".gitignore", ".devtaleignore"]
+
+_NAME = attrgetter("name")
+
+# The language of each extension we document.
+EXTENSION_LANGUAGES = {
+    file_ext: LANGUAGES[file_ext].value for file_ext in ALLOWED_EXTENSIONS
+}
+EXTENSION_LANGUAGES.update(
+    {file_ext: "no-code" for file_ext in ALLOWED_NO_CODE_EXTENSIONS}
+)
+
+
+class FileEntry(namedtuple("FileEntry", ["path", "language", "folder"])):
+    """A file found by walk_repository. language is the one of
+    EXTENSION_LANGUAGES for the files we document, and None for the other
+    files. The size is only read from the file system when it is used, and
+    is 0 if the file is gone by then.
+    """
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        try:
+            return os.stat(self.path).st_size
+        except OSError:
+            return 0
+
+
+class IgnoreMatcher:
+    """The patterns of an ignore file (gitignore syntax) of a directory,
+    compiled into a few combined regexes that run once over all the entries
+    of a folder.
+
+    Unlike git, a negated pattern re-includes a path whatever the order of
+    the patterns: a path is ignored if it matches a pattern and no negated
+    one.
+    """
+
+    def __init__(self, base_path, patterns):
+        self.base_path = os.path.join(base_path, "")
+        # (negated, directories only, anchored, depth) -> regexes
+        groups = {}
+        for pattern in patterns:
+            parsed = _parse_pattern(pattern)
+            if parsed is not None:
+                groups.setdefault(parsed[1:], []).append(parsed[0])
+        self._groups = [
+            (*key, re.compile("^(?:" + "|".join(regexes) + ")$", re.MULTILINE))
+            for key, regexes in groups.items()
+        ]
+
+    def __bool__(self):
+        return bool(self._groups)
+
+    def match(self, folder_path, file_names, dir_names):
+        """Return the names of the entries of a folder inside the base path
+        that are ignored, and the ones that are explicitly re-included.
+        """
+        # Anchored patterns match the path relative to the base path, and
+        # only the entries at their depth if they have no "**".
+        prefix = os.path.join(folder_path, "")[len(self.base_path) :]
+        depth = prefix.count("/")
+        names = {False: file_names + dir_names, True: dir_names}
+        texts = {}
+
+        ignored = set()
+        included = set()
+        for negated, directory_only, anchored, pattern_depth, regex in self._groups:
+            if pattern_depth is not None and pattern_depth != depth:
+                continue
+            key = (directory_only, anchored)
+            if key not in texts:
+                separator = "\n" + prefix if anchored else "\n"
+                texts[key] = separator[1:] + separator.join(names[directory_only])
+            text = texts[key]
+            matched = included if negated else ignored
+            for match in regex.finditer(text):
+                name = match.group()
+                matched.add(name[len(prefix) :] if anchored else name)
+        return ignored, included
+
+
+def walk_repository(root_path, recursive=True, extra_patterns=None, indent=""):
+    """Walk the repository once with os.scandir, skipping hidden and ignored
+    entries without descending into ignored directories. The .gitignore and
+    .devtaleignore files of every folder apply to its subtree, and
+    extra_patterns to the whole walk.
+
+    Returns the project tree, rendered as build_project_tree always did, and
+    the list of FileEntry of every file, in the order of the tree.
+    """
+    tree = []
+    entries = []
+    matchers = []
+    if extra_patterns:
+        matchers.append(IgnoreMatcher(root_path, extra_patterns))
+    _walk_folder(root_path, indent, recursive, matchers, tree, entries)
+    return "".join(tree), entries
+
+
+def group_by_folder(entries):
+    """Return the documented files of each folder, as a dict of folder path
+    -> list of FileEntry, with the folders sorted by depth (root first).
+    """
+    folders = {}
+    # The entries of a folder come in runs, between the ones of its
+    # subfolders, and the language of the documented files is never empty.
+    for folder, run in groupby(entries, attrgetter("folder")):
+        documented = list(filter(attrgetter("language"), run))
+        if documented:
+            folders.setdefault(folder, []).extend(documented)
+    return {
+        folder: folders[folder]
+        for folder in sorted(folders, key=lambda path: path.count("/"))
+    }
+
+
+def _walk_folder(folder_path, indent, recursive, matchers, tree, entries):
+    try:
+        with os.scandir(folder_path) as iterator:
+            items = sorted(iterator, key=_NAME)
+    except OSError:
+        return
+
+    visible = [item for item in items if item.name[0] != "."]
+    if len(visible) < len(items):
+        hidden = {item.name: item for item in items if item.name[0] == "."}
+        ignore_patterns = []
+        for name in IGNORE_FILE_NAMES:
+            if name in hidden and hidden[name].is_file():
+                try:
+                    with open(hidden[name].path, "r") as ignore_file:
+                        ignore_patterns.extend(ignore_file.read().splitlines())
+                except (OSError, UnicodeDecodeError):
+                    continue
+        if ignore_patterns:
+            matcher = IgnoreMatcher(folder_path, ignore_patterns)
+            if matcher:
+                matchers = matchers + [matcher]
+
+    file_items, dir_items = _split_items(visible)
+    file_names = list(map(_NAME, file_items))
+    dir_names = list(map(_NAME, dir_items))
+    if matchers:
+        file_names, dir_names = _remove_ignored(
+            matchers, folder_path, file_names, dir_names
+        )
+
+    # The files between two directories are rendered and turned into entries
+    # all at once, instead of one by one.
+    path_prefix = os.path.join(folder_path, "")
+    folder = os.path.dirname(path_prefix)
+    file_separator = "\n" + indent + "└── "
+    position = 0
+    for dir_name in dir_names:
+        end = bisect.bisect_left(file_names, dir_name, position)
+        _add_files(
+            file_names[position:end], file_separator, path_prefix, folder, tree, entries
+        )
+        position = end
+        tree.append(indent + "├── " + dir_name + "\n")
+        if recursive:
+            _walk_folder(
+                path_prefix + dir_name,
+                indent + "│   ",
+                recursive,
+                matchers,
+                tree,
+                entries,
+            )
+    _add_files(
+        file_names[position:], file_separator, path_prefix, folder, tree, entries
+    )
+
+
+def _add_files(file_names, file_separator, path_prefix, folder, tree, entries):
+    if not file_names:
+        return
+    tree.append(file_separator[1:] + file_separator.join(file_names) + "\n")
+    extensions = [name[name.rfind(".") :] if "." in name else "" for name in file_names]
+    # tuple.__new__ creates the entries without a Python call each.
+    entries.extend(
+        map(
+            tuple.__new__,
+            repeat(FileEntry),
+            zip(
+                [path_prefix + name for name in file_names],
+                map(EXTENSION_LANGUAGES.get, extensions),
+                repeat(folder),
+            ),
+        )
+    )
+
+
+def _split_items(items):
+    """Return the DirEntry of the files and the ones of the directories.
+    Dangling symlinks, sockets and the like are neither, and are left out.
+    """
+    try:
+        file_items = [item for item in items if item.is_file()]
+        if len(file_items) == len(items):
+            return file_items, []
+        return file_items, [item for item in items if item.is_dir()]
+    except OSError:
+        # e.g. a symlink into a folder we may not read, which is rare enough
+        # to check the entries one by one.
+        file_items = []
+        dir_items = []
+        for item in items:
+            try:
+                if item.is_file():
+                    file_items.append(item)
+                elif item.is_dir():
+                    dir_items.append(item)
+            except OSError:
+                continue
+        return file_items, dir_items
+
+
+def _remove_ignored(matchers, folder_path, file_names, dir_names):
+    # The deepest ignore file with an opinion about an entry wins.
+    decisions = {}
+    for matcher in reversed(matchers):
+        ignored, included = matcher.match(folder_path, file_names, dir_names)
+        for name in included:
+            decisions.setdefault(name, False)
+        for name in ignored:
+            decisions.setdefault(name, True)
+    if not any(decisions.values()):
+        return file_names, dir_names
+    return (
+        [name for name in file_names if not decisions.get(name)],
+        [name for name in dir_names if not decisions.get(name)],
+    )
+
+
+def _parse_pattern(pattern):
+    """Translate a gitignore pattern into (regex, negated, directories only,
+    anchored, depth), or None for blank lines and comments. depth is the
+    number of slashes of the paths that an anchored pattern without "**"
+    matches, and None for the other patterns.
+    """
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\"):
+        pattern = pattern[1:]
+
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A pattern with a slash is relative to the ignore file, otherwise it
+    # matches a name at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+    depth = None
+    if anchored and "**" not in pattern and "[" not in pattern:
+        depth = pattern.count("/")
+
+    # Entries are matched one per line, so nothing may match a line break.
+    regex = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            regex.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            regex.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            regex.append("[^/\n]*")
+        elif char == "?":
+            regex.append("[^/\n]")
+        elif char == "[" and pattern.find("]", index + 2) != -1:
+            end = pattern.find("]", index + 2)
+            char_class = pattern[index + 1 : end].replace("\\", "\\\\")
+            if char_class.startswith("!") or char_class.startswith("^"):
+                char_class = "^/\n" + char_class[1:]
+            regex.append("[" + char_class + "]")
+            index = end
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return "(?:" + "".join(regex) + ")", negated, directory_only, anchored, depth
@@ -0,0 +1,23 @@
+import pytest
+
+from devtale import fingerprint, ledger
+from devtale.backends import FakeBackend, configure_backend
+from devtale.cache import configure_cache
+from devtale.constants import RATE_LIMITS
+from devtale.ratelimit import configure_rate_limits
+
+
+@pytest.fixture
+def fake_llm():
+    """Answer the prompts with the fake backend, without cache nor quotas,
+    and record the calls in a fresh ledger.
+    """
+    configure_backend(FakeBackend())
+    configure_cache(None)
+    configure_rate_limits({model_name: (None, None) for model_name in RATE_LIMITS})
+    run_ledger = ledger.configure_ledger()
+    yield run_ledger
+    run_ledger.close()
+    ledger._ledger = None
+    fingerprint._index = None
+    configure_rate_limits()
@@ -0,0 +1,183 @@
+import json
+import random
+import threading
+from http.server import ThreadingHTTPServer
+
+import openai
+import pytest
+from click.testing import CliRunner
+
+from devtale import cli
+from devtale.backends import (
+    FakeBackend,
+    OpenAIBackend,
+    fake_answer,
+    get_backend,
+    parse_distribution,
+)
+from devtale.fake_server import make_handler
+from devtale.ledger import get_ledger
+from devtale.templates import CODE_EXTRACTOR_TEMPLATE
+
+CODE = """class Greeter:
+    def greet(self, name):
+        return f"Hello {name}"
+
+
+def main():
+    Greeter().greet("world")
+"""
+
+
+@pytest.fixture
+def fake_server():
+    """Serve a fake backend on a free local port, and return its base URL."""
+    backends = []
+
+    def start(backend=None):
+        backend = backend or FakeBackend()
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(backend))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        backends.append((server, thread))
+        return f"http://127.0.0.1:{server.server_port}/v1"
+
+    yield start
+    for server, thread in backends:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _extraction_prompt(code):
+    return CODE_EXTRACTOR_TEMPLATE.replace("{code}", code)
+
+
+def test_parse_distribution():
+    generator = random.Random(0)
+    assert parse_distribution("constant:0.5")(generator) == 0.5
+    assert 1 <= parse_distribution("uniform:1:2")(generator) <= 2
+    assert parse_distribution("exponential:0")(generator) == 0
+    assert parse_distribution("lognormal:1:0")(generator) == 1
+    for spec in ["constant", "uniform:1", "gamma:1", "constant:a"]:
+        with pytest.raises(ValueError):
+            parse_distribution(spec)
+
+
+def test_fake_answer_lists_the_declarations():
+    answer = fake_answer(_extraction_prompt(CODE))
+
+    assert answer.splitlines()[:2] == [
+        'classes=["Greeter"]',
+        'methods=["greet", "main"]',
+    ]
+
+
+def test_fake_backend_is_deterministic():
+    prompt = _extraction_prompt(CODE)
+    first = FakeBackend(error_rate=0.5)
+    second = FakeBackend(error_rate=0.5)
+
+    def outcomes(backend):
+        results = []
+        for _ in range(20):
+            try:
+                results.append(backend.complete("gpt-3.5-turbo", prompt).text)
+            except openai.error.APIError:
+                results.append(None)
+        return results
+
+    results = outcomes(first)
+    assert results == outcomes(second)
+    # Each call of the same prompt draws its own failure.
+    assert None in results and fake_answer(prompt) in results
+
+
+def test_fake_backend_rate_limits():
+    backend = FakeBackend(rate_limit_rate=1.0)
+
+    with pytest.raises(openai.error.RateLimitError):
+        backend.complete("gpt-3.5-turbo", "Summarize this")
+
+
+def test_openai_backend_calls_the_base_url(fake_server, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "local")
+    base_url = fake_server()
+    backend = OpenAIBackend(base_url=base_url)
+    prompt = _extraction_prompt(CODE)
+
+    completion = backend.complete("gpt-3.5-turbo", prompt)
+
+    assert backend.name == f"openai@{base_url}"
+    assert completion.text == fake_answer(prompt)
+    assert completion.prompt_tokens > 0 and completion.completion_tokens > 0
+
+
+def test_fake_server_errors(fake_server, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "local")
+    limited = OpenAIBackend(fake_server(FakeBackend(rate_limit_rate=1.0)))
+    failing = OpenAIBackend(fake_server(FakeBackend(error_rate=1.0)))
+
+    with pytest.raises(openai.error.RateLimitError):
+        limited.complete("gpt-3.5-turbo", "Summarize this")
+    with pytest.raises(openai.error.APIError):
+        failing.complete("gpt-3.5-turbo", "Summarize this")
+
+
+def _document(tmp_path, *args):
+    (tmp_path / "greeter.py").write_text(CODE)
+    output_path = tmp_path / "docs"
+    result = CliRunner().invoke(
+        cli.main,
+        ["-p", str(tmp_path / "greeter.py"), "-o", str(output_path), "--no-cache"]
+        + list(args),
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+    return json.loads((output_path / "greeter.py.json").read_text())
+
+
+class Prompted(Exception):
+    pass
+
+
+def _prompt(prompt):
+    raise Prompted(prompt)
+
+
+def test_cli_fake_backend(tmp_path, fake_llm, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(cli.getpass, "getpass", _prompt)
+
+    tale = _document(tmp_path, "--backend", "fake")
+
+    assert isinstance(get_backend(), FakeBackend)
+    assert sorted(method["method_name"] for method in tale["methods"]) == [
+        "greet",
+        "main",
+    ]
+    assert {record["file"] for record in get_ledger().records} == {
+        str(tmp_path / "greeter.py")
+    }
+
+
+def test_cli_llm_base_url(tmp_path, fake_llm, fake_server, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(cli.getpass, "getpass", _prompt)
+    base_url = fake_server()
+
+    tale = _document(tmp_path, "--llm-base-url", base_url)
+
+    assert get_backend().name == f"openai@{base_url}"
+    assert [cls["class_name"] for cls in tale["classes"]] == ["Greeter"]
+
+
+def test_cli_prompts_for_the_key_of_a_remote_api(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(cli.getpass, "getpass", _prompt)
+
+    for args in [[], ["--llm-base-url", "https://llm.example.com/v1"]]:
+        result = CliRunner().invoke(
+            cli.main, ["-p", str(tmp_path), "--no-cache"] + args
+        )
+        assert isinstance(result.exception, Prompted)
@@ -0,0 +1,81 @@
+import os
+import time
+
+from devtale.cache import LLMCache
+
+
+def _age(cache, key, seconds):
+    """Make the entry of the key look last used seconds ago."""
+    mtime = time.time() - seconds
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_set_and_get(tmp_path):
+    cache = LLMCache(str(tmp_path), memory_items=1)
+    key = cache.make_key("gpt-3.5-turbo", "prompt")
+    other_key = cache.make_key("gpt-3.5-turbo", "other prompt")
+    assert key != other_key
+    assert cache.get(key) is None
+
+    cache.set(key, "answer")
+    cache.set(other_key, "other answer")
+
+    # The first answer is no longer in memory, it comes from its file.
+    assert list(cache._memory) == [other_key]
+    assert cache.get(key) == "answer"
+    assert LLMCache(str(tmp_path)).get(other_key) == "other answer"
+
+
+def test_expired_answers_are_not_returned(tmp_path):
+    cache = LLMCache(str(tmp_path), max_age=60)
+    key = cache.make_key("gpt-3.5-turbo", "prompt")
+    cache.set(key, "answer")
+    _age(cache, key, 120)
+
+    assert LLMCache(str(tmp_path), max_age=60).get(key) is None
+    assert LLMCache(str(tmp_path)).get(key) == "answer"
+
+
+def test_memory_hits_follow_the_age_of_the_answers(tmp_path):
+    cache = LLMCache(str(tmp_path), max_age=60)
+    key = cache.make_key("gpt-3.5-turbo", "prompt")
+    cache.set(key, "answer")
+    _age(cache, key, 120)
+
+    # A hit in memory keeps the file fresh on disk.
+    assert cache.get(key) == "answer"
+    assert time.time() - os.path.getmtime(cache._path(key)) < 60
+    assert LLMCache(str(tmp_path), max_age=60).get(key) == "answer"
+
+    # An answer unused for too long is not returned from memory either.
+    cache._memory[key] = ("answer", time.time() - 120)
+    _age(cache, key, 120)
+    assert cache.get(key) is None
+    assert key not in cache._memory
+
+
+def test_evict_removes_least_recently_used_answers_only(tmp_path):
+    cache = LLMCache(str(tmp_path), max_size=10**6)
+    keys = [cache.make_key("gpt-3.5-turbo", f"prompt {index}") for index in range(10)]
+    for index, key in enumerate(keys):
+        cache.set(key, "x" * 100)
+        _age(cache, key, 1000 - index)
+    # Files that are not answers: a temporary file that another process is
+    # writing, and the files of another tool.
+    in_flight = tmp_path / keys[0][:2] / "tmpabcd.tmp"
+    in_flight.write_text("y" * 10000)
+    os.utime(in_flight, (0, 0))
+    vocabulary = tmp_path / "tiktoken" / "vocabulary"
+    vocabulary.parent.mkdir()
+    vocabulary.write_text("z" * 10000)
+    os.utime(vocabulary, (0, 0))
+
+    entry_size = os.path.getsize(cache._path(keys[0]))
+    cache.max_size = entry_size * 5
+    cache.evict()
+
+    remaining = [key for key in keys if os.path.exists(cache._path(key))]
+    assert remaining == keys[-4:]
+    assert cache._disk_size == entry_size * 4
+    assert in_flight.exists()
+    assert vocabulary.exists()
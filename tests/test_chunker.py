@@ -0,0 +1,91 @@
+import ast
+
+import pytest
+
+from devtale.chunker import chunk_code
+from devtale.utils import count_tokens
+
+
+def _functions(count, lines, prefix="function"):
+    return "".join(
+        f"def {prefix}_{index}(x):\n"
+        + "".join(f"    x = x + {line}\n" for line in range(lines))
+        + "    return x\n\n\n"
+        for index in range(count)
+    )
+
+
+def _check_chunks(code, chunks, budget):
+    # Contiguous offsets covering the whole code, within the budget.
+    assert chunks[0].start == 0
+    assert chunks[-1].end == len(code)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.end == chunk.start
+    for chunk in chunks:
+        assert chunk.tokens <= budget
+        assert chunk.source is code
+
+
+def _in_one_chunk(text, chunks):
+    return any(text in chunk.page_content for chunk in chunks)
+
+
+def test_chunks_do_not_split_declarations_that_fit():
+    code = _functions(20, 5)
+    budget = 200
+
+    (chunks,) = chunk_code(code, ".py", budget)
+
+    _check_chunks(code, chunks, budget)
+    # Several small functions per chunk, each of them whole.
+    assert len(chunks) < 20
+    for chunk in chunks:
+        ast.parse(chunk.page_content)
+
+
+def test_chunks_split_a_declaration_that_does_not_fit():
+    small = _functions(3, 2, prefix="small")
+    code = _functions(1, 100) + small
+    budget = 100
+
+    (chunks,) = chunk_code(code, ".py", budget)
+
+    _check_chunks(code, chunks, budget)
+    assert len(chunks) > 1
+    # The small functions after the big one are not split.
+    for function in small.split("\n\n\n")[:-1]:
+        assert _in_one_chunk(function, chunks)
+
+
+def test_coarse_and_fine_chunks_from_one_pass():
+    methods = [
+        f"  method{index}(value) {{\n    return value + {index};\n  }}\n"
+        for index in range(30)
+    ]
+    code = "class Store {\n" + "\n".join(methods) + "}\n"
+
+    coarse, fine = chunk_code(code, ".js", 10000, 100)
+
+    assert len(coarse) == 1
+    assert coarse[0].page_content == code
+    assert coarse[0].tokens == sum(
+        count_tokens(line) for line in code.splitlines(keepends=True)
+    )
+    _check_chunks(code, fine, 100)
+    assert len(fine) > 1
+    for method in methods:
+        assert _in_one_chunk(method, fine)
+
+
+def test_long_line_is_split():
+    code = "x = [" + ", ".join(str(index) for index in range(2000)) + "]\n"
+
+    (chunks,) = chunk_code(code, ".py", 100)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.page_content for chunk in chunks) == code
+
+
+@pytest.mark.parametrize("code", ["", "\n\n", "   \n"])
+def test_blank_code_has_no_chunks(code):
+    assert chunk_code(code, ".py", 100) == [[]]
@@ -0,0 +1,115 @@
+import hashlib
+
+from devtale.cli import process_file, process_repository
+from devtale.constants import DOCSTRING_LABEL
+from devtale.dedup import Reference, changed_declarations, find_duplicates
+
+CODE = """class A:
+    def run(self, x):
+        return x + 1
+
+
+def helper(y):
+    return y * 2
+"""
+
+
+def test_find_duplicates_exact_and_near(tmp_path):
+    body = "".join(
+        f"def function_{index}(x):\n    return x + {index}\n\n" for index in range(40)
+    )
+    (tmp_path / "a.py").write_text(body)
+    (tmp_path / "b.py").write_text(body)
+    (tmp_path / "c.py").write_text(body.replace("return x + 39", "return x - 39"))
+    (tmp_path / "d.js").write_text(body)
+    (tmp_path / "e.py").write_text("def other():\n    pass\n")
+    paths = [str(tmp_path / name) for name in ["a.py", "b.py", "c.py", "d.js", "e.py"]]
+
+    duplicates = find_duplicates(paths)
+
+    assert duplicates[paths[1]] == (paths[0], 1.0, True)
+    assert duplicates[paths[2]].reference == paths[0]
+    assert not duplicates[paths[2]].exact
+    # Copies in another language, or different files, are documented apart.
+    assert paths[3] not in duplicates
+    assert paths[4] not in duplicates
+
+
+def test_changed_declarations():
+    code = CODE.replace("return y * 2", "return y * 3")
+    changed = changed_declarations(code, CODE, ".py")
+    assert [declaration.name for declaration in changed] == ["helper"]
+
+
+def test_exact_copy_reused_with_in_place_fuse(tmp_path, fake_llm):
+    (tmp_path / "a.py").write_text(CODE)
+    (tmp_path / "b.py").write_text(CODE)
+
+    # The output is the repository itself, so a.py is fused before b.py is
+    # processed.
+    process_repository(str(tmp_path), str(tmp_path), fuse=True)
+
+    assert fake_llm.reuses == [(str(tmp_path / "b.py"), str(tmp_path / "a.py"), True)]
+    assert not [
+        record
+        for record in fake_llm.records
+        if record["file"] == str(tmp_path / "b.py")
+    ]
+    assert (tmp_path / "a.py").read_text() == (tmp_path / "b.py").read_text()
+
+
+def test_find_duplicates_with_known_digests(tmp_path):
+    for name, content in [("a.py", CODE), ("b.py", CODE), ("c.py", "x = 1\n")]:
+        (tmp_path / name).write_text(content)
+    paths = [str(tmp_path / name) for name in ["a.py", "b.py", "c.py"]]
+    digest = hashlib.sha256(b"x = 1\n").hexdigest()
+
+    # a.py is not read: the digest given for it makes c.py its copy, and
+    # b.py no longer is.
+    duplicates = find_duplicates(paths, digests={paths[0]: digest})
+
+    assert duplicates == {paths[2]: (paths[0], 1.0, True)}
+
+
+def test_incremental_copy_of_unchanged_file(tmp_path, fake_llm):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    (repository / "a.py").write_text(CODE)
+    output = str(tmp_path / "output")
+    process_repository(str(repository), output, incremental=True)
+
+    (repository / "b.py").write_text(CODE)
+    fake_llm.records.clear()
+    process_repository(str(repository), output, incremental=True)
+
+    # a.py did not change, and b.py reuses its tale without any call.
+    assert fake_llm.reuses == [
+        (str(repository / "b.py"), str(repository / "a.py"), True)
+    ]
+    assert not [record for record in fake_llm.records if record["file"]]
+    assert (tmp_path / "output" / "b.py.json").read_text() == (
+        tmp_path / "output" / "a.py.json"
+    ).read_text()
+
+
+def test_near_copy_documents_names_missing_from_reference(tmp_path, fake_llm):
+    near_copy = CODE.replace("return x + 1", "return x - 1")
+    (tmp_path / "b.py").write_text(near_copy)
+    # GPT skipped helper in the tale of the reference.
+    reference_tale = {
+        "file_docstring": "Reference.",
+        "classes": [{"class_name": "A", "class_docstring": "The A class."}],
+        "methods": [{"method_name": "run", "method_docstring": "Run it."}],
+    }
+
+    tale, _ = process_file(
+        str(tmp_path / "b.py"),
+        str(tmp_path / "output"),
+        reference=Reference(str(tmp_path / "a.py"), CODE, reference_tale),
+    )
+
+    docstrings = {info["method_name"]: info for info in tale["methods"]}
+    assert set(docstrings) == {"run", "helper"}
+    assert [info["class_docstring"] for info in tale["classes"]] == [
+        DOCSTRING_LABEL + "\nThe A class."
+    ]
@@ -0,0 +1,57 @@
+from collections import Counter
+
+from devtale.cli import estimate_documentation_cost, process_repository
+from devtale.estimation import SUMMARY_MODEL, TALE_MODEL, _estimate_file
+
+FILES = {
+    # Parsed, without any function/class: summarized from its code.
+    "constants.py": "TIMEOUT = 10\nRETRIES = [1, 2, 4]\n",
+    # Small: its docstrings and summary come in a single call.
+    "helpers.py": "def add(a, b):\n    return a + b\n\n\n"
+    "def sub(a, b):\n    return a - b\n",
+    "config.yaml": "name: devtale\nversion: 1\n",
+}
+
+
+def _write_files(root):
+    for name, content in FILES.items():
+        (root / name).write_text(content)
+
+
+def test_estimate_file_calls(tmp_path):
+    _write_files(tmp_path)
+
+    assert [model for model, _ in _estimate_file(str(tmp_path / "constants.py"))] == [
+        SUMMARY_MODEL
+    ]
+    assert [model for model, _ in _estimate_file(str(tmp_path / "helpers.py"))] == [
+        TALE_MODEL
+    ]
+    assert [model for model, _ in _estimate_file(str(tmp_path / "config.yaml"))] == [
+        SUMMARY_MODEL
+    ]
+
+
+def test_estimate_matches_the_calls_of_a_run(tmp_path, fake_llm):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    _write_files(repository)
+
+    report = estimate_documentation_cost(str(repository), recursive=True, jobs=1)
+    process_repository(str(repository), str(tmp_path / "output"))
+
+    calls = Counter()
+    tokens = Counter()
+    for record in fake_llm.records:
+        calls[record["file"]] += 1
+        tokens[record["file"]] += record["prompt_tokens"]
+    assert {
+        file_name: (entry["calls"], entry["input_tokens"])
+        for file_name, entry in report["files"].items()
+    } == {
+        file_name: (
+            calls[str(repository / file_name)],
+            tokens[str(repository / file_name)],
+        )
+        for file_name in FILES
+    }
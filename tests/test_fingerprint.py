@@ -0,0 +1,124 @@
+import pytest
+
+from devtale.fingerprint import DocstringIndex, fingerprint_declarations
+
+
+def _fingerprints(code, file_ext):
+    return {
+        declaration.name: declaration
+        for declaration in fingerprint_declarations(code, file_ext)
+    }
+
+
+def test_python_abstracts_only_bound_names():
+    first = _fingerprints("def a(x):\n    return foo(x, 1)\n", ".py")["a"]
+    renamed = _fingerprints("def b(y):\n    return foo(y, 1)\n", ".py")["b"]
+    other = _fingerprints("def b(y):\n    return bar(y, 's')\n", ".py")["b"]
+
+    assert first.fingerprint == renamed.fingerprint
+    assert first.identifiers == ["a", "x"]
+    assert renamed.identifiers == ["b", "y"]
+    assert first.fingerprint != other.fingerprint
+
+
+@pytest.mark.parametrize(
+    "other",
+    [
+        # Another attribute, module or literal.
+        "def b(y):\n    return y.size + os.sep + 'a'\n",
+        "def b(y):\n    return y.name + posixpath.sep + 'a'\n",
+        "def b(y):\n    return y.name + os.sep + 'b'\n",
+    ],
+)
+def test_python_keeps_attributes_modules_and_literals(other):
+    code = "def a(x):\n    return x.name + os.sep + 'a'\n"
+    assert (
+        _fingerprints(code, ".py")["a"].fingerprint
+        != _fingerprints(other, ".py")["b"].fingerprint
+    )
+
+
+def test_python_abstracts_locals_but_not_globals():
+    code = """def a(x):
+    global COUNT
+    try:
+        total = x + COUNT
+    except ValueError as error:
+        total = error
+    return [item for item in total]
+"""
+    declaration = _fingerprints(code, ".py")["a"]
+    assert declaration.identifiers == ["a", "x", "total", "error", "item"]
+    other = code.replace("COUNT", "LIMIT").replace("total", "result")
+    assert declaration.fingerprint != _fingerprints(other, ".py")["a"].fingerprint
+
+
+@pytest.mark.parametrize(
+    "file_ext, first, renamed, other",
+    [
+        (
+            ".js",
+            "function a(x, ...rest) {\n"
+            "  const y = foo(x, 1);\n"
+            "  return rest.map((r, i) => r.name + y + i);\n"
+            "}\n",
+            "function b(p, ...others) {\n"
+            "  const q = foo(p, 1);\n"
+            "  return others.map((o, j) => o.name + q + j);\n"
+            "}\n",
+            "function b(p, ...others) {\n"
+            "  const q = foo(p, 1);\n"
+            "  return others.map((o, j) => o.size + q + j);\n"
+            "}\n",
+        ),
+        (
+            ".go",
+            "package m\n\nfunc A(x int) (int, error) {\n"
+            '\tv, err := foo(x, "s")\n\treturn v, err\n}\n',
+            "package m\n\nfunc B(y int) (int, error) {\n"
+            '\tw, e := foo(y, "s")\n\treturn w, e\n}\n',
+            "package m\n\nfunc B(y int) (int, error) {\n"
+            '\tw, e := foo(y, "t")\n\treturn w, e\n}\n',
+        ),
+        (
+            ".php",
+            '<?php\nfunction a($x) { $v = $this->name . $x; return bar("a"); }\n',
+            '<?php\nfunction b($y) { $w = $this->name . $y; return bar("a"); }\n',
+            '<?php\nfunction b($y) { $w = $this->name . $y; return baz("a"); }\n',
+        ),
+    ],
+)
+def test_scanned_languages_abstract_only_bound_names(file_ext, first, renamed, other):
+    first = list(_fingerprints(first, file_ext).values())[0]
+    renamed = list(_fingerprints(renamed, file_ext).values())[0]
+    other = list(_fingerprints(other, file_ext).values())[0]
+
+    assert first.fingerprint == renamed.fingerprint
+    assert len(first.identifiers) == len(renamed.identifiers)
+    assert first.fingerprint != other.fingerprint
+
+
+def test_go_unnamed_parameters_are_types():
+    code = "package m\n\nfunc A(int, pkg.T) int {\n\treturn 1\n}\n"
+    assert _fingerprints(code, ".go")["A"].identifiers == ["A"]
+
+
+def test_index_lookup_substitutes_names():
+    index = DocstringIndex()
+    code = (
+        "def get_name(user):\n    return user.name\n\n\n"
+        "def get_title(page):\n    return page.name\n"
+    )
+    declarations = fingerprint_declarations(code, ".py")
+    index.update(
+        declarations,
+        {"methods": [{"method_name": "get_name", "method_docstring": "Get user."}]},
+    )
+
+    tale = index.lookup(
+        declarations, {"classes": [], "methods": ["get_title"]}, {"get_title"}
+    )
+
+    assert tale["methods"] == [
+        {"method_name": "get_title", "method_docstring": "Get page."}
+    ]
@@ -0,0 +1,60 @@
+from devtale.aggregators.go import GoAggregator
+
+CODE = """package main
+
+// Hello is documented.
+func Hello() string {
+\treturn "hi"
+}
+
+func (s *Server) Start(port int) error {
+\treturn nil
+}
+
+/* Stop is documented too. */
+
+func (s *Server) Stop() {
+}
+
+type Server struct {
+\tport int
+}
+"""
+
+DOCUMENTATION = {
+    "file_docstring": "Runs the server.",
+    "classes": [{"class_name": "Server", "class_docstring": "A server."}],
+    "methods": [
+        {"method_name": name, "method_docstring": f"{name} does it."}
+        for name in ["Hello", "Start", "Stop", "Missing"]
+    ],
+}
+
+
+def test_document_skips_declarations_with_a_comment_before():
+    documented = GoAggregator().document(DOCUMENTATION, CODE)
+
+    assert documented == "// Runs the server.\n" + CODE.replace(
+        "func (s *Server) Start", "// Start does it.\nfunc (s *Server) Start"
+    ).replace("type Server", "// A server.\ntype Server")
+
+
+def test_document_many_functions():
+    code = "package main\n\n" + "".join(
+        f"func Step{index}() int {{\n\treturn {index}\n}}\n\n" for index in range(300)
+    )
+    documentation = {
+        "file_docstring": "Steps.",
+        "classes": [],
+        "methods": [
+            {"method_name": f"Step{index}", "method_docstring": f"Step {index}."}
+            for index in range(300)
+        ],
+    }
+
+    documented = GoAggregator().document(documentation, code)
+
+    lines = documented.split("\n")
+    for index in (0, 1, 10, 299):
+        position = lines.index(f"func Step{index}() int {{")
+        assert lines[position - 1] == f"// Step {index}."
@@ -0,0 +1,243 @@
+import pytest
+
+from devtale.aggregators.javascript import JavascriptAggregator
+
+
+def _documentation(*methods, classes=()):
+    return {
+        "file_docstring": "The module.",
+        "classes": [
+            {"class_name": name, "class_docstring": f"Docs of {name}."}
+            for name in classes
+        ],
+        "methods": [
+            {"method_name": name, "method_docstring": f"Docs of {name}."}
+            for name in methods
+        ],
+    }
+
+
+# The outputs are the ones of the aggregator before declarations were
+# indexed once per pass.
+CASES = {
+    "js": (
+        """import { api } from "./api";
+
+export class Store extends Base {
+  constructor(state) {
+    super();
+    this.state = state;
+  }
+
+  // Save the state.
+  save() {
+    return api.save(this.state);
+  }
+
+  load(id) {
+    return api.load(id);
+  }
+}
+
+export function createStore(state) {
+  return new Store(state);
+}
+
+export default function reset() {
+  return null;
+}
+""",
+        _documentation(
+            "constructor",
+            "save",
+            "load",
+            "createStore",
+            "reset",
+            "missing",
+            classes=["Store"],
+        ),
+        """/*The module.*/
+import { api } from "./api";
+
+
+/*
+Docs of Store.
+*/
+export class Store extends Base {
+
+  /*
+  Docs of constructor.
+  */
+  constructor(state) {
+    super();
+    this.state = state;
+  }
+
+  // Save the state.
+  save() {
+    return api.save(this.state);
+  }
+
+
+  /*
+  Docs of load.
+  */
+  load(id) {
+    return api.load(id);
+  }
+}
+
+
+/*
+Docs of createStore.
+*/
+export function createStore(state) {
+  return new Store(state);
+}
+
+
+/*
+Docs of reset.
+*/
+export default function reset() {
+  return null;
+}""",
+    ),
+    "ts": (
+        """/* Already documented file. */
+interface Options {
+  retries: number;
+}
+
+export const fetchAll = (urls: string[]) => {
+  return urls.map((url) => fetch(url));
+};
+
+const retry = async (options: Options) => {
+  return options.retries;
+};
+
+/**
+ * Already documented.
+ */
+export function parse(text: string): Options {
+  return JSON.parse(text);
+}
+""",
+        _documentation("fetchAll", "retry", "parse"),
+        """/* Already documented file. */
+interface Options {
+  retries: number;
+}
+
+
+/*
+Docs of fetchAll.
+*/
+export const fetchAll = (urls: string[]) => {
+  return urls.map((url) => fetch(url));
+};
+
+const retry = async (options: Options) => {
+  return options.retries;
+};
+
+/**
+ * Already documented.
+ */
+export function parse(text: string): Options {
+  return JSON.parse(text);
+}""",
+    ),
+    "tsx": (
+        """import React from "react";
+
+const Button = ({ label, onClick }: Props) => {
+  return <button onClick={onClick}>{label}</button>;
+};
+
+export const App = () => {
+  const handleClick = () => {
+    alert("clicked");
+  };
+  return <Button label="Go" onClick={handleClick} />;
+};
+
+export default App;
+""",
+        _documentation("Button", "App", "handleClick"),
+        """/*The module.*/
+import React from "react";
+
+
+/*
+Docs of Button.
+*/
+const Button = ({ label, onClick }: Props) => {
+  return <button onClick={onClick}>{label}</button>;
+};
+
+
+/*
+Docs of App.
+*/
+export const App = () => {
+
+  /*
+  Docs of handleClick.
+  */
+  const handleClick = () => {
+    alert("clicked");
+  };
+  return <Button label="Go" onClick={handleClick} />;
+};
+
+export default App;""",
+    ),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_document(case):
+    code, documentation, expected = CASES[case]
+    assert JavascriptAggregator().document(documentation, code) == expected
+
+
+def test_document_declarations_in_inserted_docstrings():
+    # A docstring inserted before in the same pass counts as a line of the
+    # code, so it can be matched by the declaration pattern of a later name.
+    code = """function reset() {
+  return null;
+}
+
+function createStore(state) {
+  return reset(state);
+}
+"""
+    documentation = {
+        "file_docstring": "Stores.",
+        "classes": [],
+        "methods": [
+            {
+                "method_name": "createStore",
+                "method_docstring": "Unlike function reset(), build a store.",
+            },
+            {"method_name": "reset", "method_docstring": "Reset it."},
+            # Not a plain name, so it is searched with its own pattern.
+            {"method_name": "re.et", "method_docstring": "Never found."},
+        ],
+    }
+
+    documented = JavascriptAggregator().document(documentation, code)
+
+    assert documented == (
+        "/*Stores.*/\n"
+        "function reset() {\n"
+        "  return null;\n"
+        "}\n\n\n"
+        "/*\nReset it.\n*/\n\n"
+        "/*\nUnlike function reset(), build a store.\n*/\n"
+        "function createStore(state) {\n"
+        "  return reset(state);\n"
+        "}"
+    )
@@ -0,0 +1,155 @@
+import json
+import threading
+
+import pytest
+
+from devtale.ledger import RunLedger, percentile
+from devtale.profiling import annotate
+
+
+def test_record_attribution(tmp_path):
+    path = tmp_path / "ledger.jsonl"
+    ledger = RunLedger(str(path))
+
+    ledger.record("top-level", "gpt-3.5-turbo", prompt_tokens=10)
+    with annotate(folder="src"):
+        with annotate(file="src/a.py"):
+            with annotate(chunk=2):
+                ledger.record("code", "gpt-4", prompt_tokens=20)
+        ledger.record("folder-level", "gpt-3.5-turbo")
+
+    # Another thread does not see the annotations of this one.
+    with annotate(file="src/b.py"):
+        thread = threading.Thread(target=ledger.record, args=("code", "gpt-4"))
+        thread.start()
+        thread.join()
+    ledger.close()
+
+    attributions = [
+        (record["file"], record["folder"], record["chunk"]) for record in ledger.records
+    ]
+    assert attributions == [
+        (None, None, None),
+        ("src/a.py", "src", 2),
+        (None, "src", None),
+        (None, None, None),
+    ]
+    lines = path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == ledger.records
+
+
+def test_saved_calls():
+    ledger = RunLedger()
+    for file_path, cache in [
+        ("a.py", "miss"),
+        ("a.py", "miss"),
+        ("a.py", "hit"),
+        ("b.py", "miss"),
+        ("c.py", "miss"),
+    ]:
+        with annotate(file=file_path):
+            ledger.record("code", "gpt-4", cache=cache)
+    ledger.record_reuse("b.py", "a.py", exact=False)
+    ledger.record_reuse("d.py", "a.py", exact=True)
+    # A copy that made more calls than its reference saves none.
+    ledger.record_reuse("c.py", "e.py", exact=False)
+
+    assert ledger.saved_calls() == 1 + 2
+
+
+@pytest.mark.parametrize(
+    "values, quantile, expected",
+    [
+        ([], 0.5, 0.0),
+        ([3.0], 0.95, 3.0),
+        ([4.0, 1.0, 3.0, 2.0], 0.5, 2.0),
+        ([4.0, 1.0, 3.0, 2.0], 0.95, 4.0),
+        (list(range(1, 101)), 0.95, 95),
+    ],
+)
+def test_percentile(values, quantile, expected):
+    assert percentile(values, quantile) == expected
+
+
+def test_write_metrics(tmp_path):
+    ledger = RunLedger()
+    ledger.record(
+        "code",
+        "gpt-4",
+        prompt_tokens=100,
+        completion_tokens=20,
+        cost=0.5,
+        latency=2.0,
+        retries=1,
+    )
+    ledger.record("code", "gpt-4", prompt_tokens=100, latency=4.0)
+    ledger.record("code", "gpt-4", prompt_tokens=100, cache="hit", latency=0.0)
+    ledger.record('say "hi"', "gpt-4", error="Timeout")
+    ledger.record_reuse("b.py", "a.py", exact=True)
+    path = tmp_path / "metrics.txt"
+
+    ledger.write_metrics(str(path))
+
+    lines = path.read_text().splitlines()
+    assert lines[-1] == "# EOF"
+    samples = dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+    def sample(name, **labels):
+        values = ",".join(f'{label}="{value}"' for label, value in labels.items())
+        return samples[name + "{" + values + "}"]
+
+    code = {"model": "gpt-4", "template": "code"}
+    assert sample("devtale_llm_calls_total", **code, cache="miss", status="ok") == "2"
+    assert sample("devtale_llm_calls_total", **code, cache="hit", status="ok") == "1"
+    assert (
+        sample(
+            "devtale_llm_calls_total",
+            model="gpt-4",
+            template='say \\"hi\\"',
+            cache="miss",
+            status="error",
+        )
+        == "1"
+    )
+    assert sample("devtale_llm_tokens_total", **code, kind="prompt") == "300"
+    assert sample("devtale_llm_retries_total", **code) == "1"
+    # The latency only counts the answered calls.
+    assert (
+        sample("devtale_llm_latency_seconds", model="gpt-4", quantile="0.5")
+        == "2.000000"
+    )
+    assert sample("devtale_llm_latency_seconds_count", model="gpt-4") == "2"
+    assert sample("devtale_duplicate_files_total", kind="exact") == "1"
+    # Every sample belongs to a declared metric family.
+    families = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    for name in samples:
+        assert any(name.startswith(family) for family in families)
+
+
+def test_summary():
+    ledger = RunLedger()
+    with annotate(file="a.py"):
+        ledger.record("code", "gpt-4", prompt_tokens=100, cost=1.0, latency=1.0)
+    ledger.record("root-level", "gpt-3.5-turbo", prompt_tokens=10)
+    ledger.record_reuse("b.py", "a.py", exact=True)
+
+    summary = ledger.summary()
+
+    assert summary.splitlines()[0].split() == [
+        "model",
+        "calls",
+        "cached",
+        "retries",
+        "errors",
+        "tokens",
+        "cost",
+        "$",
+        "p50",
+        "s",
+        "p95",
+        "s",
+    ]
+    assert "a.py" in summary and "(repository)" in summary
+    assert summary.endswith(
+        "1 copies and 0 near copies reused the tale of another file, saving 1 calls."
+    )
@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+
+from devtale import cli
+from devtale.cli import process_repository
+from devtale.manifest import RunManifest
+
+
+def _write(path, content, mtime_ns=None):
+    path.write_text(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_is_unchanged(tmp_path):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    output = str(tmp_path / "output")
+    for name in ["same.py", "touched.py", "edited.py", "resized.py"]:
+        _write(repository / name, "x = 1\n", 10**18)
+    paths = {path.name: str(path) for path in repository.iterdir()}
+    RunManifest(str(repository), output).save(paths.values())
+
+    _write(repository / "touched.py", "x = 1\n", 2 * 10**18)
+    _write(repository / "edited.py", "x = 2\n", 10**18)
+    _write(repository / "resized.py", "x = 10\n", 10**18)
+    _write(repository / "new.py", "y = 1\n")
+    paths["new.py"] = str(repository / "new.py")
+
+    manifest = RunManifest(str(repository), output)
+
+    # A file with the same size and mtime is not read again, so the edit
+    # that kept both goes unnoticed.
+    assert {name for name, path in paths.items() if manifest.is_unchanged(path)} == {
+        "same.py",
+        "touched.py",
+        "edited.py",
+    }
+    assert manifest.unchanged_digest(paths["same.py"]) is not None
+    assert manifest.unchanged_digest(paths["touched.py"]) is None
+
+
+def test_remove_deleted_tales(tmp_path):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    output = tmp_path / "output"
+    output.mkdir()
+    for name in ["kept.py", "deleted.py"]:
+        (repository / name).write_text("x = 1\n")
+        (output / name).write_text("x = 1\n")
+        (output / f"{name}.json").write_text("{}")
+    paths = [str(repository / "kept.py"), str(repository / "deleted.py")]
+    RunManifest(str(repository), str(output)).save(paths)
+    (repository / "deleted.py").unlink()
+
+    RunManifest(str(repository), str(output)).remove_deleted_tales(paths[:1])
+
+    assert sorted(os.listdir(output)) == [
+        ".devtale_manifest.json",
+        "kept.py",
+        "kept.py.json",
+    ]
+
+
+def test_since_git_reference(tmp_path):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    for name in ["same.py", "edited.py", "deleted.py"]:
+        (tmp_path / name).write_text("x = 1\n")
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-qm", "init")
+    (tmp_path / "edited.py").write_text("x = 2\n")
+    (tmp_path / "deleted.py").unlink()
+    (tmp_path / "new.py").write_text("y = 1\n")
+
+    manifest = RunManifest(str(tmp_path), str(tmp_path / "output"), since="HEAD")
+
+    assert manifest.is_unchanged(str(tmp_path / "same.py"))
+    assert not manifest.is_unchanged(str(tmp_path / "edited.py"))
+    assert not manifest.is_unchanged(str(tmp_path / "new.py"))
+    assert manifest.deleted_files == {"deleted.py"}
+
+
+def test_incremental_run_documents_changed_files_only(tmp_path, fake_llm):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    output = str(tmp_path / "output")
+    (repository / "a.py").write_text("def first(x):\n    return x + 1\n")
+    (repository / "b.py").write_text("def second(y):\n    return y * 2\n")
+    process_repository(str(repository), output, incremental=True, dedup=False)
+    assert {record["file"] for record in fake_llm.records} >= {
+        str(repository / "a.py"),
+        str(repository / "b.py"),
+    }
+    assert os.path.exists(os.path.join(output, "a.py.json"))
+
+    fake_llm.records.clear()
+    (repository / "b.py").write_text("def second(y):\n    return y * 3\n")
+    os.remove(repository / "a.py")
+    process_repository(str(repository), output, incremental=True, dedup=False)
+
+    files = {record["file"] for record in fake_llm.records}
+    assert str(repository / "b.py") in files
+    assert str(repository / "a.py") not in files
+    assert not os.path.exists(os.path.join(output, "a.py.json"))
+    assert os.path.exists(os.path.join(output, "b.py.json"))
+
+
+def test_failed_file_is_documented_again(tmp_path, fake_llm, monkeypatch):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    output = str(tmp_path / "output")
+    (repository / "a.py").write_text("def first(x):\n    return x + 1\n")
+    process_repository(str(repository), output, incremental=True, dedup=False)
+
+    (repository / "a.py").write_text("def renamed(x):\n    return x + 2\n")
+
+    def failing_process_file(*args, **kwargs):
+        raise RuntimeError("GPT is down")
+
+    monkeypatch.setattr(cli, "process_file", failing_process_file)
+    process_repository(str(repository), output, incremental=True, dedup=False)
+    monkeypatch.undo()
+
+    fake_llm.records.clear()
+    process_repository(str(repository), output, incremental=True, dedup=False)
+
+    assert str(repository / "a.py") in {record["file"] for record in fake_llm.records}
+    with open(os.path.join(output, "a.py.json")) as file:
+        assert [method["method_name"] for method in json.load(file)["methods"]] == [
+            "renamed"
+        ]
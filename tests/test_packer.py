@@ -0,0 +1,85 @@
+from devtale import backends
+from devtale.cli import process_repository
+from devtale.packer import PackedItem, pack_items, split_answer
+
+MANIFEST = """apiVersion: v1
+kind: Service
+metadata:
+  name: web
+spec:
+  selector:
+    app: web
+  ports:
+    - port: 80
+      targetPort: 8080
+      name: http-{index}
+"""
+
+
+def _item(item_id, tokens=10):
+    return PackedItem(item_id, f"/repo/{item_id}", "content", tokens)
+
+
+def test_pack_items_respects_budget_and_count():
+    items = [_item(f"f{index}.yaml", tokens=40) for index in range(10)]
+    packs = pack_items(items, budget=100, max_items=3)
+    assert [len(pack) for pack in packs] == [2, 2, 2, 2, 2]
+    packs = pack_items(items, budget=1000, max_items=3)
+    assert [len(pack) for pack in packs] == [3, 3, 3, 1]
+    # An item over the budget gets a pack of its own.
+    assert pack_items([_item("big", tokens=500), _item("small")], budget=100) == [
+        [_item("big", tokens=500)],
+        [_item("small")],
+    ]
+
+
+def test_split_answer():
+    pack = [_item("a.yaml"), _item("b.yaml")]
+    assert split_answer('Sure: {"a.yaml": " A ", "c.yaml": "C"}', pack) == {
+        "a.yaml": "A"
+    }
+    assert split_answer("not json", pack) == {}
+    assert split_answer('["a.yaml"]', pack) == {}
+    assert split_answer('{"a.yaml": 1, "b.yaml": ""}', pack) == {}
+
+
+def _write_manifests(root, count):
+    for index in range(count):
+        (root / f"service_{index}.yaml").write_text(MANIFEST.format(index=index))
+
+
+def _templates(ledger):
+    return [record["template"] for record in ledger.records]
+
+
+def test_near_copies_of_config_files_are_packed(tmp_path, fake_llm):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    _write_manifests(repository, 20)
+
+    process_repository(str(repository), str(tmp_path / "output"))
+
+    templates = _templates(fake_llm)
+    assert templates.count("no-code-files") == 1
+    assert "no-code-file" not in templates
+    assert not fake_llm.reuses
+
+
+def test_malformed_pack_answer_falls_back_to_single_calls(
+    tmp_path, fake_llm, monkeypatch
+):
+    repository = tmp_path / "repository"
+    repository.mkdir()
+    _write_manifests(repository, 3)
+    fake_answer = backends.fake_answer
+    monkeypatch.setattr(
+        backends,
+        "fake_answer",
+        lambda prompt: "oops" if "maps the ID" in prompt else fake_answer(prompt),
+    )
+
+    process_repository(str(repository), str(tmp_path / "output"))
+
+    templates = _templates(fake_llm)
+    assert templates.count("no-code-files") == 1
+    assert templates.count("no-code-file") == 3
@@ -0,0 +1,96 @@
+from devtale.aggregators.php import PHPAggregator
+
+CODE = """<?php
+class Greeter
+{
+    /**
+     * Already documented.
+     */
+    public function hello($name)
+    {
+        return "Hello " . $name;
+    }
+
+    public function create()
+    {
+        return new Greeter();
+    }
+
+    private function bye()
+    {
+        return "Bye";
+    }
+}
+"""
+
+
+def _documentation(*methods):
+    return {
+        "file_docstring": "Greets people.",
+        "classes": [{"class_name": "Greeter", "class_docstring": "A greeter."}],
+        "methods": [
+            {"method_name": name, "method_docstring": docstring}
+            for name, docstring in methods
+        ],
+    }
+
+
+def _docstring_before(code, declaration):
+    """Return the lines of the docstring right before the declaration."""
+    lines = code[: code.index(declaration)].rstrip().split("\n")
+    assert lines[-1].strip() == "*/"
+    start = max(index for index, line in enumerate(lines) if line.strip() == "/**")
+    return [line.strip() for line in lines[start + 1 : -1] if line.strip() != "*"]
+
+
+def test_document_skips_documented_and_unknown_functions():
+    documentation = _documentation(
+        ("hello", "Say hello."),
+        ("create", "Create a greeter."),
+        ("bye", "Say bye."),
+        ("bye", "Say bye again."),
+        ("missing", "Not in the code."),
+    )
+
+    documented = PHPAggregator().document(documentation, CODE)
+
+    assert documented.startswith("\n/**\n * Greets people.\n */\n\n<?php")
+    assert _docstring_before(documented, "class Greeter") == ["* A greeter."]
+    assert _docstring_before(documented, "public function hello") == [
+        "* Already documented."
+    ]
+    assert _docstring_before(documented, "public function create") == [
+        "* Create a greeter."
+    ]
+    # Only the first docstring of a function is kept.
+    assert _docstring_before(documented, "private function bye") == ["* Say bye."]
+    assert "Say bye again." not in documented
+    assert "Not in the code." not in documented
+
+
+def test_document_ignores_declarations_in_inserted_docstrings():
+    documentation = _documentation(
+        ("create", "Unlike function bye, create a greeter."),
+        ("bye", "Say bye."),
+    )
+
+    documented = PHPAggregator().document(documentation, CODE)
+
+    assert _docstring_before(documented, "private function bye") == ["* Say bye."]
+
+
+def test_document_many_functions_in_order():
+    code = "<?php\n" + "".join(
+        f"function step_{index}()\n{{\n    return {index};\n}}\n\n"
+        for index in range(300)
+    )
+    documentation = _documentation(
+        *((f"step_{index}", f"Step {index}.") for index in reversed(range(300)))
+    )
+
+    documented = PHPAggregator().document(documentation, code)
+
+    for index in (0, 1, 10, 299):
+        assert _docstring_before(documented, f"function step_{index}()\n") == [
+            f"* Step {index}."
+        ]
@@ -0,0 +1,89 @@
+import json
+import threading
+
+from devtale.profiling import (
+    annotate,
+    disable_profiling,
+    enable_profiling,
+    record_call,
+    span,
+)
+
+
+def _run_pipeline():
+    with annotate(file="a.py"):
+        with span("split"):
+            pass
+        with span("tale", chunk=0):
+            record_call(100, start=None)
+            with span("parse"):
+                pass
+            record_call(50, start=None)
+    with span("tale"):
+        pass
+
+
+def test_stage_aggregation():
+    profiler = enable_profiling()
+    try:
+        _run_pipeline()
+        with span("custom"):
+            record_call(10)
+    finally:
+        assert disable_profiling() is profiler
+    # Without a profiler, spans and calls are ignored.
+    with span("tale"):
+        record_call(1000)
+
+    report = profiler.report()
+
+    # The known stages come first, in the order of the pipeline.
+    assert list(report) == ["split", "tale", "parse", "custom"]
+    assert report["tale"]["count"] == 2
+    assert (report["tale"]["calls"], report["tale"]["tokens"]) == (2, 150)
+    # A call only counts in the innermost span.
+    assert report["parse"]["calls"] == 0
+    assert report["tale"]["seconds"] >= report["parse"]["seconds"]
+
+
+def test_write_trace(tmp_path):
+    profiler = enable_profiling(memory=True, trace=True)
+    try:
+        _run_pipeline()
+        worker = threading.Thread(target=_run_pipeline, name="worker")
+        worker.start()
+        worker.join()
+        with span("summarize"):
+            record_call(5, start=profiler._start, end=profiler._start + 0.5)
+    finally:
+        disable_profiling()
+    path = tmp_path / "trace.json"
+
+    profiler.write_trace(str(path))
+
+    trace = json.loads(path.read_text())
+    assert trace["displayTimeUnit"] == "ms"
+    assert trace["otherData"]["stages"]["tale"]["count"] == 4
+    events = trace["traceEvents"]
+    threads = {
+        event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"
+    }
+    assert sorted(threads.values()) == ["MainThread", "worker"]
+    spans = [event for event in events if event["ph"] == "X"]
+    for event in spans:
+        assert event["tid"] in threads
+        assert event["ts"] >= 0 and event["dur"] >= 0
+        assert isinstance(event["pid"], int)
+    assert any(event["ph"] == "C" for event in events)
+
+    main = [event for event in spans if threads[event["tid"]] == "MainThread"]
+    parse, tale = [event for event in main if event["name"] in ("tale", "parse")][:2]
+    # Spans are written when they end, so the nested one comes first.
+    assert (parse["name"], tale["name"]) == ("parse", "tale")
+    assert tale["ts"] <= parse["ts"]
+    assert parse["ts"] + parse["dur"] <= tale["ts"] + tale["dur"]
+    assert tale["args"] == {"file": "a.py", "chunk": 0, "calls": 2, "tokens": 150}
+    assert parse["args"] == {"file": "a.py"}
+    (llm,) = [event for event in spans if event["cat"] == "llm"]
+    assert llm["ts"] == 0 and llm["dur"] == 0.5e6
+    assert llm["args"] == {"tokens": 5}
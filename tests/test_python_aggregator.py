@@ -0,0 +1,67 @@
+import ast
+
+import pytest
+
+from devtale.aggregators.python import PythonAggregator
+
+DOCUMENTATION = {
+    "file_docstring": "Helpers.",
+    "classes": [{"class_name": "Shape", "class_docstring": "A shape."}],
+    "methods": [
+        {"method_name": "area", "method_docstring": "Return the area."},
+        {"method_name": "scale", "method_docstring": "Scale the shape."},
+    ],
+}
+
+
+def _docstrings(code):
+    return {
+        node.name: ast.get_docstring(node)
+        for node in ast.walk(ast.parse(code))
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef))
+    }
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_document_with_form_feed_and_newlines(newline):
+    # The form feed is a line break for str.splitlines but not for ast, so
+    # it must not shift the docstrings of the definitions after it.
+    code = newline.join(
+        [
+            "import math",
+            "\x0c",
+            "class Shape:",
+            "    def area(self):",
+            "        return math.pi",
+            "\x0c",
+            "    def scale(self, factor): return factor",
+            "",
+        ]
+    )
+    documented = PythonAggregator().document(DOCUMENTATION, code)
+    assert _docstrings(documented) == {
+        "Shape": "A shape.",
+        "area": "Return the area.",
+        "scale": "Scale the shape.",
+    }
+    assert "\x0c" + newline + "class Shape:" in documented
+
+
+def test_document_before_decorated_first_member():
+    code = (
+        "class Shape:\n"
+        "    @property\n"
+        "    def area(self):\n"
+        "        return 1\n"
+        "\n"
+        "    @staticmethod\n"
+        "    @cache\n"
+        "    async def scale(factor):\n"
+        "        @wraps(factor)\n"
+        "        class Inner:\n"
+        "            pass\n"
+    )
+    documented = PythonAggregator().document(DOCUMENTATION, code)
+    assert _docstrings(documented)["Shape"] == "A shape."
+    assert '    """A shape."""\n    @property\n' in documented
+    assert '        """Scale the shape."""\n        @wraps' in documented
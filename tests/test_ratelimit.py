@@ -0,0 +1,138 @@
+import time
+
+import click
+import openai
+import pytest
+
+from devtale import ratelimit
+from devtale.cli import _parse_rate_limits
+from devtale.constants import MAX_RETRIES, RATE_LIMITS
+from devtale.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    configure_rate_limits,
+    get_rate_limiter,
+)
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Retry the calls right away."""
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: 0)
+
+
+def _failing(errors, result="answer", used_tokens=100):
+    """Return a call that raises the errors in order, then succeeds."""
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(None)
+        if errors:
+            raise errors.pop(0)
+        return result, used_tokens
+
+    return func, calls
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=100, per_second=1000)
+    bucket.acquire(100)
+    assert bucket.level < 1
+
+    start = time.monotonic()
+    bucket.acquire(50)
+    # 50 units at 1000 per second.
+    assert time.monotonic() - start >= 0.04
+
+
+def test_token_bucket_settle_and_drain():
+    bucket = TokenBucket(capacity=100, per_second=0.001)
+    bucket.acquire(60)
+    bucket.settle(-30)
+    assert 69 < bucket.level < 71
+    # A refund never overflows the bucket.
+    bucket.settle(-1000)
+    assert bucket.level == 100
+    # The usage above the reservation leaves the bucket in debt.
+    bucket.settle(150)
+    assert bucket.level < -49
+    bucket.settle(-200)
+    bucket.drain()
+    assert bucket.level <= 0
+
+
+def test_call_settles_real_usage():
+    limiter = RateLimiter(tokens_per_minute=60000)
+    capacity = limiter.tokens.capacity
+
+    assert limiter.call(lambda: ("answer", 300), prompt_tokens=200) == "answer"
+
+    assert capacity - 301 < limiter.tokens.level <= capacity - 299
+
+
+def test_call_retries_rate_limited_calls(no_backoff):
+    limiter = RateLimiter(tokens_per_minute=60000, requests_per_minute=1000)
+    func, calls = _failing(
+        [
+            openai.error.RateLimitError("slow down"),
+            openai.error.APIConnectionError("connection reset"),
+        ]
+    )
+
+    assert limiter.call(func, prompt_tokens=10) == "answer"
+    assert len(calls) == 3
+    # The rate limited call halved the calls in flight.
+    assert limiter.concurrency.limit < 4
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_call_gives_up_after_max_retries(no_backoff):
+    limiter = RateLimiter()
+    func, calls = _failing(
+        [openai.error.RateLimitError("slow down")] * (MAX_RETRIES + 1)
+    )
+
+    with pytest.raises(openai.error.RateLimitError):
+        limiter.call(func, prompt_tokens=10)
+    assert len(calls) == MAX_RETRIES + 1
+
+
+@pytest.mark.parametrize(
+    "error",
+    [ValueError("bad answer"), openai.error.APIConnectionError("connection reset")],
+)
+def test_failed_call_refunds_its_tokens(error, monkeypatch, no_backoff):
+    monkeypatch.setattr(ratelimit, "MAX_RETRIES", 0)
+    limiter = RateLimiter(tokens_per_minute=60000)
+    capacity = limiter.tokens.capacity
+    func, _ = _failing([error])
+
+    with pytest.raises(type(error)):
+        limiter.call(func, prompt_tokens=2000)
+
+    assert limiter.tokens.level > capacity - 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_configure_rate_limits():
+    configure_rate_limits({"custom-model": (1200, 60)})
+    try:
+        limiter = get_rate_limiter("custom-model")
+        assert get_rate_limiter("custom-model") is limiter
+        assert limiter.tokens.capacity == pytest.approx(1200 * 0.95)
+        assert limiter.requests.capacity == pytest.approx(60 * 0.95)
+        assert get_rate_limiter("unknown-model").tokens is None
+        default_model = next(iter(RATE_LIMITS))
+        assert get_rate_limiter(default_model).tokens is not None
+    finally:
+        configure_rate_limits()
+
+
+def test_parse_rate_limits():
+    assert _parse_rate_limits(
+        ["gpt-4-1106-preview=300000:5000", " gpt-3.5-turbo =1:2"]
+    ) == {"gpt-4-1106-preview": (300000, 5000), "gpt-3.5-turbo": (1, 2)}
+    for value in ["gpt-4", "gpt-4=1000", "gpt-4=a:b"]:
+        with pytest.raises(click.BadParameter):
+            _parse_rate_limits([value])
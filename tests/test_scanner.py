@@ -0,0 +1,160 @@
+import pytest
+
+from devtale.extractors import extract_local_code_elements
+from devtale.scanner import scan_declarations
+
+GO = """package main
+
+// func Commented() {}
+var text = "func Quoted() {"
+
+type Server struct {
+\tport int
+}
+
+type Handler interface {
+\tServe()
+}
+
+func (s *Server) Start(port int) error {
+\treturn nil
+}
+
+func Map[T any](items []T) []T {
+\treturn items
+}
+"""
+
+JAVASCRIPT = """/* function commented() {} */
+const text = `function quoted() {`;
+
+export async function load(url) {
+  return fetch(url);
+}
+
+const Button = ({ label }) => {
+  return label;
+};
+
+const double = (x) => x * 2
+const parse = (text) => (
+  JSON.parse(text)
+);
+
+class Store extends Base {
+  constructor(state) {
+    super();
+    if (state) {
+      this.state = state;
+    }
+  }
+
+  async save() {
+    return this.state;
+  }
+}
+"""
+
+PHP = """<?php
+# function commented() {}
+$text = "function quoted() {";
+
+interface Shape
+{
+    public function area();
+}
+
+final class Square implements Shape
+{
+    public function area()
+    {
+        return $this->side ** 2;
+    }
+
+    public static function &unit()
+    {
+        return new static();
+    }
+}
+
+function helper($x)
+{
+    return Square::class;
+}
+"""
+
+
+def _declarations(code, file_ext):
+    return [
+        (declaration.kind, declaration.name, code[declaration.start : declaration.end])
+        for declaration in scan_declarations(code, file_ext)
+    ]
+
+
+def test_scan_go():
+    assert _declarations(GO, ".go") == [
+        ("struct", "Server", "type Server struct {\n\tport int\n}"),
+        ("interface", "Handler", "type Handler interface {\n\tServe()\n}"),
+        (
+            "method",
+            "Start",
+            "func (s *Server) Start(port int) error {\n\treturn nil\n}",
+        ),
+        ("function", "Map", "func Map[T any](items []T) []T {\n\treturn items\n}"),
+    ]
+
+
+def test_scan_javascript():
+    declarations = _declarations(JAVASCRIPT, ".js")
+
+    assert [(kind, name) for kind, name, _ in declarations] == [
+        ("function", "load"),
+        ("function", "Button"),
+        ("function", "double"),
+        ("function", "parse"),
+        ("class", "Store"),
+        ("method", "constructor"),
+        ("method", "save"),
+    ]
+    texts = {name: text for _, name, text in declarations}
+    assert texts["load"] == "async function load(url) {\n  return fetch(url);\n}"
+    assert texts["double"] == "const double = (x) => x * 2"
+    assert texts["parse"].endswith("JSON.parse(text)\n)")
+    assert texts["Store"].endswith("return this.state;\n  }\n}")
+    assert texts["constructor"].endswith("this.state = state;\n    }\n  }")
+
+
+def test_scan_php():
+    declarations = _declarations(PHP, ".php")
+
+    assert [(kind, name) for kind, name, _ in declarations] == [
+        ("interface", "Shape"),
+        ("method", "area"),
+        ("class", "Square"),
+        ("method", "area"),
+        ("method", "unit"),
+        ("function", "helper"),
+    ]
+    # An abstract method ends with its semicolon.
+    assert declarations[1][2] == "function area();"
+    assert declarations[5][2].endswith("return Square::class;\n}")
+
+
+@pytest.mark.parametrize(
+    "code, file_ext, expected",
+    [
+        (GO, ".go", {"classes": ["Server", "Handler"], "methods": ["Start", "Map"]}),
+        (
+            PHP,
+            ".php",
+            {"classes": ["Shape", "Square"], "methods": ["area", "unit", "helper"]},
+        ),
+    ],
+)
+def test_extract_local_code_elements(code, file_ext, expected):
+    assert extract_local_code_elements(code, file_ext) == {**expected, "summary": []}
+
+
+def test_scan_unbalanced_code_ends_at_the_end():
+    code = "function broken() {\n  if (x) {\n"
+    assert scan_declarations(code, ".js")[0].end == len(code)
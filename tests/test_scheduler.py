@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from devtale.scheduler import TaskScheduler
+
+
+def _recorder(order, name):
+    def func(*dependency_results):
+        order.append(name)
+        return name
+
+    return func
+
+
+def test_dependencies_run_first():
+    order = []
+    scheduler = TaskScheduler(workers=4)
+    for name in ["a", "b", "c"]:
+        scheduler.add_task(f"file:{name}", _recorder(order, name))
+    scheduler.add_task(
+        "folder", _recorder(order, "folder"), dependencies=["file:a", "file:b"]
+    )
+    scheduler.add_task(
+        "root", _recorder(order, "root"), dependencies=["folder", "file:c"]
+    )
+
+    scheduler.run()
+
+    assert order.index("folder") > max(order.index("a"), order.index("b"))
+    assert order[-1] == "root"
+
+
+def test_priority_dispatch():
+    order = []
+    scheduler = TaskScheduler(workers=1)
+    scheduler.add_task("small", _recorder(order, "small"), priority=10)
+    scheduler.add_task("large", _recorder(order, "large"), priority=1000)
+    scheduler.add_task("medium", _recorder(order, "medium"), priority=100)
+    scheduler.add_task("tie", _recorder(order, "tie"), priority=100)
+    scheduler.add_task(
+        "folder",
+        _recorder(order, "folder"),
+        dependencies=["large"],
+        priority=float("inf"),
+    )
+
+    scheduler.run()
+
+    # Largest first, ties in insertion order, and the folder as soon as its
+    # file is done, before the other files.
+    assert order == ["large", "folder", "medium", "tie", "small"]
+
+
+def test_dependency_results_are_passed_in_order():
+    scheduler = TaskScheduler(workers=2)
+    scheduler.add_task("a", lambda: 1)
+    scheduler.add_task("b", lambda: 2)
+    total = scheduler.add_task("total", lambda b, a: (b, a), dependencies=["b", "a"])
+
+    results = scheduler.run()
+
+    assert results == {"a": 1, "b": 2, "total": (2, 1)}
+    assert total.result == (2, 1)
+
+
+def test_failing_task_does_not_stop_its_dependents():
+    def fail():
+        raise RuntimeError("GPT is down")
+
+    scheduler = TaskScheduler(workers=2)
+    scheduler.add_task("failing", fail)
+    scheduler.add_task("other", lambda: "ok")
+    scheduler.add_task(
+        "folder", lambda *results: results, dependencies=["failing", "other"]
+    )
+
+    results = scheduler.run()
+
+    assert results == {"failing": None, "other": "ok", "folder": (None, "ok")}
+
+
+def test_workers_run_tasks_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    scheduler = TaskScheduler(workers=3)
+    for name in ["a", "b", "c"]:
+        scheduler.add_task(name, barrier.wait)
+
+    # The barrier only opens if the three tasks run at the same time.
+    results = scheduler.run()
+
+    assert sorted(results.values()) == [0, 1, 2]
+
+
+def test_critical_path():
+    scheduler = TaskScheduler(workers=2)
+    scheduler.add_task("fast", lambda: None)
+    scheduler.add_task("slow", lambda: time.sleep(0.05))
+    scheduler.add_task("root", lambda *_: None, dependencies=["fast", "slow"])
+
+    scheduler.run()
+
+    assert [name for name, _ in scheduler.critical_path()] == ["slow", "root"]
+    assert scheduler.critical_path()[0][1] >= 0.05
+
+
+def test_invalid_tasks():
+    scheduler = TaskScheduler()
+    scheduler.add_task("a", lambda: None)
+    with pytest.raises(ValueError):
+        scheduler.add_task("a", lambda: None)
+    with pytest.raises(ValueError):
+        scheduler.add_task("b", lambda: None, dependencies=["unknown"])
@@ -0,0 +1,71 @@
+import re
+
+import pytest
+
+from devtale.backends import Completion, configure_backend
+from devtale.constants import SUMMARY_ANSWER_TOKENS
+from devtale.utils import summarize_map_reduce
+
+DOCS = [f"part-{index} " + "lorem ipsum dolor sit amet " * 20 for index in range(60)]
+
+
+class StubbornBackend:
+    """Answer the partial summaries with their whole input, unless asked for
+    fewer words than the default, and the other prompts with their input.
+    """
+
+    name = "stubborn"
+
+    def __init__(self, ever_shorter=True):
+        self.ever_shorter = ever_shorter
+        self.prompts = []
+
+    def complete(self, model_name, prompt, verbose=False):
+        self.prompts.append(prompt)
+        information = prompt[prompt.index("<<< ") + 4 : prompt.rindex(" >>>")]
+        max_words = re.search(r"at most (\d+) words", prompt)
+        if max_words and int(max_words.group(1)) < SUMMARY_ANSWER_TOKENS * 3 // 4:
+            if self.ever_shorter:
+                information = " ".join(re.findall(r"part-\d+", information))
+        return Completion(information, 0, 0, 0)
+
+
+@pytest.fixture
+def stubborn_llm(fake_llm):
+    def configure(**kwargs):
+        backend = StubbornBackend(**kwargs)
+        configure_backend(backend)
+        return backend
+
+    return configure
+
+
+def test_map_reduce_keeps_every_chunk(stubborn_llm):
+    backend = stubborn_llm()
+
+    answer, _ = summarize_map_reduce("root-level", DOCS)
+
+    # Nothing is dropped: the final answer mentions every part.
+    assert set(re.findall(r"part-\d+", answer)) == {
+        f"part-{index}" for index in range(60)
+    }
+    partial_prompts = [prompt for prompt in backend.prompts if "at most" in prompt]
+    assert len(partial_prompts) > 1
+    assert len(backend.prompts) == len(partial_prompts) + 1
+
+
+def test_map_reduce_fails_if_summaries_never_shrink(stubborn_llm):
+    stubborn_llm(ever_shorter=False)
+
+    with pytest.raises(RuntimeError, match="do not get shorter"):
+        summarize_map_reduce("root-level", DOCS)
+
+
+def test_map_reduce_single_summary_is_the_answer(stubborn_llm):
+    backend = stubborn_llm()
+
+    assert summarize_map_reduce("top-level", ["The only summary."]) == (
+        "The only summary.",
+        0,
+    )
+    assert backend.prompts == []
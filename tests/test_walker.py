@@ -0,0 +1,117 @@
+import os
+
+from devtale.walker import group_by_folder, walk_repository
+
+
+def _write(root, relative_path, content="x"):
+    path = root / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _relative(root, entries):
+    return [os.path.relpath(entry.path, root) for entry in entries]
+
+
+def test_walk_renders_tree_and_entries(tmp_path):
+    for relative_path in ["b.py", "a/x.go", "a/y/z.js", "c.yaml", "Makefile"]:
+        _write(tmp_path, relative_path)
+    _write(tmp_path, ".hidden/h.py")
+
+    tree, entries = walk_repository(str(tmp_path))
+
+    assert tree == (
+        "└── Makefile\n"
+        "├── a\n"
+        "│   └── x.go\n"
+        "│   ├── y\n"
+        "│   │   └── z.js\n"
+        "└── b.py\n"
+        "└── c.yaml\n"
+    )
+    assert _relative(tmp_path, entries) == [
+        "Makefile",
+        "a/x.go",
+        "a/y/z.js",
+        "b.py",
+        "c.yaml",
+    ]
+    languages = {os.path.basename(entry.path): entry.language for entry in entries}
+    assert languages == {
+        "Makefile": "no-code",
+        "x.go": "go",
+        "z.js": "js",
+        "b.py": "python",
+        "c.yaml": "no-code",
+    }
+    assert entries[0].folder == str(tmp_path)
+    assert entries[0].size == 1
+
+
+def test_walk_applies_nested_ignore_files(tmp_path):
+    for relative_path in [
+        "dist/d.py",
+        "src/dist/d.py",
+        "build/b.py",
+        "src/build",
+        "a/b/c/z.py",
+        "x/a/b/c/z.py",
+        "logs/keep.log",
+        "logs/other.log",
+        "sub/t1.py",
+        "sub/tx.py",
+        "sub/x.py",
+        "sub/deep/x.py",
+    ]:
+        _write(tmp_path, relative_path)
+    _write(tmp_path, ".gitignore", "*.log\n/dist\nbuild/\na/b/c\n")
+    _write(tmp_path, "logs/.devtaleignore", "!keep.log\n")
+    _write(tmp_path, "sub/.devtaleignore", "/x.py\nt[0-9].py\n")
+
+    _, entries = walk_repository(str(tmp_path))
+
+    assert sorted(_relative(tmp_path, entries)) == [
+        "logs/keep.log",
+        "src/build",
+        "src/dist/d.py",
+        "sub/deep/x.py",
+        "sub/tx.py",
+        "x/a/b/c/z.py",
+    ]
+
+
+def test_walk_extra_patterns_and_not_recursive(tmp_path):
+    for relative_path in ["a.py", "b.md", "c/d.py"]:
+        _write(tmp_path, relative_path)
+
+    _, entries = walk_repository(str(tmp_path), extra_patterns=["*.md"])
+    assert _relative(tmp_path, entries) == ["a.py", "c/d.py"]
+
+    tree, entries = walk_repository(str(tmp_path), recursive=False)
+    assert tree == "└── a.py\n└── b.md\n├── c\n"
+    assert _relative(tmp_path, entries) == ["a.py", "b.md"]
+
+
+def test_walk_leaves_out_dangling_symlinks(tmp_path):
+    _write(tmp_path, "a.py")
+    os.symlink(tmp_path / "missing.py", tmp_path / "dangling.py")
+    os.symlink(tmp_path / "a.py", tmp_path / "link.py")
+
+    tree, entries = walk_repository(str(tmp_path))
+
+    assert tree == "└── a.py\n└── link.py\n"
+    assert [entry.size for entry in entries] == [1, 1]
+
+
+def test_group_by_folder(tmp_path):
+    for relative_path in ["a/b/c.py", "a/d.py", "a/e.txt", "f.go", "g/h.txt"]:
+        _write(tmp_path, relative_path)
+
+    _, entries = walk_repository(str(tmp_path))
+    folders = group_by_folder(entries)
+
+    assert {
+        os.path.relpath(folder, tmp_path): _relative(tmp_path, folder_entries)
+        for folder, folder_entries in folders.items()
+    } == {".": ["f.go"], "a": ["a/d.py"], "a/b": ["a/b/c.py"]}
+    assert list(folders)[0] == str(tmp_path)